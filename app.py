@@ -1,26 +1,146 @@
-from flask import Flask
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Flask, Response, abort, g, jsonify, request
+import hashlib
+import json
 import os
+import threading
+import time
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from metrics import DB_POOL_IN_USE, DB_POOL_SIZE, REQUEST_LATENCY, render
 
 app = Flask(__name__)
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+PREDICTION_MAX_AGE = int(os.environ.get("PREDICTION_MAX_AGE", 60))
+# Drop cached predictions on NOTIFY from the ingesters (see events.py)
+CACHE_LISTEN = os.environ.get("CACHE_LISTEN", "1") != "0"
+
+_pool = None
+_pool_lock = threading.Lock()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(1, DB_POOL_MAX, DATABASE_URL, sslmode="require")
+            DB_POOL_SIZE.set(DB_POOL_MAX)
+        return _pool
+
+
+@contextmanager
+def db_connection():
+    pool = get_pool()
+    conn = pool.getconn()
+    DB_POOL_IN_USE.inc()
+    try:
+        yield conn
+    finally:
+        # Read-only use: end the transaction before handing the connection back
+        conn.rollback()
+        pool.putconn(conn)
+        DB_POOL_IN_USE.dec()
+
+
+def start_cache_listener():
+    """
+    One LISTEN thread per worker process, started on the first request.
+    """
+    global _listener
+    if _listener is not None or not CACHE_LISTEN or not DATABASE_URL:
+        return
+    from events import listen
+    from serving import handle_event
+
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                target=listen,
+                args=(lambda: psycopg2.connect(DATABASE_URL, sslmode="require"), handle_event),
+                daemon=True,
+            )
+            _listener.start()
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    start_cache_listener()
+
+
+@app.after_request
+def record_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUEST_LATENCY.labels(route, request.method, response.status_code).observe(
+            time.perf_counter() - start
+        )
+    return response
 
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL, sslmode="require")
 
 @app.route("/")
 def home():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 'PostgreSQL connected!'")
-        msg = cur.fetchone()[0]
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 'PostgreSQL connected!'")
+            msg = cur.fetchone()[0]
+            cur.close()
         return msg
     except Exception as e:
         return f"Database error: {e}"
 
+
+@app.route("/predict/<int:game_id>")
+def predict(game_id):
+    from serving import predict_game
+
+    result = predict_game(db_connection, game_id)
+    if result is None:
+        abort(404)
+
+    response = jsonify(result)
+    # Same game + model + data -> same body, so clients can revalidate with If-None-Match
+    body = json.dumps(result, sort_keys=True).encode()
+    response.set_etag(hashlib.sha1(body).hexdigest()[:20])
+    response.headers["Cache-Control"] = f"public, max-age={PREDICTION_MAX_AGE}"
+    return response.make_conditional(request)
+
+
+@app.route("/matchup/<int:team_id>/<int:opp_id>")
+def matchup(team_id, opp_id):
+    from matchups import N_MEETINGS, last_meetings, summarize
+
+    try:
+        n = int(request.args.get("n", N_MEETINGS))
+        before = request.args.get("before")
+        before = datetime.fromisoformat(before) if before else None
+    except ValueError:
+        abort(400, description="n must be an integer and before an ISO date")
+    n = max(1, min(n, 82))
+    with db_connection() as conn:
+        meetings = last_meetings(conn, team_id, opp_id, before=before, n=n)
+    for m in meetings:
+        m["date"] = m["date"].isoformat()
+    return jsonify({
+        "team_id": team_id,
+        "opp_id": opp_id,
+        "summary": summarize(meetings),
+        "meetings": meetings,
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    body, content_type = render()
+    return Response(body, content_type=content_type)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,422 @@
+"""
+Ingestion and write-path benchmarks against a local scratch Postgres.
+
+Uses the DB_* settings (point them at a throwaway local database: every run
+truncates the pipeline tables) and serves a synthetic season from
+mock_nhl_api.py in-process. Results are written as JSON under
+bench_results/ so runs on different commits can be compared.
+
+    python bench_ingest.py --start 2023-10-01 --end 2024-04-18
+    python bench_ingest.py --compare bench_results/<earlier>.json
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", "bench_results")
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1", None, ""}
+
+DEFENSE_COLS = [
+    "game_id", "season", "team_id", "player_id", "name", "position",
+    "goals", "assists", "points", "plus_minus", "pim",
+    "hits", "blocked_shots", "shifts", "giveaways", "takeaways", "toi",
+]
+
+DEFENSE_CONFLICT_SQL = """
+    ON CONFLICT (game_id, player_id) DO UPDATE SET
+        goals = EXCLUDED.goals,
+        assists = EXCLUDED.assists,
+        points = EXCLUDED.points,
+        plus_minus = EXCLUDED.plus_minus,
+        pim = EXCLUDED.pim,
+        hits = EXCLUDED.hits,
+        blocked_shots = EXCLUDED.blocked_shots,
+        shifts = EXCLUDED.shifts,
+        giveaways = EXCLUDED.giveaways,
+        takeaways = EXCLUDED.takeaways,
+        toi = EXCLUDED.toi
+"""
+
+
+# -------------------------------------------------
+# Synthetic season (same payloads the mock API serves)
+# -------------------------------------------------
+
+def season_games(start, end):
+    from mock_nhl_api import synth_games_for_date
+
+    games = []
+    d = start
+    while d <= end:
+        games.extend(g for g in synth_games_for_date(d) if "score" in g["homeTeam"])
+        d += timedelta(days=1)
+    return games
+
+
+def season_boxscores(games):
+    from mock_nhl_api import synth_boxscore
+    return [(g, synth_boxscore(g["id"])) for g in games]
+
+
+def defense_rows(boxscores):
+    from ingest_team_game_defense import defense_row
+
+    rows = []
+    for game, box in boxscores:
+        for side in ("homeTeam", "awayTeam"):
+            team_id = box[side]["id"]
+            for p in box["playerByGameStats"][side]["defense"]:
+                rows.append(defense_row(game["id"], game["season"], team_id, p))
+    return rows
+
+
+def _copy_buffer(rows, cols):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        writer.writerow(["" if r[c] is None else r[c] for c in cols])
+    buf.seek(0)
+    return buf
+
+
+def _result(seconds, rows=None, games=None, **extra):
+    out = {"seconds": round(seconds, 4)}
+    if rows is not None:
+        out["rows"] = rows
+        out["rows_per_sec"] = round(rows / seconds, 1) if seconds else None
+    if games is not None:
+        out["games"] = games
+        out["games_per_sec"] = round(games / seconds, 1) if seconds else None
+    out.update(extra)
+    return out
+
+# -------------------------------------------------
+# Write paths (team_game_defense, one season)
+# -------------------------------------------------
+
+def bench_per_row(engine, boxscores):
+    """
+    insert_defense_stats as ingest_all_games calls it: one execute per
+    player, one commit per game.
+    """
+    from sqlalchemy.orm import Session
+    from ingest_team_game_defense import insert_defense_stats
+
+    rows = 0
+    start = time.perf_counter()
+    with Session(bind=engine) as session:
+        for game, box in boxscores:
+            for side in ("homeTeam", "awayTeam"):
+                defense = box["playerByGameStats"][side]["defense"]
+                insert_defense_stats(
+                    session, game["id"], game["season"], box[side]["id"], defense
+                )
+                rows += len(defense)
+            session.commit()
+    return _result(time.perf_counter() - start, rows, len(boxscores))
+
+
+def bench_executemany(engine, rows, games):
+    from ingest_team_game_defense import DEFENSE_UPSERT_SQL
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(DEFENSE_UPSERT_SQL, rows)
+    return _result(time.perf_counter() - start, len(rows), games)
+
+
+def bench_execute_values(engine, rows, games, page_size=1000):
+    from psycopg2.extras import execute_values
+
+    sql = (
+        f"INSERT INTO team_game_defense ({', '.join(DEFENSE_COLS)}) VALUES %s"
+        + DEFENSE_CONFLICT_SQL
+    )
+    values = [tuple(r[c] for c in DEFENSE_COLS) for r in rows]
+
+    start = time.perf_counter()
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        execute_values(cur, sql, values, page_size=page_size)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return _result(time.perf_counter() - start, len(rows), games, page_size=page_size)
+
+
+def bench_copy(engine, rows, games):
+    """
+    COPY into a temp staging table, then one upsert from it (keeps the
+    ON CONFLICT semantics the other paths have).
+    """
+    start = time.perf_counter()
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "CREATE TEMP TABLE defense_stage "
+            "(LIKE team_game_defense INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cur.copy_expert(
+            f"COPY defense_stage ({', '.join(DEFENSE_COLS)}) FROM STDIN WITH (FORMAT csv)",
+            _copy_buffer(rows, DEFENSE_COLS),
+        )
+        cur.execute(
+            f"INSERT INTO team_game_defense ({', '.join(DEFENSE_COLS)}) "
+            f"SELECT {', '.join(DEFENSE_COLS)} FROM defense_stage"
+            + DEFENSE_CONFLICT_SQL
+        )
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return _result(time.perf_counter() - start, len(rows), games)
+
+# -------------------------------------------------
+# Schedule ingestion (against the in-process mock API)
+# -------------------------------------------------
+
+def start_mock_api():
+    from werkzeug.serving import make_server
+    from mock_nhl_api import create_app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_ingest_schedule(start, end):
+    from mock_nhl_api import synth_games_for_date
+    from ingest_game_schedule import ingest_schedule
+
+    weeks = []
+    week_start = start
+    while week_start <= end:
+        week_end = min(week_start + timedelta(days=6), end)
+        # The API always returns a full week, so count all seven days
+        n_games = sum(
+            len(synth_games_for_date(week_start + timedelta(days=i)))
+            for i in range(7)
+        )
+        t0 = time.perf_counter()
+        # ingest_schedule prints one line per game
+        with contextlib.redirect_stdout(io.StringIO()):
+            ingest_schedule(week_start.isoformat(), week_end.isoformat())
+        seconds = time.perf_counter() - t0
+        weeks.append(_result(seconds, games=n_games, week=week_start.isoformat()))
+        week_start += timedelta(days=7)
+
+    total = sum(w["seconds"] for w in weeks)
+    games = sum(w["games"] for w in weeks)
+    per_week = sorted(w["seconds"] for w in weeks)
+    return _result(
+        total,
+        games=games,
+        weeks=len(weeks),
+        week_median_seconds=per_week[len(per_week) // 2] if per_week else None,
+        week_max_seconds=per_week[-1] if per_week else None,
+        per_week=weeks,
+    )
+
+
+def load_players_and_stats(engine, boxscores):
+    """
+    Fill players/player_stats for the ingested games with COPY so the
+    feature build has inputs.
+    """
+    from sqlalchemy import text
+    from ingest_player_stats import PLAYER_STATS_COLS, boxscore_player_rows
+
+    with engine.connect() as conn:
+        team_ids = dict(conn.execute(text("SELECT abbreviation, id FROM teams")).all())
+        game_ids = dict(conn.execute(text("SELECT nhl_game_id, id FROM games")).all())
+
+    players = {}
+    stats = []
+    for game, box in boxscores:
+        if game["id"] not in game_ids:
+            continue
+        game_players, game_stats = boxscore_player_rows(
+            box, game_ids[game["id"]],
+            team_ids[box["homeTeam"]["abbrev"]], team_ids[box["awayTeam"]["abbrev"]],
+        )
+        players.update(game_players)
+        stats.extend(game_stats)
+
+    start = time.perf_counter()
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.copy_expert(
+            "COPY players (id, team_id, full_name, position) FROM STDIN WITH (FORMAT csv)",
+            _copy_buffer(
+                [dict(zip(("id", "team_id", "full_name", "position"), p)) for p in players.values()],
+                ["id", "team_id", "full_name", "position"],
+            ),
+        )
+        cur.copy_expert(
+            f"COPY player_stats ({', '.join(PLAYER_STATS_COLS)}) FROM STDIN WITH (FORMAT csv)",
+            _copy_buffer(stats, PLAYER_STATS_COLS),
+        )
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return _result(time.perf_counter() - start, len(stats) + len(players))
+
+# -------------------------------------------------
+# Feature build end to end
+# -------------------------------------------------
+
+def bench_team_vs_opponent(engine):
+    from team_vs_opponent import build_features, load_inputs
+    from persist_team_game_features import persist_team_game_features
+
+    stages = {}
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        games, player_stats = load_inputs(engine)
+        stages["load_seconds"] = round(time.perf_counter() - t0, 4)
+
+        t1 = time.perf_counter()
+        final_df = build_features(games, player_stats)
+        stages["build_seconds"] = round(time.perf_counter() - t1, 4)
+
+        t2 = time.perf_counter()
+        persist_team_game_features(final_df, bind=engine)
+        persist_seconds = time.perf_counter() - t2
+    stages["persist_seconds"] = round(persist_seconds, 4)
+    stages["persist_rows_per_sec"] = round(len(final_df) / persist_seconds, 1)
+
+    return _result(time.perf_counter() - t0, len(final_df), len(games), **stages)
+
+# -------------------------------------------------
+# Runner
+# -------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} ({baseline.get('commit')}):")
+    for name, r in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old or not old.get("seconds"):
+            continue
+        change = (r["seconds"] - old["seconds"]) / old["seconds"] * 100
+        print(f"  {name:<22} {old['seconds']:>9.3f}s -> {r['seconds']:>9.3f}s ({change:+.1f}%)")
+
+
+def run(start, end, paths):
+    from db import get_engine
+    from local_schema import create_schema, truncate_tables
+
+    engine = get_engine()
+    create_schema(engine)
+    truncate_tables(engine)
+
+    results = {}
+    games = season_games(start, end)
+    boxscores = season_boxscores(games)
+    rows = defense_rows(boxscores)
+    print(f"Synthetic season: {len(games)} games, {len(rows)} defense rows")
+
+    write_paths = {
+        "per_row": lambda: bench_per_row(engine, boxscores),
+        "executemany": lambda: bench_executemany(engine, rows, len(games)),
+        "execute_values": lambda: bench_execute_values(engine, rows, len(games)),
+        "copy": lambda: bench_copy(engine, rows, len(games)),
+    }
+    for name, fn in write_paths.items():
+        if name not in paths:
+            continue
+        truncate_tables(engine, ["team_game_defense"])
+        results[f"defense_{name}"] = fn()
+        print(f"defense_{name}: {results[f'defense_{name}']['rows_per_sec']} rows/s")
+
+    if "schedule" in paths or "features" in paths:
+        results["ingest_schedule"] = bench_ingest_schedule(start, end)
+        print(f"ingest_schedule: {results['ingest_schedule']['games_per_sec']} games/s")
+
+    if "features" in paths:
+        results["load_player_stats_copy"] = load_players_and_stats(engine, boxscores)
+        results["team_vs_opponent"] = bench_team_vs_opponent(engine)
+        print(f"team_vs_opponent: {results['team_vs_opponent']['seconds']} s")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion write paths")
+    parser.add_argument("--start", default="2023-10-01", help="YYYY-MM-DD")
+    parser.add_argument("--end", default="2024-04-18", help="YYYY-MM-DD")
+    parser.add_argument(
+        "--paths", nargs="+",
+        default=["per_row", "executemany", "execute_values", "copy", "schedule", "features"],
+    )
+    parser.add_argument("--output", help="result file (default bench_results/<time>_<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--force", action="store_true",
+                        help="allow a non-local DB_HOST (tables are truncated!)")
+    args = parser.parse_args(argv)
+
+    # The API client reads its base URL and rate limit at import time
+    server = start_mock_api()
+    os.environ["NHL_API_WEB_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["NHL_STATS_URL"] = f"http://127.0.0.1:{server.server_port}/stats/rest/en"
+    os.environ.setdefault("NHL_API_RATE", "100000")
+    os.environ.setdefault("NHL_API_BURST", "100000")
+
+    from db import get_config
+    host = get_config()["DB_HOST"]
+    if host not in LOCAL_HOSTS and not args.force:
+        raise SystemExit(f"Refusing to truncate tables on DB_HOST={host}; use --force")
+
+    start = datetime.strptime(args.start, "%Y-%m-%d").date()
+    end = datetime.strptime(args.end, "%Y-%m-%d").date()
+    try:
+        results = run(start, end, set(args.paths))
+    finally:
+        server.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {"start": args.start, "end": args.end, "paths": sorted(args.paths)},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{datetime.now():%Y%m%dT%H%M%S}_{report['commit'] or 'nogit'}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_INVALIDATIONS, CACHE_REQUESTS
+
+MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Entries can carry tags (e.g. ("game", 123), ("team", 7)) so related
+    entries can be dropped together when the underlying data changes.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=300.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.data.move_to_end(key)
+                CACHE_REQUESTS.labels(self.name, "hit").inc()
+                return entry[0]
+            if entry is not None:
+                del self.data[key]
+        CACHE_REQUESTS.labels(self.name, "miss").inc()
+        return MISSING
+
+    def set(self, key, value, tags=()):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl, frozenset(tags))
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def invalidate(self, tags, reason="data"):
+        """
+        Drop every entry sharing at least one tag; returns how many.
+        """
+        tags = set(tags)
+        with self.lock:
+            stale = [k for k, (_, _, t) in self.data.items() if t & tags]
+            for k in stale:
+                del self.data[k]
+        CACHE_INVALIDATIONS.labels(self.name, reason).inc(len(stale))
+        return len(stale)
+
+    def clear(self, reason="data"):
+        with self.lock:
+            n = len(self.data)
+            self.data.clear()
+        CACHE_INVALIDATIONS.labels(self.name, reason).inc(n)
+        return n
+
+    def __len__(self):
+        return len(self.data)
@@ -1,48 +1,116 @@
+import io
 import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-# Load environment variables from .env
-load_dotenv()
-
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-
-# Safety check (fails fast if misconfigured)
-required_vars = {
-    "DB_USER": DB_USER,
-    "DB_PASSWORD": DB_PASSWORD,
-    "DB_HOST": DB_HOST,
-    "DB_PORT": DB_PORT,
-    "DB_NAME": DB_NAME,
-}
-
-missing = [k for k, v in required_vars.items() if not v]
-if missing:
-    raise RuntimeError(f"Missing required environment variables: {missing}")
-
-DATABASE_URL = (
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}"
-    f"@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
-
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True
-)
+
+DB_VARS = ("DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT", "DB_NAME")
+
+_config = None
+_engine = None
+_uri_engines = {}
+
+
+def get_config():
+    """
+    Load .env and validate the DB_* variables on first use.
+    """
+    global _config
+    if _config is None:
+        from dotenv import load_dotenv
+
+        # Load environment variables from .env
+        load_dotenv()
+
+        config = {k: os.getenv(k) for k in DB_VARS}
+
+        # Safety check (fails fast if misconfigured)
+        missing = [k for k, v in config.items() if not v]
+        if missing:
+            raise RuntimeError(f"Missing required environment variables: {missing}")
+
+        _config = config
+    return _config
+
+
+def get_database_url():
+    c = get_config()
+    return (
+        f"postgresql+psycopg2://{c['DB_USER']}:{c['DB_PASSWORD']}"
+        f"@{c['DB_HOST']}:{c['DB_PORT']}/{c['DB_NAME']}"
+    )
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+
+        _engine = create_engine(
+            get_database_url(),
+            pool_pre_ping=True
+        )
+    return _engine
+
+
+def get_uri_engine(var="DB_URI", **kwargs):
+    """
+    Engine for scripts configured with a single connection URI variable.
+    """
+    key = (var, tuple(sorted(kwargs.items())))
+    if key not in _uri_engines:
+        from dotenv import load_dotenv
+        from sqlalchemy import create_engine
+
+        load_dotenv()
+        uri = os.getenv(var)
+        if not uri:
+            raise RuntimeError(f"Missing required environment variable: {var}")
+        _uri_engines[key] = create_engine(uri, **kwargs)
+    return _uri_engines[key]
+
 
 def get_conn():
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    c = get_config()
     return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT,
+        dbname=c["DB_NAME"],
+        user=c["DB_USER"],
+        password=c["DB_PASSWORD"],
+        host=c["DB_HOST"],
+        port=c["DB_PORT"],
         cursor_factory=RealDictCursor
     )
 
+
+# -------------------------------------------------
+# Cursor helpers (plain DB-API cursors, tuple or dict rows)
+# -------------------------------------------------
+
+def fetch_dicts(cur):
+    """
+    Remaining rows of an executed cursor as dicts, whether the cursor
+    returns tuples or dicts (RealDictCursor).
+    """
+    names = [d[0] for d in cur.description]
+    return [dict(r) if isinstance(r, dict) else dict(zip(names, r)) for r in cur.fetchall()]
+
+
+def copy_frame(cur, table, df):
+    """
+    COPY the rows of `df` into public.`table`, columns named as in `df`.
+    """
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cur.copy_expert(f"COPY public.{table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def __getattr__(name):
+    # Backwards compatible `from db import engine` / `DB_HOST`, resolved lazily
+    if name == "engine":
+        return get_engine()
+    if name == "DATABASE_URL":
+        return get_database_url()
+    if name in DB_VARS:
+        return get_config()[name]
+    raise AttributeError(f"module 'db' has no attribute {name!r}")
@@ -0,0 +1,370 @@
+"""
+Team Elo ratings with home-ice and margin-of-victory terms.
+
+public.team_ratings holds each team's current rating, so rating a newly
+final game is a constant-time read/update of two rows plus two history
+rows. public.team_rating_history keeps the pre/post rating of every team in
+every game, indexed by (team_id, date), so pre-game ratings are point
+lookups. replay() recomputes the whole history in one pass over date
+batches (every team plays at most once per batch), vectorized across the
+games of each batch, for rebuilds and parameter tuning.
+"""
+import argparse
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db import copy_frame, fetch_dicts
+
+INITIAL = 1500.0
+PARAMS = {
+    "k": 6.0,
+    "home_adv": 50.0,
+    # Share of the distance from the mean kept over the summer
+    "carry": 0.7,
+    "mean": 1505.0,
+}
+
+logger = logging.getLogger(__name__)
+
+RATING_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.team_ratings (
+        team_id INTEGER PRIMARY KEY,
+        rating DOUBLE PRECISION NOT NULL,
+        season INTEGER,
+        game_id INTEGER,
+        date TIMESTAMP,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.team_rating_history (
+        team_id INTEGER NOT NULL,
+        game_id INTEGER NOT NULL,
+        date TIMESTAMP NOT NULL,
+        season INTEGER,
+        rating_pre DOUBLE PRECISION NOT NULL,
+        rating_post DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (team_id, game_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS team_rating_history_team_date_idx
+    ON public.team_rating_history (team_id, date)
+    """,
+]
+
+FINAL_GAMES_SQL = """
+    SELECT id AS game_id, season, game_date AS date,
+           home_team_id, away_team_id, home_score, away_score
+    FROM public.games
+    WHERE status = 'final'
+      AND home_score IS NOT NULL AND away_score IS NOT NULL
+"""
+
+
+def ensure_rating_tables(conn):
+    for stmt in RATING_TABLES_SQL:
+        conn.execute(text(stmt))
+
+# -------------------------------------------------
+# Rating math (scalars or arrays)
+# -------------------------------------------------
+
+def expected_home(home_rating, away_rating, home_adv=PARAMS["home_adv"]):
+    return 1.0 / (1.0 + 10 ** (-(home_rating + home_adv - away_rating) / 400))
+
+
+def rating_delta(home_rating, away_rating, home_score, away_score,
+                 k=PARAMS["k"], home_adv=PARAMS["home_adv"], **_):
+    """
+    Points moved to the home team (the away team loses the same amount).
+    The margin multiplier shrinks when the favourite wins, so ratings don't
+    run away on blowouts.
+    """
+    home_won = np.asarray(home_score > away_score, dtype="float64")
+    margin = np.maximum(np.abs(np.asarray(home_score) - np.asarray(away_score)), 1)
+    winner_diff = np.where(home_won == 1, 1, -1) * (home_rating + home_adv - away_rating)
+    mov = (0.6686 * np.log(margin) + 0.8048) * 2.05 / (0.001 * winner_diff + 2.05)
+    return k * mov * (home_won - expected_home(home_rating, away_rating, home_adv))
+
+
+def regress(rating, carry=PARAMS["carry"], mean=PARAMS["mean"]):
+    return mean + carry * (rating - mean)
+
+# -------------------------------------------------
+# Full replay (vectorized per date batch)
+# -------------------------------------------------
+
+def _batches(games):
+    """
+    Batch id per game of `games` sorted by (date, game_id): games on the same
+    day, split into levels so that a team's second game that day lands in a
+    later batch than its first, and ratings within a batch are independent.
+    """
+    day = pd.to_datetime(games["date"]).to_numpy().astype("datetime64[D]").astype("int64")
+    home = games["home_team_id"].to_numpy()
+    away = games["away_team_id"].to_numpy()
+    level = np.empty(len(games), dtype="int64")
+    # Level of each team's latest game on the current day
+    seen, current_day = {}, None
+    for i in range(len(games)):
+        if day[i] != current_day:
+            seen, current_day = {}, day[i]
+        level[i] = 1 + max(seen.get(home[i], -1), seen.get(away[i], -1))
+        seen[home[i]] = seen[away[i]] = level[i]
+    return np.unique(day * 1024 + level, return_inverse=True)[1]
+
+
+def replay(games, **params):
+    """
+    Rate `games` (final games, any order) from scratch. Returns the history
+    frame (team_id, game_id, date, season, rating_pre, rating_post) and the
+    per-game home win expectation, aligned with the sorted games.
+    """
+    p = {**PARAMS, **params}
+    games = games.sort_values(["date", "game_id"], ignore_index=True)
+    teams, codes = np.unique(
+        np.concatenate([games["home_team_id"], games["away_team_id"]]), return_inverse=True
+    )
+    home_idx, away_idx = codes[:len(games)], codes[len(games):]
+    ratings = np.full(len(teams), INITIAL)
+    last_season = np.full(len(teams), -1)
+
+    season = games["season"].to_numpy()
+    hs = games["home_score"].to_numpy(dtype="float64")
+    as_ = games["away_score"].to_numpy(dtype="float64")
+    pre_h, pre_a = np.empty(len(games)), np.empty(len(games))
+    post_h, post_a = np.empty(len(games)), np.empty(len(games))
+
+    batch = _batches(games)
+    order = np.argsort(batch, kind="stable")
+    for rows in np.split(order, np.flatnonzero(np.diff(batch[order])) + 1):
+        h, a = home_idx[rows], away_idx[rows]
+        for idx in (h, a):
+            new = (last_season[idx] != season[rows]) & (last_season[idx] != -1)
+            ratings[idx[new]] = regress(ratings[idx[new]], p["carry"], p["mean"])
+            last_season[idx] = season[rows]
+
+        rh, ra = ratings[h], ratings[a]
+        delta = rating_delta(rh, ra, hs[rows], as_[rows], **p)
+        pre_h[rows], pre_a[rows] = rh, ra
+        post_h[rows], post_a[rows] = rh + delta, ra - delta
+        ratings[h] = rh + delta
+        ratings[a] = ra - delta
+
+    history = pd.concat([
+        pd.DataFrame({"team_id": games["home_team_id"], "game_id": games["game_id"],
+                      "date": games["date"], "season": season,
+                      "rating_pre": pre_h, "rating_post": post_h}),
+        pd.DataFrame({"team_id": games["away_team_id"], "game_id": games["game_id"],
+                      "date": games["date"], "season": season,
+                      "rating_pre": pre_a, "rating_post": post_a}),
+    ], ignore_index=True)
+    return history, expected_home(pre_h, pre_a, p["home_adv"])
+
+
+def evaluate(games, **params):
+    """
+    Log loss of the pre-game home-win expectation over `games`.
+    """
+    games = games.sort_values(["date", "game_id"], ignore_index=True)
+    _, p_home = replay(games, **params)
+    home_won = (games["home_score"] > games["away_score"]).to_numpy()
+    p = np.clip(np.where(home_won, p_home, 1 - p_home), 1e-9, 1)
+    return float(-np.log(p).mean())
+
+
+def load_final_games(bind):
+    with bind.connect() as conn:
+        return pd.read_sql(text(FINAL_GAMES_SQL), conn)
+
+
+def rebuild(bind, **params):
+    """
+    Replace both rating tables with a full replay.
+    """
+    history, _ = replay(load_final_games(bind), **params)
+    current = (
+        history.sort_values(["date", "game_id"])
+        .groupby("team_id", as_index=False)
+        .last()[["team_id", "rating_post", "season", "game_id", "date"]]
+        .rename(columns={"rating_post": "rating"})
+    )
+
+    with bind.begin() as conn:
+        ensure_rating_tables(conn)
+        conn.execute(text("TRUNCATE public.team_rating_history, public.team_ratings"))
+        cur = conn.connection.cursor()
+        for table, df in (("team_rating_history", history), ("team_ratings", current)):
+            copy_frame(cur, table, df)
+        cur.close()
+    logger.info(f"Rebuilt ratings: {len(history)} history rows, {len(current)} teams")
+    return len(history)
+
+# -------------------------------------------------
+# Incremental updates
+# -------------------------------------------------
+
+def rate_games(bind, game_ids, **params):
+    """
+    Apply newly final games (games.id) in date order. Games already in the
+    history are skipped, so re-delivered events are harmless.
+    """
+    p = {**PARAMS, **params}
+    rated = 0
+    with bind.begin() as conn:
+        games = conn.execute(text(FINAL_GAMES_SQL + """
+              AND id = ANY(:ids)
+              AND NOT EXISTS (
+                  SELECT 1 FROM public.team_rating_history h WHERE h.game_id = games.id
+              )
+            ORDER BY game_date, id
+        """), {"ids": list(game_ids)}).mappings().all()
+
+        for g in games:
+            current = {
+                r.team_id: r for r in conn.execute(text("""
+                    SELECT team_id, rating, season, date FROM public.team_ratings
+                    WHERE team_id IN (:home, :away)
+                    FOR UPDATE
+                """), {"home": g["home_team_id"], "away": g["away_team_id"]})
+            }
+            pre = {}
+            for team_id in (g["home_team_id"], g["away_team_id"]):
+                row = current.get(team_id)
+                if row is None:
+                    pre[team_id] = INITIAL
+                    continue
+                if row.date is not None and row.date > g["date"]:
+                    logger.warning(
+                        f"Game {g['game_id']} is older than team {team_id}'s last rated game; "
+                        "run `elo --rebuild` to re-sequence"
+                    )
+                rating = row.rating
+                if row.season is not None and row.season != g["season"]:
+                    rating = regress(rating, p["carry"], p["mean"])
+                pre[team_id] = rating
+
+            rh, ra = pre[g["home_team_id"]], pre[g["away_team_id"]]
+            delta = float(rating_delta(rh, ra, g["home_score"], g["away_score"], **p))
+            for team_id, before, after in (
+                (g["home_team_id"], rh, rh + delta),
+                (g["away_team_id"], ra, ra - delta),
+            ):
+                params_row = {
+                    "team_id": team_id, "game_id": g["game_id"], "date": g["date"],
+                    "season": g["season"], "pre": before, "post": after,
+                }
+                conn.execute(text("""
+                    INSERT INTO public.team_rating_history
+                        (team_id, game_id, date, season, rating_pre, rating_post)
+                    VALUES (:team_id, :game_id, :date, :season, :pre, :post)
+                    ON CONFLICT (team_id, game_id) DO NOTHING
+                """), params_row)
+                conn.execute(text("""
+                    INSERT INTO public.team_ratings (team_id, rating, season, game_id, date, updated_at)
+                    VALUES (:team_id, :post, :season, :game_id, :date, now())
+                    ON CONFLICT (team_id) DO UPDATE
+                    SET rating = EXCLUDED.rating, season = EXCLUDED.season,
+                        game_id = EXCLUDED.game_id, date = EXCLUDED.date,
+                        updated_at = EXCLUDED.updated_at
+                """), params_row)
+            rated += 1
+    return rated
+
+# -------------------------------------------------
+# Lookups
+# -------------------------------------------------
+
+# Each side's stored pre-game rating (once the game is rated) and the
+# rating and season of its previous rated game
+PREGAME_RATINGS_SQL = """
+    SELECT s.team_id, g.season, h.rating_pre,
+           prev.rating_post AS prev_rating, prev.season AS prev_season
+    FROM public.games g
+    CROSS JOIN LATERAL (VALUES (g.home_team_id), (g.away_team_id)) AS s (team_id)
+    LEFT JOIN public.team_rating_history h
+      ON h.game_id = g.id AND h.team_id = s.team_id
+    LEFT JOIN LATERAL (
+        SELECT rating_post, season
+        FROM public.team_rating_history r
+        WHERE r.team_id = s.team_id AND r.date < g.game_date
+        ORDER BY r.date DESC
+        LIMIT 1
+    ) prev ON true
+    WHERE g.id = %s
+"""
+
+
+def pregame_ratings(cur, game_id, **params):
+    """
+    {team_id: rating} going into a game, on a DB-API cursor. Games not rated
+    yet (e.g. scheduled) get what rate_games() will use: the previous
+    rating, regressed toward the mean across a season change, or INITIAL.
+    """
+    p = {**PARAMS, **params}
+    cur.execute(PREGAME_RATINGS_SQL, (game_id,))
+    out = {}
+    for r in fetch_dicts(cur):
+        if r["rating_pre"] is not None:
+            rating = r["rating_pre"]
+        elif r["prev_rating"] is None:
+            rating = INITIAL
+        elif r["prev_season"] is not None and r["prev_season"] != r["season"]:
+            rating = regress(r["prev_rating"], p["carry"], p["mean"])
+        else:
+            rating = r["prev_rating"]
+        out[r["team_id"]] = float(rating)
+    return out
+
+# -------------------------------------------------
+# Entry point
+# -------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Team Elo ratings")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="replay every final game and replace the rating tables")
+    parser.add_argument("--tune", action="store_true",
+                        help="grid-search k / home_adv / carry by log loss (no writes)")
+    args = parser.parse_args(argv)
+
+    from db import get_engine
+    bind = get_engine()
+
+    if args.tune:
+        games = load_final_games(bind)
+        results = [
+            (evaluate(games, k=k, home_adv=h, carry=c), k, h, c)
+            for k, h, c in itertools.product((4, 6, 8, 10), (25, 50, 75), (0.5, 0.7, 0.9))
+        ]
+        for loss, k, h, c in sorted(results)[:10]:
+            print(f"log loss {loss:.4f}  k={k} home_adv={h} carry={c}")
+        return
+
+    if args.rebuild:
+        rebuild(bind)
+        return
+
+    # Catch up on any final games not rated yet
+    with bind.begin() as conn:
+        ensure_rating_tables(conn)
+        ids = conn.execute(text("""
+            SELECT g.id FROM public.games g
+            WHERE g.status = 'final'
+              AND NOT EXISTS (SELECT 1 FROM public.team_rating_history h WHERE h.game_id = g.id)
+        """)).scalars().all()
+    print(f"Rated {rate_games(bind, ids)} game(s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
@@ -0,0 +1,119 @@
+"""
+Data-change events over Postgres LISTEN/NOTIFY.
+
+Writers call notify() inside their transaction (Postgres delivers it on
+commit); long-running readers such as the web app call listen() on a
+dedicated connection. emit() also appends the event to
+public.pipeline_events so the orchestrator can catch up on anything it
+missed while it was down.
+"""
+import json
+import logging
+import os
+import select
+import time
+
+CHANNEL = os.getenv("NHL_EVENTS_CHANNEL", "nhl_data_changed")
+
+GAME_FINAL = "game_final"
+VIEW_REFRESHED = "view_refreshed"
+
+# NOTIFY payloads are capped at 8000 bytes
+MAX_IDS_PER_EVENT = 200
+
+logger = logging.getLogger(__name__)
+
+EVENT_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.pipeline_events (
+        id BIGSERIAL PRIMARY KEY,
+        event TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.pipeline_watermarks (
+        stage TEXT PRIMARY KEY,
+        event_id BIGINT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+
+def _execute(target, sql, params=None):
+    if hasattr(target, "exec_driver_sql"):
+        return target.exec_driver_sql(sql, params or ())
+    return target.execute(sql, params)
+
+
+def ensure_event_tables(target):
+    for stmt in EVENT_TABLES_SQL:
+        _execute(target, stmt)
+
+
+def notify(target, event, **data):
+    """
+    Notify listeners via `target`: a DB-API cursor or a SQLAlchemy connection.
+    """
+    payload = json.dumps({"event": event, **data})
+    _execute(target, "SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+
+
+def emit(target, event, **data):
+    """
+    Record the event in the queue table and notify listeners.
+    """
+    _execute(
+        target,
+        "INSERT INTO public.pipeline_events (event, payload) VALUES (%s, %s)",
+        (event, json.dumps(data)),
+    )
+    notify(target, event, **data)
+
+
+def notify_games_final(target, games):
+    """
+    games: iterable of (game_id, home_team_id, away_team_id).
+    """
+    games = list(games)
+    for i in range(0, len(games), MAX_IDS_PER_EVENT):
+        chunk = games[i:i + MAX_IDS_PER_EVENT]
+        emit(
+            target,
+            GAME_FINAL,
+            game_ids=[g[0] for g in chunk],
+            team_ids=sorted({t for g in chunk for t in g[1:]}),
+        )
+
+
+def listen(connect, handler, stop=None, timeout=5.0):
+    """
+    Block and call handler(event_dict) for every notification, reconnecting
+    with backoff if the connection drops. `connect` returns a new psycopg2
+    connection; `stop` is an optional threading.Event.
+    """
+    delay = 1.0
+    while stop is None or not stop.is_set():
+        try:
+            conn = connect()
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL}")
+            logger.info(f"Listening for events on {CHANNEL}")
+            delay = 1.0
+            while stop is None or not stop.is_set():
+                if select.select([conn], [], [], timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        handler(json.loads(note.payload))
+                    except Exception as e:
+                        logger.error(f"Event handler failed for {note.payload!r}: {e}")
+        except Exception as e:
+            logger.warning(f"Event listener error: {e}; reconnecting in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 60.0)
@@ -0,0 +1,72 @@
+"""
+Fit a goals model on the full training frame and export it for scorer.py.
+
+The artifact holds the coefficients plus the training module's
+preprocessing (export_steps()), so serving loads a few KB of JSON instead of
+importing sklearn. Before saving, the training frame is rescored with the
+NumPy scorer from raw columns and compared with sklearn's predictions.
+"""
+import argparse
+import importlib
+import os
+import time
+
+import numpy as np
+
+from scorer import Scorer, export, save_artifact
+
+# name -> (training module, PoissonRegressor alpha, max_iter)
+MODELS = {
+    "poisson_base": ("team_vs_opponent_predictions", 0.001, 1000),
+    "poisson_r1": ("team_vs_opponent_predictions_r1", 0.05, 5000),
+}
+# Largest tolerated difference from sklearn, in goals
+TOLERANCE = 1e-9
+
+
+def build(name):
+    """
+    (artifact, max abs difference from sklearn) for one of MODELS.
+    """
+    from sklearn.linear_model import PoissonRegressor
+    from feature_store import load_training_frame
+
+    module_name, alpha, max_iter = MODELS[name]
+    module = importlib.import_module(module_name)
+
+    raw = load_training_frame(columns=module.COLUMNS)
+    df = module.preprocess(raw.copy())
+    X = df[module.FEATURES].to_numpy(dtype="float32")
+    model = PoissonRegressor(alpha=alpha, max_iter=max_iter)
+    model.fit(X, df[module.TARGET].to_numpy())
+
+    output_clip = getattr(module, "PRED_CLIP", None)
+    expected = model.predict(X)
+    if output_clip:
+        expected = expected.clip(*output_clip)
+
+    inputs, steps, clip = module.export_steps(df)
+    version = f"{name}-{df['date'].max():%Y%m%d}-{len(df)}"
+    artifact = export(model, name, version, inputs, steps, module.FEATURES, clip, output_clip)
+    got = Scorer(artifact).score(raw)
+    return artifact, float(np.max(np.abs(got - expected)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a goals model for the NumPy scorer")
+    parser.add_argument("--model", choices=sorted(MODELS), default="poisson_base")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    artifact, diff = build(args.model)
+    if diff > TOLERANCE:
+        raise SystemExit(f"Exported scorer differs from sklearn by up to {diff:.3g} goals; not saved")
+    path = save_artifact(artifact)
+    print(
+        f"Exported {artifact['version']} to {path} ({os.path.getsize(path)} bytes) "
+        f"in {time.perf_counter() - start:.1f}s; max difference from sklearn {diff:.3g}"
+    )
+
+
+if __name__ == "__main__":
+    main()
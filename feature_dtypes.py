@@ -0,0 +1,108 @@
+import resource
+
+import pandas as pd
+
+# -------------------------------------------------
+# Schema-driven dtype policy for feature frames
+# -------------------------------------------------
+
+ID_COLS = {
+    "id",
+    "game_id",
+    "nhl_game_id",
+    "team_id",
+    "opp_team_id",
+    "home_team_id",
+    "away_team_id",
+    "player_id",
+    "season",
+}
+
+CATEGORICAL_COLS = {
+    "team_abbrev",
+    "opp_abbrev",
+    "home_abbrev",
+    "away_abbrev",
+    "home_away",
+    "position",
+}
+
+# Per-game box-score counters; team-game sums stay well inside int16
+COUNTER_COLS = {
+    "goals",
+    "assists",
+    "points",
+    "shots",
+    "hits",
+    "goals_against",
+    "shots_against",
+    "opp_goals",
+    "opp_shots",
+    "opp_hits",
+    "opp_points",
+    "blocked_shots",
+    "plus_minus",
+    "def_blocked_shots",
+    "def_plus_minus",
+}
+
+DATE_COLS = {"date", "game_date"}
+
+
+def dtype_for(col, series):
+    """
+    Target dtype for a column, or None to leave it alone.
+    """
+    if col in DATE_COLS:
+        return "datetime64[ns]"
+    if col in CATEGORICAL_COLS:
+        return "category"
+    if series.dtype.kind not in "fiub":
+        return None
+    # Integer targets only when there is nothing to fill yet
+    has_nulls = series.isna().any()
+    if col in ID_COLS and not has_nulls:
+        return "int32"
+    if col in COUNTER_COLS and not has_nulls:
+        return "int16"
+    if series.dtype.kind == "b":
+        return None
+    return "float32"
+
+
+def apply_dtype_policy(df):
+    """
+    Downcast a frame in place according to the policy above.
+    """
+    for col in df.columns:
+        target = dtype_for(col, df[col])
+        if target is None or df[col].dtype == target:
+            continue
+        if target == "datetime64[ns]":
+            df[col] = pd.to_datetime(df[col])
+        else:
+            df[col] = df[col].astype(target)
+    return df
+
+
+# -------------------------------------------------
+# Memory reporting
+# -------------------------------------------------
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def memory_report(stage, df):
+    """
+    Print the frame size and process peak RSS after a pipeline stage.
+    """
+    print(
+        f"[mem] {stage}: {len(df)} rows, {frame_mb(df):.1f} MiB frame, "
+        f"peak RSS {peak_rss_mb():.0f} MiB"
+    )
@@ -0,0 +1,228 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from db import get_engine
+from feature_dtypes import apply_dtype_policy
+from team_vs_opponent_view import VIEW_NAME
+
+# -------------------------------------------------
+# Config
+# -------------------------------------------------
+
+STORE_DIR = os.getenv("FEATURE_STORE_DIR", "feature_store")
+DATASET = "team_vs_opponent"
+
+
+def _dataset_dir():
+    return os.path.join(STORE_DIR, DATASET)
+
+
+def _manifest_path():
+    return os.path.join(STORE_DIR, f"{DATASET}.manifest.json")
+
+
+def read_manifest():
+    path = _manifest_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest):
+    tmp = _manifest_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, _manifest_path())
+
+
+# -------------------------------------------------
+# DB reads
+# -------------------------------------------------
+
+# Late player_stats or defense rows change a game's row after the fact, and
+# with it the rolling columns of the team's later games, so a date watermark
+# misses them. The view is compared season by season instead: a season is
+# re-read whenever its checksum (computed in Postgres) has moved.
+SEASON_CHECKSUMS_SQL = f"""
+    SELECT season, md5(string_agg(t::text, '|' ORDER BY game_id, team_id)) AS checksum
+    FROM {VIEW_NAME} t
+    GROUP BY season
+"""
+
+
+def _season_checksums(bind):
+    with bind.connect() as conn:
+        rows = conn.execute(text(SEASON_CHECKSUMS_SQL)).all()
+    return {str(int(season)): checksum for season, checksum in rows}
+
+
+def _stale_seasons(manifest, checksums):
+    known = manifest.get("checksums", {})
+    return sorted(int(s) for s, c in checksums.items() if known.get(s) != c)
+
+
+def _select_sql(columns, seasons=None):
+    cols = ", ".join(columns) if columns else "*"
+    sql = f"SELECT {cols} FROM {VIEW_NAME}"
+    if seasons is not None:
+        sql += " WHERE season = ANY(:seasons)"
+    return text(sql + " ORDER BY date, game_id")
+
+
+def _read_db(bind, columns=None, seasons=None):
+    params = {"seasons": [int(s) for s in seasons]} if seasons is not None else {}
+    df = pd.read_sql(_select_sql(columns, seasons), bind, params=params)
+    return apply_dtype_policy(df)
+
+
+# -------------------------------------------------
+# Snapshot writer
+# -------------------------------------------------
+
+def _write_season(df, season):
+    part_dir = os.path.join(_dataset_dir(), f"season={season}")
+    if os.path.exists(part_dir):
+        shutil.rmtree(part_dir)
+    os.makedirs(part_dir)
+    table = pa.Table.from_pandas(
+        df.drop(columns=["season"]),
+        preserve_index=False,
+    )
+    pq.write_table(table, os.path.join(part_dir, "part-0.parquet"))
+
+
+def _drop_season(season):
+    part_dir = os.path.join(_dataset_dir(), f"season={season}")
+    if os.path.exists(part_dir):
+        shutil.rmtree(part_dir)
+
+
+def snapshot_training_frame(bind=None, full=False):
+    """
+    Export the team-game training frame to Parquet, one partition per season.
+
+    Incremental runs only re-read and rewrite the seasons whose checksum in
+    the view differs from the manifest's.
+    """
+    bind = bind or get_engine()
+    manifest = None if full else read_manifest()
+    # Taken before reading, so a refresh in between is picked up next run
+    checksums = _season_checksums(bind)
+
+    if manifest is None:
+        if os.path.exists(_dataset_dir()):
+            shutil.rmtree(_dataset_dir())
+        df = _read_db(bind)
+        if df.empty:
+            raise RuntimeError(f"No rows in {VIEW_NAME} to snapshot")
+        seasons_rows = {}
+    else:
+        stale = _stale_seasons(manifest, checksums)
+        gone = [s for s in manifest["seasons"] if s not in checksums]
+        if not stale and not gone:
+            print(f"Snapshot up to date ({len(checksums)} season(s))")
+            return manifest
+
+        df = _read_db(bind, seasons=stale)
+        seasons_rows = {s: n for s, n in manifest["seasons"].items() if s not in gone}
+        for season in gone:
+            _drop_season(season)
+
+    for season, part in df.groupby("season", observed=True):
+        _write_season(part, int(season))
+        seasons_rows[str(int(season))] = len(part)
+
+    manifest = {
+        "source": VIEW_NAME,
+        "checksums": checksums,
+        "seasons": seasons_rows,
+        "row_count": sum(seasons_rows.values()),
+        "columns": list(df.columns),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    _write_manifest(manifest)
+    print(
+        f"Snapshot written: {len(df)} rows across "
+        f"{df['season'].nunique()} season(s), {manifest['row_count']} in total"
+    )
+    return manifest
+
+
+# -------------------------------------------------
+# Readers
+# -------------------------------------------------
+
+def load_snapshot(columns=None, seasons=None):
+    """
+    Memory-map only the requested columns and season partitions.
+    """
+    read_cols = None
+    if columns is not None:
+        read_cols = [c for c in columns if c != "season"]
+        if "date" not in read_cols:
+            read_cols.append("date")
+        read_cols.append("season")
+
+    filters = [("season", "in", list(seasons))] if seasons else None
+    table = pq.read_table(
+        _dataset_dir(),
+        columns=read_cols,
+        filters=filters,
+        memory_map=True,
+        partitioning="hive",
+    )
+    df = table.to_pandas()
+    df["season"] = df["season"].astype("int32")
+    return df
+
+
+def load_training_frame(columns=None, seasons=None, bind=None):
+    """
+    Training frame from the local snapshot, with seasons that changed in the
+    view since (or were never snapshotted) read from the DB. Falls back to a
+    full DB read if no snapshot.
+    """
+    bind = bind or get_engine()
+    db_cols = None
+    if columns is not None:
+        db_cols = list(dict.fromkeys(list(columns) + ["date", "season"]))
+
+    manifest = read_manifest()
+    if manifest is None:
+        print("No feature snapshot found, reading from database")
+        df = _read_db(bind, columns=db_cols)
+    else:
+        checksums = _season_checksums(bind)
+        wanted = {int(s) for s in checksums}
+        if seasons:
+            wanted &= {int(s) for s in seasons}
+        stale = [s for s in _stale_seasons(manifest, checksums) if s in wanted]
+        fresh = sorted(wanted - set(stale))
+        parts = [load_snapshot(columns=db_cols, seasons=fresh)] if fresh else []
+        if stale:
+            parts.append(_read_db(bind, columns=db_cols, seasons=stale))
+        if not parts:
+            parts = [_read_db(bind, columns=db_cols, seasons=[])]
+        df = pd.concat(parts, ignore_index=True)
+
+    if seasons:
+        df = df[df["season"].isin(seasons)]
+
+    df = apply_dtype_policy(df)
+    df = df.sort_values(["date", "game_id"], kind="stable", ignore_index=True)
+    if columns is not None:
+        df = df[db_cols]
+    return df
+
+
+if __name__ == "__main__":
+    import sys
+    snapshot_training_frame(full="--full" in sys.argv[1:])
@@ -1,10 +1,10 @@
 from db import get_conn
-import requests
+from nhl_api import SCHEDULE_URL, get_client
+from events import ensure_event_tables, notify_games_final
+from schedule_context import ensure_schedule_tables, update_schedule_context
+from metrics import GAMES_FETCHED, LAST_SUCCESS, ROWS_WRITTEN, update_ingest_lag
 from datetime import datetime
 
-# Replace with your actual working endpoint
-SCHEDULE_URL = "https://api-web.nhle.com/v1/schedule"
-
 # --------------------------
 # Helper Functions
 # --------------------------
@@ -48,7 +48,9 @@ def map_game_state(game_state):
     return {
         "OFF": "scheduled",
         "LIVE": "live",
-        "Final": "final"
+        "CRIT": "live",
+        "Final": "final",
+        "FINAL": "final"
     }.get(game_state, "scheduled")
 
 # --------------------------
@@ -60,21 +62,28 @@ def ingest_schedule(start_date, end_date):
     Ingest NHL games from the API into local Postgres database.
     Smart ingestion:
       - Skips games that are already final
-      - Updates games only if status or score changed
+      - Updates games only if status, score or start time changed
       - Inserts new games
+      - Recomputes schedule context for teams with new or moved games
     """
     conn = get_conn()
     cur = conn.cursor()
+    ensure_event_tables(cur)
+    ensure_schedule_tables(cur)
     
     team_cache = {}
     season_cache = {}
     total_inserted = 0
     total_updated = 0
+    newly_final = []
+    # Teams and seasons whose schedule changed
+    schedule_teams = set()
+    schedule_seasons = set()
     current_date = start_date
 
     while current_date <= end_date:
         url = f"{SCHEDULE_URL}/{current_date}"
-        resp = requests.get(url)
+        resp = get_client().get(url, endpoint="schedule")
 
         if resp.status_code == 404:
             print(f"No data for {current_date}")
@@ -85,6 +94,7 @@ def ingest_schedule(start_date, end_date):
 
         for day in schedule.get("gameWeek", []):
             for game in day.get("games", []):
+                GAMES_FETCHED.labels("ingest_schedule").inc()
                 nhl_game_id = game["id"]
                 raw_state = game.get("gameState", "OFF")
 
@@ -92,7 +102,8 @@ def ingest_schedule(start_date, end_date):
                 away_score = game["awayTeam"].get("score")
 
                 status = map_game_state(raw_state)
-                if home_score is not None and away_score is not None:
+                # Games in progress carry a running score too
+                if home_score is not None and away_score is not None and status != "live":
                     status = "final"
                     
                 season = game.get("season")
@@ -124,7 +135,7 @@ def ingest_schedule(start_date, end_date):
 
                 # --- Smart Upsert Game ---
                 cur.execute("""
-                    SELECT status, home_score, away_score
+                    SELECT status, home_score, away_score, game_date
                     FROM games
                     WHERE nhl_game_id = %s
                 """, (nhl_game_id,))
@@ -135,8 +146,10 @@ def ingest_schedule(start_date, end_date):
                         print(f"Skipping final game {nhl_game_id}")
                         continue
 
-                    # Only update if status or score has changed
-                    if status != existing_game['status'] or \
+                    rescheduled = game_date != existing_game['game_date']
+
+                    # Only update if status, score or start time has changed
+                    if status != existing_game['status'] or rescheduled or \
                        (status == 'final' and (home_score != existing_game['home_score'] or away_score != existing_game['away_score'])):
                         cur.execute("""
                             UPDATE games
@@ -145,18 +158,27 @@ def ingest_schedule(start_date, end_date):
                                 home_score = CASE WHEN %s = 'final' THEN %s ELSE home_score END,
                                 away_score = CASE WHEN %s = 'final' THEN %s ELSE away_score END,
                                 season = %s,
+                                game_date = %s,
                                 venue = %s,
                                 game_type = %s
                             WHERE nhl_game_id = %s
+                            RETURNING id
                         """, (
                             status,
                             status, home_score,
                             status, away_score,
                             season,
+                            game_date,
                             venue,
                             game_type,
                             nhl_game_id
                         ))
+                        game_pk = cur.fetchone()['id']
+                        if status == 'final':
+                            newly_final.append((game_pk, home_team_id, away_team_id))
+                        if rescheduled:
+                            schedule_teams.update((home_team_id, away_team_id))
+                            schedule_seasons.add(season)
                         total_updated += 1
                         print(f"Updated game {nhl_game_id}: status changed to {status}")
                     else:
@@ -178,6 +200,7 @@ def ingest_schedule(start_date, end_date):
                         game_type
                     )
                     VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                    RETURNING id
                 """, (
                     nhl_game_id,
                     season,
@@ -190,6 +213,10 @@ def ingest_schedule(start_date, end_date):
                     venue,
                     game_type
                 ))
+                if status == 'final':
+                    newly_final.append((cur.fetchone()['id'], home_team_id, away_team_id))
+                schedule_teams.update((home_team_id, away_team_id))
+                schedule_seasons.add(season)
                 total_inserted += 1
                 print(
                     f"Inserted new game {nhl_game_id}: "
@@ -202,10 +229,21 @@ def ingest_schedule(start_date, end_date):
             break
         current_date = next_date
 
+    if schedule_teams:
+        n = update_schedule_context(cur, schedule_teams, schedule_seasons)
+        print(f"Updated {n} schedule-context rows for {len(schedule_teams)} teams.")
+
+    # Queued for the orchestrator (which loads the boxscores and refreshes
+    # the view) and delivered on commit to listeners such as the web app's cache
+    notify_games_final(cur, newly_final)
     conn.commit()
     cur.close()
     conn.close()
     print(f"Finished ingestion: {total_inserted} inserted, {total_updated} updated.")
+    ROWS_WRITTEN.labels("games").inc(total_inserted + total_updated)
+
+    LAST_SUCCESS.labels("ingest_schedule").set_to_current_time()
+    update_ingest_lag()
 
 
 # --------------------------
@@ -0,0 +1,236 @@
+"""
+Live polling of today's slate.
+
+One api-web /score/{date} request covers every game of the day. Each cycle
+sends If-None-Match / If-Modified-Since, skips a body identical to the last
+one, and only writes games whose state or score changed since the previous
+cycle. Games going final are announced the same way ingest_schedule does.
+
+The interval adapts to the slate: LIVE_INTERVAL while a game is in progress,
+PREGAME_INTERVAL shortly before the next puck drop, and a long sleep (capped
+at IDLE_INTERVAL) otherwise. The loop ends once no game is left to play.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import time
+from datetime import date, datetime, timezone
+
+from db import get_conn
+from events import ensure_event_tables, notify_games_final
+from ingest_game_schedule import ingest_schedule, map_game_state
+from metrics import GAMES_FETCHED, LAST_SUCCESS, ROWS_WRITTEN
+from nhl_api import SCORE_URL, get_client
+
+LIVE_INTERVAL = float(os.getenv("NHL_LIVE_INTERVAL", "15"))
+PREGAME_INTERVAL = float(os.getenv("NHL_PREGAME_INTERVAL", "60"))
+IDLE_INTERVAL = float(os.getenv("NHL_IDLE_INTERVAL", "900"))
+# Start the fast pre-game polling this long before the first puck drop
+PREGAME_WINDOW = 30 * 60
+
+UPCOMING_STATES = {"FUT", "PRE"}
+LIVE_STATES = {"LIVE", "CRIT"}
+FINAL_STATES = {"OFF", "FINAL"}
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------
+# Payload helpers
+# -------------------------------------------------
+
+def _start_time(game):
+    return datetime.strptime(game["startTimeUTC"], "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+
+
+def game_row(game):
+    """
+    (status, home_score, away_score) in the games table's terms.
+    """
+    state = game.get("gameState")
+    status = "final" if state in FINAL_STATES else map_game_state(state)
+    home = game["homeTeam"].get("score")
+    away = game["awayTeam"].get("score")
+    if status == "scheduled":
+        home = away = None
+    return status, home, away
+
+
+def next_interval(games, now=None):
+    """
+    Seconds until the next poll, or None once every game is over.
+    """
+    now = now or datetime.now(timezone.utc)
+    states = [g.get("gameState") for g in games]
+    if any(s in LIVE_STATES for s in states):
+        return LIVE_INTERVAL
+
+    upcoming = [_start_time(g) for g in games if g.get("gameState") in UPCOMING_STATES]
+    if not upcoming:
+        return None
+    wait = (min(upcoming) - now).total_seconds()
+    if wait <= PREGAME_WINDOW:
+        return PREGAME_INTERVAL
+    return min(IDLE_INTERVAL, wait - PREGAME_WINDOW)
+
+# -------------------------------------------------
+# Poller
+# -------------------------------------------------
+
+class LivePoller:
+    """
+    Keeps the last seen validators, body hash and per-game rows between
+    cycles so unchanged data costs one 304 (or one hash compare) and no
+    database round trip.
+    """
+
+    def __init__(self, day):
+        self.day = day
+        self.url = f"{SCORE_URL}/{day}"
+        self.validators = {}
+        self.body_hash = None
+        self.games = []
+        self.known = None
+        self.missing_checked = False
+
+    def fetch(self):
+        """
+        Current games, or None if nothing changed upstream.
+        """
+        resp = get_client().get_if_changed(self.url, endpoint="score", validators=self.validators)
+        if resp is None:
+            return None
+        body_hash = hashlib.sha1(resp.content).hexdigest()
+        if body_hash == self.body_hash:
+            return None
+        self.body_hash = body_hash
+        self.games = resp.json().get("games", [])
+        GAMES_FETCHED.labels("ingest_live").inc(len(self.games))
+        return self.games
+
+    def load_known(self, games):
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT nhl_game_id, status, home_score, away_score
+            FROM games
+            WHERE nhl_game_id = ANY(%s)
+        """, ([g["id"] for g in games],))
+        self.known = {
+            r["nhl_game_id"]: (r["status"], r["home_score"], r["away_score"])
+            for r in cur.fetchall()
+        }
+        cur.close()
+        conn.close()
+
+    def changed_games(self, games):
+        changes = []
+        for g in games:
+            prev = self.known.get(g["id"])
+            row = game_row(g)
+            if prev is not None and prev[0] != "final" and row != prev:
+                changes.append((g["id"], row))
+        return changes
+
+    def poll_once(self):
+        """
+        One cycle. Returns the number of game rows written.
+        """
+        games = self.fetch()
+        if games is None:
+            return 0
+
+        if self.known is None or any(g["id"] not in self.known for g in games):
+            self.load_known(games)
+            missing = [g["id"] for g in games if g["id"] not in self.known]
+            if missing and not self.missing_checked:
+                # Not ingested yet: pick them up from the schedule once
+                self.missing_checked = True
+                logger.info(f"{len(missing)} game(s) not in the database; ingesting {self.day}")
+                ingest_schedule(self.day, self.day)
+                self.load_known(games)
+            # Anything still missing is ignored rather than re-queried every cycle
+            for g in games:
+                self.known.setdefault(g["id"], None)
+
+        return self.write(self.changed_games(games))
+
+    def write(self, changes):
+        if not changes:
+            return 0
+
+        conn = get_conn()
+        cur = conn.cursor()
+        newly_final = []
+        for nhl_game_id, (status, home_score, away_score) in changes:
+            cur.execute("""
+                UPDATE games
+                SET status = %s, home_score = %s, away_score = %s
+                WHERE nhl_game_id = %s AND status <> 'final'
+                RETURNING id, home_team_id, away_team_id
+            """, (status, home_score, away_score, nhl_game_id))
+            row = cur.fetchone()
+            if row and status == "final":
+                newly_final.append((row["id"], row["home_team_id"], row["away_team_id"]))
+            self.known[nhl_game_id] = (status, home_score, away_score)
+            print(f"Game {nhl_game_id}: {status} {away_score}-{home_score}")
+
+        # The orchestrator picks the finals up and refreshes the view
+        notify_games_final(cur, newly_final)
+        conn.commit()
+        cur.close()
+        conn.close()
+        ROWS_WRITTEN.labels("games").inc(len(changes))
+        return len(changes)
+
+
+def poll_live(day=None, once=False):
+    """
+    Poll `day` (default today) until its slate is over.
+    """
+    day = day or date.today().isoformat()
+    poller = LivePoller(day)
+
+    conn = get_conn()
+    cur = conn.cursor()
+    ensure_event_tables(cur)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    cycles = written = 0
+    while True:
+        start = time.perf_counter()
+        n = poller.poll_once()
+        cycles += 1
+        written += n
+        LAST_SUCCESS.labels("ingest_live").set_to_current_time()
+
+        interval = next_interval(poller.games)
+        logger.info(
+            f"Cycle {cycles}: {n} game(s) written in {time.perf_counter() - start:.2f}s; "
+            + (f"next poll in {interval:.0f}s" if interval is not None else "slate finished")
+        )
+        if once or interval is None:
+            break
+        time.sleep(interval)
+
+    print(f"Finished live polling for {day}: {cycles} cycles, {written} game updates.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll today's games while they are played")
+    parser.add_argument("--date", help="YYYY-MM-DD (default: today)")
+    parser.add_argument("--once", action="store_true", help="run a single cycle")
+    args = parser.parse_args(argv)
+    poll_live(args.date, args.once)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
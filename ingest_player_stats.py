@@ -1,41 +1,28 @@
-import os
 import requests
 import logging
 from datetime import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
-from dotenv import load_dotenv
+from db import get_uri_engine
+from metrics import GAMES_FETCHED, LAST_SUCCESS, ROWS_WRITTEN, update_ingest_lag
+from nhl_api import BOXSCORE_URL, SCHEDULE_URL, get_client
 
-# Load .env variables
-load_dotenv()
-DB_URI = os.getenv("DB_URI")
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
-
-# API URLs
-SCHEDULE_URL = "https://api-web.nhle.com/v1/schedule"
-BOXSCORE_URL = "https://api-web.nhle.com/v1/gamecenter/{game_id}/boxscore"
-
-# Database engine
-engine = create_engine(DB_URI, echo=False)
+def get_engine():
+    # Database engine, created from DB_URI on first use
+    return get_uri_engine("DB_URI", echo=False)
 
 def get_games_to_ingest():
     """Fetch all games from NHL schedule that are FINAL and not already in the database."""
     try:
-        response = requests.get(SCHEDULE_URL)
-        response.raise_for_status()
-        schedule = response.json()
+        schedule = get_client().get_json(SCHEDULE_URL, endpoint="schedule")
     except requests.RequestException as e:
         logging.error(f"Failed to fetch schedule: {e}")
         return []
 
     games_to_ingest = []
 
-    with engine.connect() as conn:
+    with get_engine().connect() as conn:
         for date_info in schedule.get("dates", []):
             for game in date_info.get("games", []):
                 nhl_game_id = game["id"]
@@ -57,9 +44,9 @@ def get_games_to_ingest():
 def fetch_boxscore(game_id):
     """Fetch boxscore data for a specific game."""
     try:
-        response = requests.get(BOXSCORE_URL.format(game_id=game_id))
-        response.raise_for_status()
-        return response.json()
+        return get_client().get_json(
+            BOXSCORE_URL.format(game_id=game_id), endpoint="boxscore"
+        )
     except requests.RequestException as e:
         logging.error(f"Failed to fetch boxscore for game {game_id}: {e}")
         return None
@@ -115,6 +102,99 @@ def insert_defense_stats(conn, game_id, season, team_id, defense_players):
             "toi": player.get("toi", None)
         }
         conn.execute(stmt, params)
+    ROWS_WRITTEN.labels("team_game_defense").inc(len(defense_players))
+
+PLAYER_STATS_COLS = [
+    "player_id", "game_id", "team_id", "goals", "assists",
+    "points", "shots", "hits", "time_on_ice",
+]
+
+
+def boxscore_player_rows(box, game_id, home_team_id, away_team_id):
+    """
+    (players, player_stats) rows of a gamecenter boxscore for games.id
+    `game_id`: players maps id -> (id, team_id, full_name, position), stats
+    is a list of PLAYER_STATS_COLS dicts. Goalie rows carry goals/shots
+    against, which build_team_game_stats reads as goals_against/shots_against.
+    """
+    players = {}
+    stats = []
+    for side, team_id in (("homeTeam", home_team_id), ("awayTeam", away_team_id)):
+        lines = box.get("playerByGameStats", {}).get(side, {})
+        for p in lines.get("forwards", []) + lines.get("defense", []):
+            players[p["playerId"]] = (p["playerId"], team_id, p["name"]["default"], p["position"])
+            stats.append({
+                "player_id": p["playerId"], "game_id": game_id, "team_id": team_id,
+                "goals": p.get("goals", 0), "assists": p.get("assists", 0),
+                "points": p.get("points", 0), "shots": p.get("sog", 0), "hits": p.get("hits", 0),
+                "time_on_ice": p.get("toi", "00:00"),
+            })
+        for p in lines.get("goalies", []):
+            players[p["playerId"]] = (p["playerId"], team_id, p["name"]["default"], "G")
+            stats.append({
+                "player_id": p["playerId"], "game_id": game_id, "team_id": team_id,
+                "goals": p.get("goalsAgainst", 0), "assists": 0, "points": 0,
+                "shots": p.get("shotsAgainst", 0), "hits": 0,
+                "time_on_ice": p.get("toi", "00:00"),
+            })
+    return players, stats
+
+
+def upsert_player_stats(bind, game_ids):
+    """
+    Fetch the boxscores of games (games.id) and upsert their players and
+    player_stats rows in one transaction. Raises if a boxscore can't be
+    fetched, so a caller retrying the batch loses nothing.
+    """
+    from psycopg2.extras import execute_values
+
+    with bind.connect() as conn:
+        games = conn.execute(text("""
+            SELECT id, nhl_game_id, home_team_id, away_team_id
+            FROM public.games
+            WHERE id = ANY(:ids)
+        """), {"ids": list(game_ids)}).all()
+
+    players, stats = {}, []
+    for game_id, nhl_game_id, home_id, away_id in games:
+        box = fetch_boxscore(nhl_game_id)
+        if not box:
+            raise RuntimeError(f"boxscore unavailable for game {nhl_game_id}")
+        GAMES_FETCHED.labels("player_stats").inc()
+        game_players, game_stats = boxscore_player_rows(box, game_id, home_id, away_id)
+        players.update(game_players)
+        stats.extend(game_stats)
+    if not stats:
+        return 0
+
+    conn = bind.raw_connection()
+    try:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO public.players (id, team_id, full_name, position)
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE
+            SET team_id = EXCLUDED.team_id,
+                full_name = EXCLUDED.full_name,
+                position = EXCLUDED.position
+            WHERE (players.team_id, players.full_name, players.position)
+                IS DISTINCT FROM (EXCLUDED.team_id, EXCLUDED.full_name, EXCLUDED.position)
+        """, list(players.values()))
+        execute_values(cur, f"""
+            INSERT INTO public.player_stats ({', '.join(PLAYER_STATS_COLS)})
+            VALUES %s
+            ON CONFLICT (player_id, game_id) DO UPDATE
+            SET team_id = EXCLUDED.team_id, goals = EXCLUDED.goals,
+                assists = EXCLUDED.assists, points = EXCLUDED.points,
+                shots = EXCLUDED.shots, hits = EXCLUDED.hits,
+                time_on_ice = EXCLUDED.time_on_ice
+        """, [tuple(r[c] for c in PLAYER_STATS_COLS) for r in stats], page_size=1000)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    ROWS_WRITTEN.labels("player_stats").inc(len(stats))
+    return len(stats)
 
 def ingest_all_games():
     games = get_games_to_ingest()
@@ -130,9 +210,10 @@ def ingest_all_games():
         if not boxscore:
             logging.warning(f"Skipping game {game_id} due to fetch failure")
             continue
+        GAMES_FETCHED.labels("ingest_player_stats").inc()
 
         try:
-            with engine.begin() as conn:  # transaction per game
+            with get_engine().begin() as conn:  # transaction per game
                 for team_key in ["homeTeam", "awayTeam"]:
                     team_info = boxscore.get(team_key)
                     if not team_info:
@@ -146,5 +227,13 @@ def ingest_all_games():
         except SQLAlchemyError as e:
             logging.error(f"Failed to ingest game {game_id}: {e}")
 
+    LAST_SUCCESS.labels("ingest_player_stats").set_to_current_time()
+    update_ingest_lag(get_engine())
+
 if __name__ == "__main__":
+    # Set up logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
     ingest_all_games()
@@ -0,0 +1,187 @@
+"""
+Per-stage timing for batch jobs.
+
+    with run("team_vs_opponent"):
+        with stage("load games") as s:
+            games = s.out(pd.read_sql(...))
+        with stage("merge", rows_in=len(games)) as s:
+            df = s.out(games.merge(...))
+
+Each stage records wall time, rows in/out and the tracemalloc peak; the
+run writes a JSON report to NHL_REPORT_DIR when it finishes. Set
+NHL_PROFILE=cprofile or NHL_PROFILE=pyinstrument to also save a profile of
+the whole run next to the report, and NHL_TRACEMALLOC=0 to skip memory
+tracing (it slows allocation-heavy code down noticeably).
+"""
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_DIR = os.getenv("NHL_REPORT_DIR", "run_reports")
+PROFILE = os.getenv("NHL_PROFILE", "").lower()
+TRACE_MEMORY = os.getenv("NHL_TRACEMALLOC", "1") != "0"
+
+_run = None
+_stack = []
+
+
+class Stage:
+    def __init__(self, name, rows_in=None, depth=0):
+        self.name = name
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.peak_mb = None
+        self._peak = 0
+
+    def out(self, obj):
+        """
+        Record len(obj) as the stage's output rows and pass obj through.
+        """
+        self.rows_out = len(obj)
+        return obj
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "depth": self.depth,
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "peak_mb": round(self.peak_mb, 1) if self.peak_mb is not None else None,
+        }
+
+
+class Run:
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.started = datetime.now()
+        self.seconds = None
+        self.profile_path = None
+
+    def report(self):
+        return {
+            "run": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "tracemalloc": TRACE_MEMORY,
+            "profile": self.profile_path,
+            "stages": [s.as_dict() for s in self.stages],
+        }
+
+    def _path(self, suffix):
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        return os.path.join(REPORT_DIR, f"{self.name}_{self.started:%Y%m%dT%H%M%S}{suffix}")
+
+    def write(self):
+        path = self._path(".json")
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"[stage] report written to {path}")
+        return path
+
+
+@contextmanager
+def _profiler(current):
+    if PROFILE == "cprofile":
+        import cProfile
+
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            current.profile_path = current._path(".prof")
+            prof.dump_stats(current.profile_path)
+    elif PROFILE == "pyinstrument":
+        from pyinstrument import Profiler
+
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            current.profile_path = current._path(".html")
+            with open(current.profile_path, "w") as f:
+                f.write(prof.output_html())
+    else:
+        yield
+
+
+@contextmanager
+def run(name):
+    """
+    Collect the stages of one job and write its report at the end.
+    Nested runs (a script's main() under `nhl.py`) fold into the outer run
+    as a single stage.
+    """
+    global _run
+    if _run is not None:
+        with stage(name):
+            yield _run
+        return
+
+    current = Run(name)
+    _run = current
+    started_tracing = TRACE_MEMORY and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with _profiler(current):
+            yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        if started_tracing:
+            tracemalloc.stop()
+        _run = None
+        # Commands without instrumented stages (e.g. `nhl health`) leave no report
+        if current.stages:
+            current.write()
+
+
+def _fmt(n):
+    return "-" if n is None else n
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Time one named stage. Works outside a run too (it just prints).
+    """
+    s = Stage(name, rows_in, depth=len(_stack))
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # The outer stage keeps its own peak before we reset the counter
+        if _stack:
+            _stack[-1]._peak = max(_stack[-1]._peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+
+    _stack.append(s)
+    start = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.seconds = time.perf_counter() - start
+        _stack.pop()
+        if tracing:
+            s._peak = max(s._peak, tracemalloc.get_traced_memory()[1])
+            s.peak_mb = (s._peak - base) / 2**20
+            if _stack:
+                _stack[-1]._peak = max(_stack[-1]._peak, s._peak)
+        if _run is not None:
+            _run.stages.append(s)
+
+        rows = ""
+        if s.rows_in is not None or s.rows_out is not None:
+            rows = f", rows {_fmt(s.rows_in)} -> {_fmt(s.rows_out)}"
+        peak = f", peak {s.peak_mb:.1f} MiB" if s.peak_mb is not None else ""
+        print(f"[stage] {name}: {s.seconds:.3f}s{rows}{peak}")
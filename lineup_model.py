@@ -0,0 +1,348 @@
+"""
+Player lineup model on player_stats.
+
+Each team-game is the sparse vector of the players who dressed, weighted by
+time on ice in full games (a 20-minute skater is 1/3, a goalie who plays
+the whole game is 1). Goals scored by the team are then
+
+    log(mu) = base + home + lineup @ offense - opp_lineup @ defense
+
+so offense[p] / defense[p] is a player's impact per 60 minutes on ice. The
+opponent block is the same CSR matrix with its rows permuted, and the ridge
+penalty pulls rarely seen players to zero (average). With thousands of
+players the Hessian no longer fits in memory densely, so the weighted
+likelihood is minimized by L-BFGS using sparse products only; games decay
+with strength_model.XI. Scoring a changed lineup is one sparse dot product.
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import minimize
+from sqlalchemy import text
+
+from instrument import run, stage
+from scorer import MODEL_DIR
+from strength_model import XI, decay_weights
+from team_vs_opponent import toi_to_minutes
+
+MODEL_FILE = "lineup_model.npz"
+
+# Ridge per player term, in games of weight; shrinks part-timers to average
+RIDGE = 50.0
+MAX_ITER = 500
+# Lineups for upcoming games average this many of each player's recent games
+RECENT_GAMES = 5
+
+logger = logging.getLogger(__name__)
+
+LINEUP_SQL = """
+    SELECT
+        ps.game_id,
+        g.game_date AS date,
+        g.season,
+        ps.team_id,
+        CASE WHEN ps.team_id = g.home_team_id THEN g.away_team_id ELSE g.home_team_id END AS opp_team_id,
+        (ps.team_id = g.home_team_id) AS is_home,
+        ps.player_id,
+        p.position,
+        ps.goals,
+        ps.time_on_ice
+    FROM public.player_stats ps
+    JOIN public.games g ON ps.game_id = g.id
+    JOIN public.players p ON ps.player_id = p.id
+    WHERE g.status = 'final'
+      AND g.season >= :min_season
+"""
+
+# -------------------------------------------------
+# Design
+# -------------------------------------------------
+
+def load_lineups(bind, min_season=0):
+    with bind.connect() as conn:
+        return pd.read_sql(text(LINEUP_SQL), conn, params={"min_season": min_season})
+
+
+def team_games(ps):
+    """
+    One row per team-game with both sides present, date-sorted so the
+    first k games are the first 2k rows.
+    """
+    tg = ps.drop_duplicates(["game_id", "team_id"])[
+        ["game_id", "date", "season", "team_id", "opp_team_id", "is_home"]
+    ]
+    tg = tg.sort_values(["date", "game_id", "is_home"], ascending=[True, True, False])
+    both = tg.groupby("game_id")["team_id"].transform("size") == 2
+    return tg[both].reset_index(drop=True)
+
+
+def lineup_matrix(ps, tg, player_ids):
+    """
+    CSR (team-games, players) of minutes / 60, rows aligned with `tg`.
+    Players not in `player_ids` are dropped.
+    """
+    index = pd.MultiIndex.from_frame(tg[["game_id", "team_id"]])
+    rows = index.get_indexer(pd.MultiIndex.from_frame(ps[["game_id", "team_id"]]))
+    cols = np.searchsorted(player_ids, ps["player_id"].to_numpy())
+    cols = np.minimum(cols, len(player_ids) - 1)
+    keep = (rows >= 0) & (player_ids[cols] == ps["player_id"].to_numpy())
+    minutes = toi_to_minutes(ps["time_on_ice"]).to_numpy(dtype="float64")
+    return sp.csr_matrix(
+        (minutes[keep] / 60, (rows[keep], cols[keep])), shape=(len(tg), len(player_ids))
+    )
+
+
+def opponent_rows(tg):
+    index = pd.MultiIndex.from_frame(tg[["game_id", "team_id"]])
+    return index.get_indexer(pd.MultiIndex.from_arrays([tg["game_id"], tg["opp_team_id"]]))
+
+
+def design(L, opp, is_home):
+    """
+    [base, home, offense[0..P), defense[0..P)] for rows of lineup matrix L;
+    the defense block is the opponent's lineup, negated.
+    """
+    n = L.shape[0]
+    fixed = sp.csr_matrix(np.column_stack([np.ones(n), np.asarray(is_home, dtype="float64")]))
+    return sp.hstack([fixed, L, -L[opp]], format="csr")
+
+
+def team_goals(ps, tg):
+    """
+    Skater goals per team-game (goalie rows carry goals against).
+    """
+    index = pd.MultiIndex.from_frame(tg[["game_id", "team_id"]])
+    rows = index.get_indexer(pd.MultiIndex.from_frame(ps[["game_id", "team_id"]]))
+    skater = (ps["position"] != "G").to_numpy() & (rows >= 0)
+    return np.bincount(rows[skater], weights=ps["goals"].to_numpy()[skater], minlength=len(tg))
+
+# -------------------------------------------------
+# Fit
+# -------------------------------------------------
+
+def fit_poisson(X, y, w, beta0=None, ridge=RIDGE, max_iter=MAX_ITER):
+    """
+    Weighted, ridge-penalized Poisson regression by L-BFGS. The base and
+    home terms are not penalized. Returns (beta, iterations).
+    """
+    k = X.shape[1]
+    penalty = np.full(k, ridge)
+    penalty[:2] = 0.0
+    XT = X.T.tocsr()
+    if beta0 is None:
+        beta0 = np.zeros(k)
+        beta0[0] = np.log(max(np.average(y, weights=w), 1e-6))
+
+    def objective(beta):
+        eta = X @ beta
+        mu = np.exp(eta)
+        loss = -np.sum(w * (y * eta - mu)) + 0.5 * np.sum(penalty * beta ** 2)
+        grad = -(XT @ (w * (y - mu))) + penalty * beta
+        return loss, grad
+
+    res = minimize(objective, beta0, jac=True, method="L-BFGS-B",
+                   options={"maxiter": max_iter, "gtol": 1e-6})
+    if not res.success:
+        logger.warning(f"L-BFGS stopped early: {res.message}")
+    return res.x, res.nit
+
+
+def fit(ps, as_of=None, xi=XI, ridge=RIDGE, warm=None):
+    """
+    Fit on player_stats rows of final games before `as_of`. `warm` is a
+    previous params dict to start from.
+    """
+    as_of = pd.Timestamp(as_of or pd.to_datetime(ps["date"]).max() + pd.Timedelta(days=1))
+    ps = ps[pd.to_datetime(ps["date"]) < as_of]
+    tg = team_games(ps)
+    player_ids = np.unique(ps["player_id"].to_numpy())
+
+    L = lineup_matrix(ps, tg, player_ids)
+    X = design(L, opponent_rows(tg), tg["is_home"])
+    y = team_goals(ps, tg)
+    w = decay_weights(tg["date"], as_of, xi)
+    beta, iters = fit_poisson(X, y, w, _warm_beta(warm, player_ids) if warm else None, ridge)
+
+    p = len(player_ids)
+    return {
+        "as_of": as_of.isoformat(),
+        "xi": xi,
+        "ridge": ridge,
+        "base": float(beta[0]),
+        "home": float(beta[1]),
+        "player_ids": player_ids,
+        "offense": beta[2:2 + p],
+        "defense": beta[2 + p:],
+        "games": len(tg) // 2,
+        "nnz": X.nnz,
+        "iterations": iters,
+    }
+
+
+def _warm_beta(params, player_ids):
+    p = len(player_ids)
+    beta = np.zeros(2 + 2 * p)
+    beta[0], beta[1] = params["base"], params["home"]
+    old = np.searchsorted(params["player_ids"], player_ids)
+    old = np.minimum(old, len(params["player_ids"]) - 1)
+    seen = params["player_ids"][old] == player_ids
+    beta[2:2 + p][seen] = params["offense"][old[seen]]
+    beta[2 + p:][seen] = params["defense"][old[seen]]
+    return beta
+
+# -------------------------------------------------
+# Score
+# -------------------------------------------------
+
+def lineup_vector(params, lineup):
+    """
+    Sparse (1, players) row for a lineup given as {player_id: minutes};
+    players the model hasn't seen are left out (average impact).
+    """
+    ids = params["player_ids"]
+    pid = np.fromiter(lineup.keys(), dtype=ids.dtype, count=len(lineup))
+    minutes = np.fromiter(lineup.values(), dtype="float64", count=len(lineup))
+    cols = np.minimum(np.searchsorted(ids, pid), len(ids) - 1)
+    keep = ids[cols] == pid
+    return sp.csr_matrix(
+        (minutes[keep] / 60, (np.zeros(keep.sum(), dtype=int), cols[keep])), shape=(1, len(ids))
+    )
+
+
+def expected_goals(params, L, L_opp, is_home):
+    """
+    Expected goals for lineup rows L against L_opp (both CSR over the
+    model's players, e.g. stacked lineup_vector rows).
+    """
+    eta = params["base"] + params["home"] * np.asarray(is_home, dtype="float64")
+    return np.exp(eta + L @ params["offense"] - L_opp @ params["defense"])
+
+
+def predict_game(params, home_lineup, away_lineup):
+    """
+    (home_mu, away_mu) for two {player_id: minutes} lineups.
+    """
+    h, a = lineup_vector(params, home_lineup), lineup_vector(params, away_lineup)
+    return float(expected_goals(params, h, a, 1)[0]), float(expected_goals(params, a, h, 0)[0])
+
+
+def recent_lineups(ps, n_games=RECENT_GAMES):
+    """
+    {team_id: {player_id: minutes}}: who dressed in each team's latest game,
+    at their average minutes over their last `n_games` for that team.
+    """
+    ps = ps.assign(minutes=toi_to_minutes(ps["time_on_ice"]).astype("float64"))
+    ps = ps.sort_values(["date", "game_id"])
+    last_game = ps.groupby("team_id")["game_id"].transform("last")
+    dressed = ps.loc[ps["game_id"] == last_game, ["team_id", "player_id"]]
+    recent = ps.groupby(["team_id", "player_id"]).tail(n_games)
+    minutes = recent.groupby(["team_id", "player_id"])["minutes"].mean()
+    dressed = dressed.join(minutes, on=["team_id", "player_id"])
+    return {
+        int(team): dict(zip(g["player_id"].astype(int), g["minutes"]))
+        for team, g in dressed.groupby("team_id")
+    }
+
+
+def evaluate(params, ps):
+    """
+    Goals MAE and mean Poisson deviance of `params` on the team-games of
+    `ps`, next to a constant league-average baseline.
+    """
+    tg = team_games(ps)
+    L = lineup_matrix(ps, tg, params["player_ids"])
+    mu = expected_goals(params, L, L[opponent_rows(tg)], tg["is_home"])
+    y = team_goals(ps, tg)
+    base = np.full_like(mu, np.exp(params["base"]))
+
+    def deviance(m):
+        ratio = np.where(y > 0, y / m, 1.0)
+        return float(np.mean(2 * (y * np.log(ratio) - (y - m))))
+
+    return {
+        "team_games": len(tg),
+        "goals_mae": float(np.mean(np.abs(mu - y))),
+        "baseline_mae": float(np.mean(np.abs(base - y))),
+        "deviance": deviance(mu),
+        "baseline_deviance": deviance(base),
+    }
+
+# -------------------------------------------------
+# Persistence
+# -------------------------------------------------
+
+def model_path():
+    return os.path.join(MODEL_DIR, MODEL_FILE)
+
+
+def load_params():
+    path = model_path()
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        params = json.loads(str(data["meta"]))
+        for key in ("player_ids", "offense", "defense"):
+            params[key] = data[key]
+    return params
+
+
+def save_params(params):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    arrays = {key: params[key] for key in ("player_ids", "offense", "defense")}
+    meta = {k: v for k, v in params.items() if k not in arrays}
+    meta["created_at"] = datetime.now(timezone.utc).isoformat()
+    tmp = model_path() + ".tmp.npz"
+    np.savez(tmp, meta=json.dumps(meta), **arrays)
+    os.replace(tmp, model_path())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sparse player lineup model")
+    parser.add_argument("--min-season", type=int, default=0, help="first season to load, e.g. 20202021")
+    parser.add_argument("--ridge", type=float, default=RIDGE, help="L2 penalty per player term")
+    parser.add_argument("--xi", type=float, default=XI, help="daily time-decay rate")
+    parser.add_argument("--cold", action="store_true", help="ignore the saved parameters")
+    parser.add_argument("--holdout", metavar="DATE",
+                        help="fit on games before DATE (YYYY-MM-DD) and score the rest instead of fitting")
+    args = parser.parse_args(argv)
+
+    from db import get_engine
+
+    with run("lineup_model"):
+        with stage("load lineups") as s:
+            ps = s.out(load_lineups(get_engine(), args.min_season))
+
+        if args.holdout:
+            cutoff = pd.Timestamp(args.holdout)
+            test = ps[pd.to_datetime(ps["date"]) >= cutoff]
+            if test.empty:
+                raise SystemExit(f"No final games on or after {args.holdout}")
+            with stage("fit", rows_in=len(ps) - len(test)):
+                params = fit(ps, as_of=cutoff, xi=args.xi, ridge=args.ridge)
+            print(json.dumps(evaluate(params, test), indent=2))
+            return
+
+        warm = None if args.cold else load_params()
+        with stage("fit", rows_in=len(ps)):
+            params = fit(ps, as_of=date.today(), xi=args.xi, ridge=args.ridge, warm=warm)
+        save_params(params)
+
+    print(
+        f"Fitted {len(params['player_ids'])} players on {params['games']} games "
+        f"({params['nnz']} non-zeros) in {params['iterations']} L-BFGS steps "
+        f"({'warm' if warm else 'cold'}): home {params['home']:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
@@ -0,0 +1,144 @@
+from sqlalchemy import text
+
+# -------------------------------------------------
+# Minimal schema for a scratch database
+#
+# Only the tables and columns the ingesters, feature
+# builders and the materialized view touch, so a local
+# Postgres can be used for benchmarks and scale tests.
+# -------------------------------------------------
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.teams (
+        id SERIAL PRIMARY KEY,
+        name TEXT,
+        abbreviation TEXT UNIQUE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.players (
+        id INTEGER PRIMARY KEY,
+        team_id INTEGER,
+        full_name TEXT,
+        position TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.games (
+        id SERIAL PRIMARY KEY,
+        nhl_game_id BIGINT UNIQUE,
+        season INTEGER,
+        game_date TIMESTAMP,
+        home_team_id INTEGER REFERENCES public.teams (id),
+        away_team_id INTEGER REFERENCES public.teams (id),
+        home_score INTEGER,
+        away_score INTEGER,
+        status TEXT,
+        venue TEXT,
+        game_type INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.player_stats (
+        player_id INTEGER,
+        game_id INTEGER,
+        team_id INTEGER,
+        goals INTEGER,
+        assists INTEGER,
+        points INTEGER,
+        shots INTEGER,
+        hits INTEGER,
+        time_on_ice TEXT,
+        PRIMARY KEY (player_id, game_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.team_game_defense (
+        game_id BIGINT,
+        season INTEGER,
+        team_id INTEGER,
+        player_id INTEGER,
+        name TEXT,
+        position TEXT,
+        goals INTEGER,
+        assists INTEGER,
+        points INTEGER,
+        plus_minus INTEGER,
+        pim INTEGER,
+        hits INTEGER,
+        blocked_shots INTEGER,
+        shifts INTEGER,
+        giveaways INTEGER,
+        takeaways INTEGER,
+        toi TEXT,
+        PRIMARY KEY (game_id, player_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.team_vs_opponent (
+        game_id INTEGER,
+        team_id INTEGER,
+        team_abbrev TEXT,
+        home_away TEXT,
+        opp_team_id INTEGER,
+        opp_abbrev TEXT,
+        goals REAL,
+        goals_against REAL,
+        shots REAL,
+        hits REAL,
+        points REAL,
+        opp_goals REAL,
+        opp_shots REAL,
+        opp_hits REAL,
+        opp_points REAL,
+        goals_last5 REAL,
+        goals_against_last5 REAL,
+        shots_last5 REAL,
+        hits_last5 REAL,
+        points_last5 REAL,
+        PRIMARY KEY (game_id, team_id)
+    )
+    """,
+]
+
+DATA_TABLES = [
+    "pbp_team_games",
+    "pbp_events",
+    "schedule_context",
+    "matchup_index",
+    "team_rating_history",
+    "team_ratings",
+    "team_vs_opponent",
+    "team_game_defense",
+    "player_stats",
+    "players",
+    "games",
+    "teams",
+]
+
+
+def create_schema(bind):
+    from elo import ensure_rating_tables
+    from events import ensure_event_tables
+    from matchups import ensure_matchup_tables
+    from play_by_play import ensure_pbp_tables
+    from schedule_context import ensure_schedule_tables
+    from team_vs_opponent_view import create_team_vs_opponent_view
+
+    with bind.begin() as conn:
+        for stmt in SCHEMA_SQL:
+            conn.execute(text(stmt))
+        ensure_event_tables(conn)
+        ensure_rating_tables(conn)
+        ensure_matchup_tables(conn)
+        ensure_schedule_tables(conn)
+        ensure_pbp_tables(conn)
+    create_team_vs_opponent_view(bind)
+
+
+def truncate_tables(bind, tables=DATA_TABLES):
+    with bind.begin() as conn:
+        conn.execute(text(
+            f"TRUNCATE {', '.join('public.' + t for t in tables)} RESTART IDENTITY CASCADE"
+        ))
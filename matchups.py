@@ -0,0 +1,263 @@
+"""
+Head-to-head matchup index.
+
+public.matchup_index holds one row per final game keyed by the unordered
+team pair (team_lo < team_hi) and date, with both sides' goals and shots.
+"Last N meetings of A and B before a date" is then a backward range scan of
+the primary key: O(log n + N) per pair, however long the history. Slates
+and training frames get their head-to-head features the same way, one
+LATERAL index scan per team-game.
+
+Rows are upserted per batch of newly final games, so re-delivered events
+are harmless. Games indexed before their player_stats (shots) arrived are
+indexed again by every catch-up run (index_games() without ids), which the
+orchestrator does at startup and hourly.
+"""
+import argparse
+import json
+import logging
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from db import fetch_dicts
+
+# Meetings averaged into the pre-game features
+N_MEETINGS = 5
+
+logger = logging.getLogger(__name__)
+
+MATCHUP_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.matchup_index (
+        team_lo INTEGER NOT NULL,
+        team_hi INTEGER NOT NULL,
+        date TIMESTAMP NOT NULL,
+        game_id INTEGER NOT NULL,
+        season INTEGER,
+        home_team_id INTEGER NOT NULL,
+        lo_goals INTEGER NOT NULL,
+        hi_goals INTEGER NOT NULL,
+        lo_shots INTEGER,
+        hi_shots INTEGER,
+        PRIMARY KEY (team_lo, team_hi, date, game_id)
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS matchup_index_game_idx
+    ON public.matchup_index (game_id)
+    """,
+]
+
+# Final games (optionally filtered) as index rows; {where} is appended
+INDEX_ROWS_SQL = """
+    WITH team_shots AS (
+        SELECT ps.game_id, ps.team_id,
+               SUM(ps.shots) FILTER (WHERE p.position IS DISTINCT FROM 'G') AS shots
+        FROM public.player_stats ps
+        JOIN public.players p ON ps.player_id = p.id
+        WHERE ps.game_id IN (SELECT id FROM public.games g WHERE TRUE {where})
+        GROUP BY ps.game_id, ps.team_id
+    )
+    INSERT INTO public.matchup_index
+        (team_lo, team_hi, date, game_id, season, home_team_id,
+         lo_goals, hi_goals, lo_shots, hi_shots)
+    SELECT
+        LEAST(g.home_team_id, g.away_team_id),
+        GREATEST(g.home_team_id, g.away_team_id),
+        g.game_date,
+        g.id,
+        g.season,
+        g.home_team_id,
+        CASE WHEN g.home_team_id < g.away_team_id THEN g.home_score ELSE g.away_score END,
+        CASE WHEN g.home_team_id < g.away_team_id THEN g.away_score ELSE g.home_score END,
+        CASE WHEN g.home_team_id < g.away_team_id THEN hs.shots ELSE aw.shots END,
+        CASE WHEN g.home_team_id < g.away_team_id THEN aw.shots ELSE hs.shots END
+    FROM public.games g
+    LEFT JOIN team_shots hs ON hs.game_id = g.id AND hs.team_id = g.home_team_id
+    LEFT JOIN team_shots aw ON aw.game_id = g.id AND aw.team_id = g.away_team_id
+    WHERE g.status = 'final'
+      AND g.home_score IS NOT NULL AND g.away_score IS NOT NULL
+      {where}
+    ON CONFLICT (game_id) DO UPDATE
+    SET team_lo = EXCLUDED.team_lo, team_hi = EXCLUDED.team_hi, date = EXCLUDED.date,
+        season = EXCLUDED.season, home_team_id = EXCLUDED.home_team_id,
+        lo_goals = EXCLUDED.lo_goals, hi_goals = EXCLUDED.hi_goals,
+        lo_shots = EXCLUDED.lo_shots, hi_shots = EXCLUDED.hi_shots
+"""
+
+# One side's view of a meeting, for :team against :opp
+_PERSPECTIVE = """
+    m.game_id, m.date, m.season, (m.home_team_id = {team}) AS home,
+    CASE WHEN {team} = m.team_lo THEN m.lo_goals ELSE m.hi_goals END AS goals_for,
+    CASE WHEN {team} = m.team_lo THEN m.hi_goals ELSE m.lo_goals END AS goals_against,
+    CASE WHEN {team} = m.team_lo THEN m.lo_shots ELSE m.hi_shots END AS shots_for,
+    CASE WHEN {team} = m.team_lo THEN m.hi_shots ELSE m.lo_shots END AS shots_against
+"""
+
+# DB-API (psycopg2) parameters, so the app can run it on its pooled connections
+LAST_MEETINGS_SQL = f"""
+    SELECT {_PERSPECTIVE.format(team="%(team)s")}
+    FROM public.matchup_index m
+    WHERE m.team_lo = LEAST(%(team)s, %(opp)s) AND m.team_hi = GREATEST(%(team)s, %(opp)s)
+      AND m.date < %(before)s
+    ORDER BY m.date DESC, m.game_id DESC
+    LIMIT %(n)s
+"""
+
+H2H_FEATURES_SQL = f"""
+    SELECT
+        g.id AS game_id,
+        t.team_id,
+        COUNT(h.game_id) AS h2h_games,
+        AVG(h.goals_for) AS h2h_goals_for,
+        AVG(h.goals_against) AS h2h_goals_against,
+        AVG(h.shots_for) AS h2h_shots_for,
+        AVG(h.shots_against) AS h2h_shots_against,
+        AVG((h.goals_for > h.goals_against)::int) AS h2h_win_pct
+    FROM public.games g
+    CROSS JOIN LATERAL (
+        VALUES (g.home_team_id, g.away_team_id), (g.away_team_id, g.home_team_id)
+    ) AS t (team_id, opp_id)
+    LEFT JOIN LATERAL (
+        SELECT {_PERSPECTIVE.format(team="t.team_id")}
+        FROM public.matchup_index m
+        WHERE m.team_lo = LEAST(t.team_id, t.opp_id) AND m.team_hi = GREATEST(t.team_id, t.opp_id)
+          AND m.date < g.game_date
+        ORDER BY m.date DESC, m.game_id DESC
+        LIMIT :n
+    ) h ON TRUE
+    WHERE g.id = ANY(:ids)
+    GROUP BY g.id, t.team_id
+"""
+
+
+def ensure_matchup_tables(conn):
+    for stmt in MATCHUP_TABLES_SQL:
+        conn.execute(text(stmt))
+
+# -------------------------------------------------
+# Maintenance
+# -------------------------------------------------
+
+# Catch-up: games not indexed yet, or indexed without shots that now exist
+CATCH_UP_WHERE = """
+    AND (
+        NOT EXISTS (SELECT 1 FROM public.matchup_index mi WHERE mi.game_id = g.id)
+        OR (
+            EXISTS (
+                SELECT 1 FROM public.matchup_index mi
+                WHERE mi.game_id = g.id AND (mi.lo_shots IS NULL OR mi.hi_shots IS NULL)
+            )
+            AND EXISTS (SELECT 1 FROM public.player_stats ps WHERE ps.game_id = g.id)
+        )
+    )
+"""
+
+
+def index_games(bind, game_ids=None):
+    """
+    Upsert the index rows of final games (games.id); with no ids, every
+    final game not indexed yet or still missing shots that player_stats now
+    has. Returns the number of rows written.
+    """
+    if game_ids is None:
+        where = CATCH_UP_WHERE
+        params = {}
+    else:
+        where = "AND g.id = ANY(:ids)"
+        params = {"ids": list(game_ids)}
+    with bind.begin() as conn:
+        ensure_matchup_tables(conn)
+        return conn.execute(text(INDEX_ROWS_SQL.format(where=where)), params).rowcount
+
+
+def rebuild(bind):
+    with bind.begin() as conn:
+        ensure_matchup_tables(conn)
+        conn.execute(text("TRUNCATE public.matchup_index"))
+    n = index_games(bind)
+    logger.info(f"Rebuilt matchup index: {n} games")
+    return n
+
+# -------------------------------------------------
+# Lookups
+# -------------------------------------------------
+
+def last_meetings(conn, team_id, opp_id, before=None, n=N_MEETINGS):
+    """
+    Up to `n` meetings before `before` (default: now), newest first, from
+    `team_id`'s side. `conn` is a DB-API connection (tuple or dict cursor).
+    """
+    cur = conn.cursor()
+    cur.execute(LAST_MEETINGS_SQL, {
+        "team": team_id, "opp": opp_id, "before": before or datetime.now(), "n": n,
+    })
+    rows = fetch_dicts(cur)
+    cur.close()
+    return rows
+
+
+def summarize(meetings):
+    """
+    Head-to-head aggregates of last_meetings() rows, named like the
+    h2h_features() columns (None where there is nothing to average).
+    """
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return sum(values) / len(values) if values else None
+
+    return {
+        "h2h_games": len(meetings),
+        "h2h_goals_for": mean(m["goals_for"] for m in meetings),
+        "h2h_goals_against": mean(m["goals_against"] for m in meetings),
+        "h2h_shots_for": mean(m["shots_for"] for m in meetings),
+        "h2h_shots_against": mean(m["shots_against"] for m in meetings),
+        "h2h_win_pct": mean(int(m["goals_for"] > m["goals_against"]) for m in meetings),
+    }
+
+
+def h2h_features(bind, game_ids, n=N_MEETINGS):
+    """
+    (game_id, team_id, h2h_*) pre-game rows for games (played or upcoming),
+    from the last `n` meetings before each game; for merging into
+    team-game features.
+    """
+    with bind.connect() as conn:
+        return pd.read_sql(text(H2H_FEATURES_SQL), conn, params={"ids": list(game_ids), "n": n})
+
+# -------------------------------------------------
+# Entry point
+# -------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Head-to-head matchup index")
+    parser.add_argument("--rebuild", action="store_true", help="re-index every final game")
+    parser.add_argument("--teams", type=int, nargs=2, metavar=("TEAM", "OPP"),
+                        help="print the last meetings of two team ids instead")
+    parser.add_argument("-n", type=int, default=N_MEETINGS, help="meetings to show")
+    args = parser.parse_args(argv)
+
+    from db import get_conn, get_engine
+
+    if args.teams:
+        conn = get_conn()
+        try:
+            meetings = last_meetings(conn, *args.teams, n=args.n)
+        finally:
+            conn.close()
+        print(json.dumps({"summary": summarize(meetings), "meetings": meetings}, indent=2, default=str))
+        return
+
+    bind = get_engine()
+    n = rebuild(bind) if args.rebuild else index_games(bind)
+    print(f"Indexed {n} games.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
@@ -0,0 +1,107 @@
+"""
+Prometheus metrics shared by the web app and the ingest workers.
+
+The app serves them at /metrics. Ingest commands expose them on
+METRICS_PORT while they run and/or push them to PUSHGATEWAY_URL when they
+finish (short jobs may end before a scrape).
+"""
+import os
+import time
+from datetime import date, datetime, timezone
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+PUSHGATEWAY_URL = os.getenv("PUSHGATEWAY_URL")
+
+# -------------------------------------------------
+# Web service
+# -------------------------------------------------
+
+REQUEST_LATENCY = Histogram(
+    "nhl_http_request_seconds",
+    "Web request latency by route",
+    ["route", "method", "status"],
+)
+DB_POOL_SIZE = Gauge("nhl_db_pool_size", "Maximum connections in the app's DB pool")
+DB_POOL_IN_USE = Gauge("nhl_db_pool_in_use", "App DB connections currently checked out")
+MODEL_LOAD_SECONDS = Gauge(
+    "nhl_model_load_seconds", "Time spent loading or fitting the served model", ["model"]
+)
+PREDICTIONS = Counter("nhl_predictions_total", "Predictions served", ["model"])
+CACHE_REQUESTS = Counter(
+    "nhl_cache_requests_total", "In-process cache lookups by result", ["cache", "result"]
+)
+CACHE_INVALIDATIONS = Counter(
+    "nhl_cache_invalidations_total", "Cache entries dropped by reason", ["cache", "reason"]
+)
+
+# -------------------------------------------------
+# Ingest workers
+# -------------------------------------------------
+
+GAMES_FETCHED = Counter(
+    "nhl_ingest_games_fetched_total", "Games fetched from the NHL API", ["job"]
+)
+API_LATENCY = Histogram(
+    "nhl_api_request_seconds", "NHL API request latency by endpoint", ["endpoint"]
+)
+API_ERRORS = Counter(
+    "nhl_api_errors_total", "Failed NHL API requests by endpoint and status", ["endpoint", "status"]
+)
+ROWS_WRITTEN = Counter(
+    "nhl_ingest_rows_written_total", "Rows inserted or updated by ingest jobs", ["table"]
+)
+INGEST_LAG = Gauge(
+    "nhl_ingest_lag_seconds", "Seconds since the start of the latest final game in the DB"
+)
+LAST_SUCCESS = Gauge(
+    "nhl_ingest_last_success_timestamp", "Unix time of the last successful ingest", ["job"]
+)
+
+
+def render():
+    """
+    Body and content type for a /metrics response.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server():
+    if METRICS_PORT:
+        from prometheus_client import start_http_server
+        start_http_server(int(METRICS_PORT))
+
+
+def push_metrics(job):
+    if PUSHGATEWAY_URL:
+        from prometheus_client import push_to_gateway
+        push_to_gateway(PUSHGATEWAY_URL, job=job, registry=REGISTRY)
+
+
+def update_ingest_lag(bind=None):
+    """
+    Refresh the lag gauge from the newest final game in public.games.
+    """
+    from sqlalchemy import text
+    from db import get_engine
+
+    bind = bind or get_engine()
+    with bind.connect() as conn:
+        latest = conn.execute(text(
+            "SELECT MAX(game_date) FROM public.games WHERE status = 'final'"
+        )).scalar()
+    if latest is not None:
+        if not isinstance(latest, datetime) and isinstance(latest, date):
+            latest = datetime.combine(latest, datetime.min.time())
+        # game_date holds naive UTC start times
+        if latest.tzinfo is None:
+            latest = latest.replace(tzinfo=timezone.utc)
+        INGEST_LAG.set(max(0.0, time.time() - latest.timestamp()))
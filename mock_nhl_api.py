@@ -0,0 +1,604 @@
+"""
+Local stand-in for api-web.nhle.com and api.nhle.com/stats.
+
+Serves recorded payloads from a fixtures directory when present, otherwise
+deterministic synthetic schedule/scoreboard/boxscore/play-by-play/team/player
+payloads, with configurable latency, error rate and 429 rate limiting. Point
+the ingesters at it with:
+
+    NHL_API_WEB_URL=http://127.0.0.1:8099/v1
+    NHL_STATS_URL=http://127.0.0.1:8099/stats/rest/en
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from flask import Flask, Response, abort, jsonify, request
+
+# -------------------------------------------------
+# League model
+# -------------------------------------------------
+
+TEAMS = [
+    (1, "NJD", "Devils", "New Jersey Devils"),
+    (2, "NYI", "Islanders", "New York Islanders"),
+    (3, "NYR", "Rangers", "New York Rangers"),
+    (4, "PHI", "Flyers", "Philadelphia Flyers"),
+    (5, "PIT", "Penguins", "Pittsburgh Penguins"),
+    (6, "BOS", "Bruins", "Boston Bruins"),
+    (7, "BUF", "Sabres", "Buffalo Sabres"),
+    (8, "MTL", "Canadiens", "Montréal Canadiens"),
+    (9, "OTT", "Senators", "Ottawa Senators"),
+    (10, "TOR", "Maple Leafs", "Toronto Maple Leafs"),
+    (12, "CAR", "Hurricanes", "Carolina Hurricanes"),
+    (13, "FLA", "Panthers", "Florida Panthers"),
+    (14, "TBL", "Lightning", "Tampa Bay Lightning"),
+    (15, "WSH", "Capitals", "Washington Capitals"),
+    (16, "CHI", "Blackhawks", "Chicago Blackhawks"),
+    (17, "DET", "Red Wings", "Detroit Red Wings"),
+    (18, "NSH", "Predators", "Nashville Predators"),
+    (19, "STL", "Blues", "St. Louis Blues"),
+    (20, "CGY", "Flames", "Calgary Flames"),
+    (21, "COL", "Avalanche", "Colorado Avalanche"),
+    (22, "EDM", "Oilers", "Edmonton Oilers"),
+    (23, "VAN", "Canucks", "Vancouver Canucks"),
+    (24, "ANA", "Ducks", "Anaheim Ducks"),
+    (25, "DAL", "Stars", "Dallas Stars"),
+    (26, "LAK", "Kings", "Los Angeles Kings"),
+    (28, "SJS", "Sharks", "San Jose Sharks"),
+    (29, "CBJ", "Blue Jackets", "Columbus Blue Jackets"),
+    (30, "MIN", "Wild", "Minnesota Wild"),
+    (52, "WPG", "Jets", "Winnipeg Jets"),
+    (54, "VGK", "Golden Knights", "Vegas Golden Knights"),
+    (55, "SEA", "Kraken", "Seattle Kraken"),
+    (59, "UTA", "Utah HC", "Utah Hockey Club"),
+]
+
+ROSTER = ["C"] * 4 + ["L"] * 4 + ["R"] * 4 + ["D"] * 6 + ["G"] * 2
+GAMES_PER_DAY = (4, 12)
+
+SEED = int(os.getenv("MOCK_NHL_SEED", "0"))
+
+
+def _rng(*key):
+    digest = hashlib.blake2b(repr((SEED,) + key).encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(digest, "big"))
+
+
+def _season_for(d):
+    start = d.year if d.month >= 7 else d.year - 1
+    return start * 10000 + start + 1
+
+
+def _team(team_id):
+    for t in TEAMS:
+        if t[0] == team_id:
+            return t
+    return None
+
+
+def _player_id(team_id, slot):
+    return 8_000_000 + team_id * 100 + slot
+
+
+# -------------------------------------------------
+# Synthetic payloads (deterministic per seed + key)
+# -------------------------------------------------
+
+def synth_games_for_date(d, today=None):
+    """
+    Games on one date. Games before `today` are final with scores.
+    """
+    today = today or date.today()
+    rng = _rng("day", d.isoformat())
+    if d.month in (7, 8, 9):
+        return []
+    n = rng.randint(*GAMES_PER_DAY)
+    teams = rng.sample(TEAMS, min(2 * n, len(TEAMS)))
+    season = _season_for(d)
+    day_index = (d - date(season // 10000, 10, 1)).days
+    games = []
+    for i in range(len(teams) // 2):
+        home, away = teams[2 * i], teams[2 * i + 1]
+        game_id = (season // 10000) * 1_000_000 + 20_000 + day_index * 16 + i
+        game = {
+            "id": game_id,
+            "season": season,
+            "gameType": 2,
+            "gameDate": d.isoformat(),
+            "startTimeUTC": f"{d.isoformat()}T{17 + i % 7:02d}:00:00Z",
+            "venue": {"default": f"{home[3]} Arena"},
+            "gameState": "FUT",
+            "homeTeam": {"id": home[0], "abbrev": home[1], "commonName": {"default": home[2]}},
+            "awayTeam": {"id": away[0], "abbrev": away[1], "commonName": {"default": away[2]}},
+        }
+        if d < today:
+            home_score, away_score = _final_score(game_id)
+            game["gameState"] = "OFF"
+            game["homeTeam"]["score"] = home_score
+            game["awayTeam"]["score"] = away_score
+        games.append(game)
+    return games
+
+
+def _final_score(game_id):
+    rng = _rng("score", game_id)
+    home, away = rng.choices(range(8), weights=[6, 14, 20, 20, 16, 11, 8, 5], k=2)
+    if home == away:
+        home += 1 if rng.random() < 0.55 else 0
+        away += 0 if home > away else 1
+    return home, away
+
+
+def synth_schedule_week(start, today=None):
+    """
+    api-web /schedule/{date} shape: seven days from `start` plus nextStartDate.
+    """
+    days = []
+    for offset in range(7):
+        d = start + timedelta(days=offset)
+        days.append({
+            "date": d.isoformat(),
+            "numberOfGames": 0,
+            "games": synth_games_for_date(d, today),
+        })
+        days[-1]["numberOfGames"] = len(days[-1]["games"])
+    return {
+        "gameWeek": days,
+        "previousStartDate": (start - timedelta(days=7)).isoformat(),
+        "nextStartDate": (start + timedelta(days=7)).isoformat(),
+    }
+
+
+def _skater_line(rng, team_id, slot, position, goals):
+    assists = rng.choices([0, 1, 2], weights=[60, 30, 10])[0]
+    m, s = divmod(rng.randint(600, 1500), 60)
+    return {
+        "playerId": _player_id(team_id, slot),
+        "sweaterNumber": slot + 2,
+        "name": {"default": f"{position}. Player{team_id}-{slot}"},
+        "position": position,
+        "goals": goals,
+        "assists": assists,
+        "points": goals + assists,
+        "plusMinus": rng.randint(-2, 2),
+        "pim": rng.choice([0, 0, 0, 2, 4]),
+        "hits": rng.randint(0, 6),
+        "powerPlayGoals": 0,
+        "sog": goals + rng.randint(0, 4),
+        "faceoffWinningPctg": 0.0,
+        "toi": f"{m:02d}:{s:02d}",
+        "blockedShots": rng.randint(0, 4),
+        "shifts": rng.randint(14, 30),
+        "giveaways": rng.randint(0, 3),
+        "takeaways": rng.randint(0, 3),
+    }
+
+
+def _team_box(rng, team_id, goals_for, goals_against):
+    # Spread the team's goals across its skaters
+    skater_slots = [i for i, p in enumerate(ROSTER) if p != "G"]
+    goals = {slot: 0 for slot in skater_slots}
+    for _ in range(goals_for):
+        goals[rng.choice(skater_slots)] += 1
+
+    box = {"forwards": [], "defense": [], "goalies": []}
+    for slot, position in enumerate(ROSTER):
+        if position == "G":
+            if slot != ROSTER.index("G"):
+                continue
+            box["goalies"].append({
+                "playerId": _player_id(team_id, slot),
+                "name": {"default": f"G. Player{team_id}-{slot}"},
+                "position": "G",
+                "goalsAgainst": goals_against,
+                "shotsAgainst": goals_against + rng.randint(18, 35),
+                "toi": "60:00",
+            })
+        else:
+            line = _skater_line(rng, team_id, slot, position, goals[slot])
+            key = "defense" if position == "D" else "forwards"
+            box[key].append(line)
+    return box
+
+
+def _scheduled_teams(game_id):
+    # Invert the game id built in synth_games_for_date so boxscores match it
+    start_year, rem = divmod(game_id, 1_000_000)
+    day_index, i = divmod(rem - 20_000, 16)
+    if day_index < 0:
+        return None
+    d = date(start_year, 10, 1) + timedelta(days=day_index)
+    for g in synth_games_for_date(d, today=date.max):
+        if g["id"] == game_id:
+            return _team(g["homeTeam"]["id"]), _team(g["awayTeam"]["id"])
+    return None
+
+
+def synth_boxscore(game_id):
+    rng = _rng("box", game_id)
+    home, away = _scheduled_teams(game_id) or rng.sample(TEAMS, 2)
+    home_score, away_score = _final_score(game_id)
+    return {
+        "id": game_id,
+        "season": int(str(game_id)[:4]) * 10001 + 1,
+        "gameType": 2,
+        "gameState": "OFF",
+        "homeTeam": {"id": home[0], "abbrev": home[1], "score": home_score},
+        "awayTeam": {"id": away[0], "abbrev": away[1], "score": away_score},
+        "playerByGameStats": {
+            "homeTeam": _team_box(rng, home[0], home_score, away_score),
+            "awayTeam": _team_box(rng, away[0], away_score, home_score),
+        },
+    }
+
+
+# Non-goal play-by-play events per team-game and their relative weights
+PBP_EVENTS = 140
+PBP_WEIGHTS = {
+    "faceoff": 30, "hit": 22, "giveaway": 7, "takeaway": 6, "shot-on-goal": 28,
+    "missed-shot": 12, "blocked-shot": 14, "penalty": 4,
+}
+SHOT_TYPES = ["wrist", "snap", "slap", "backhand", "tip-in", "deflected", "wrap-around"]
+
+
+def _clock(seconds):
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def synth_play_by_play(game_id):
+    """
+    gamecenter play-by-play shape: period markers plus shots, goals (the
+    boxscore's scorers), hits, faceoffs and penalties with two-minute
+    power plays reflected in situationCode.
+    """
+    rng = _rng("pbp", game_id)
+    box = synth_boxscore(game_id)
+    sides = {"home": box["homeTeam"], "away": box["awayTeam"]}
+
+    raw = []
+    for side, team in sides.items():
+        lines = box["playerByGameStats"][f"{side}Team"]
+        skaters = [p["playerId"] for p in lines["forwards"] + lines["defense"]]
+        goalie = lines["goalies"][0]["playerId"]
+        scorers = [p["playerId"] for p in lines["forwards"] + lines["defense"] for _ in range(p["goals"])]
+        for player in scorers:
+            raw.append((rng.randrange(3600), "goal", side, player, goalie))
+        kinds = rng.choices(list(PBP_WEIGHTS), weights=list(PBP_WEIGHTS.values()), k=PBP_EVENTS)
+        for kind in kinds:
+            raw.append((rng.randrange(3600), kind, side, rng.choice(skaters), goalie))
+    raw.sort(key=lambda e: e[0])
+
+    plays = []
+    penalty_until = {"home": -1, "away": -1}
+
+    def add(t, kind, details=None, situation="1551"):
+        period, in_period = min(t // 1200, 2) + 1, t - min(t // 1200, 2) * 1200
+        plays.append({
+            "eventId": len(plays) + 1,
+            "periodDescriptor": {"number": period, "periodType": "REG", "maxRegulationPeriods": 3},
+            "timeInPeriod": _clock(in_period),
+            "timeRemaining": _clock(1200 - in_period),
+            "situationCode": situation,
+            "typeDescKey": kind,
+            "sortOrder": len(plays) + 1,
+            "details": details or {},
+        })
+
+    for period in range(3):
+        add(period * 1200, "period-start")
+        for t, kind, side, player, goalie in raw:
+            if not period * 1200 <= t < (period + 1) * 1200:
+                continue
+            other = "away" if side == "home" else "home"
+            home_sk = 4 if penalty_until["home"] > t else 5
+            away_sk = 4 if penalty_until["away"] > t else 5
+            situation = f"1{away_sk}{home_sk}1"
+            details = {"eventOwnerTeamId": sides[side]["id"]}
+            if kind in ("goal", "shot-on-goal", "missed-shot", "blocked-shot"):
+                # Attacking the net at x = +89 or -89, mostly from the slot
+                x = rng.choice((-1, 1)) * rng.randint(30, 88)
+                details.update(xCoord=x, yCoord=rng.randint(-38, 38), zoneCode="O",
+                               shotType=rng.choice(SHOT_TYPES))
+                other_goalie = box["playerByGameStats"][f"{other}Team"]["goalies"][0]["playerId"]
+                if kind == "goal":
+                    details.update(scoringPlayerId=player, goalieInNetId=other_goalie)
+                elif kind == "blocked-shot":
+                    # The blocking team owns a blocked shot
+                    details.update(shootingPlayerId=player, eventOwnerTeamId=sides[other]["id"])
+                else:
+                    details.update(shootingPlayerId=player, goalieInNetId=other_goalie)
+            else:
+                details.update(xCoord=rng.randint(-99, 99), yCoord=rng.randint(-42, 42),
+                               playerId=player)
+            if kind == "penalty":
+                penalty_until[side] = t + 120
+                details.update(typeCode="MIN", duration=2, committedByPlayerId=player)
+            elif kind == "goal" and penalty_until[other] > t:
+                penalty_until[other] = t
+            add(t, kind, details, situation)
+        add((period + 1) * 1200 - 1, "period-end")
+    add(3599, "game-end")
+
+    return {
+        "id": game_id,
+        "season": box["season"],
+        "gameType": 2,
+        "gameState": "OFF",
+        "homeTeam": {"id": sides["home"]["id"], "abbrev": sides["home"]["abbrev"], "score": sides["home"]["score"]},
+        "awayTeam": {"id": sides["away"]["id"], "abbrev": sides["away"]["abbrev"], "score": sides["away"]["score"]},
+        "plays": plays,
+    }
+
+
+GAME_MINUTES = 150
+
+
+def _score_at(game_id, fraction):
+    # Goals land at fixed points of the game so the score only ever climbs
+    # to the final one
+    final = _final_score(game_id)
+    scores = []
+    for side, goals in zip(("home", "away"), final):
+        rng = _rng("goals", game_id, side)
+        scores.append(sum(rng.random() <= fraction for _ in range(goals)))
+    return tuple(scores)
+
+
+def synth_score_day(d, now=None):
+    """
+    api-web /score/{date} shape, with states and running scores derived
+    from each game's start time relative to `now` (UTC).
+    """
+    now = now or datetime.now(timezone.utc)
+    games = []
+    for g in synth_games_for_date(d, today=date.min):
+        start = datetime.strptime(g["startTimeUTC"], "%Y-%m-%dT%H:%M:%SZ").replace(
+            tzinfo=timezone.utc
+        )
+        minutes = (now - start).total_seconds() / 60
+        if minutes < -30:
+            state = "FUT"
+        elif minutes < 0:
+            state = "PRE"
+        elif minutes < GAME_MINUTES:
+            state = "CRIT" if minutes > GAME_MINUTES - 20 else "LIVE"
+        else:
+            state = "OFF"
+        g["gameState"] = state
+        if state in ("LIVE", "CRIT", "OFF"):
+            fraction = min(minutes / GAME_MINUTES, 1.0)
+            g["homeTeam"]["score"], g["awayTeam"]["score"] = _score_at(g["id"], fraction)
+            g["period"] = min(3, int(fraction * 3) + 1)
+        games.append(g)
+    return {
+        "prevDate": (d - timedelta(days=1)).isoformat(),
+        "currentDate": d.isoformat(),
+        "nextDate": (d + timedelta(days=1)).isoformat(),
+        "games": games,
+    }
+
+
+def synth_stats_teams():
+    data = [
+        {"id": t[0], "fullName": t[3], "rawTricode": t[1], "triCode": t[1]}
+        for t in TEAMS
+    ]
+    return {"data": data, "total": len(data)}
+
+
+def synth_stats_players(start=0, limit=100, total=None):
+    """
+    stats/rest players page; ids beyond the current rosters are retired players.
+    """
+    total = total if total is not None else int(os.getenv("MOCK_NHL_PLAYERS", "20000"))
+    stop = total if limit < 0 else min(total, start + limit)
+    data = []
+    for i in range(start, stop):
+        team = TEAMS[i % len(TEAMS)]
+        slot = i // len(TEAMS)
+        position = ROSTER[slot] if slot < len(ROSTER) else "CLRD"[i % 4]
+        data.append({
+            "playerId": _player_id(team[0], slot) if slot < len(ROSTER) else 8_500_000 + i,
+            "teamId": team[0] if slot < len(ROSTER) else None,
+            "fullName": f"Player {i}",
+            "positionCode": position,
+        })
+    return {"data": data, "total": total}
+
+
+def synth_stats_boxscore(game_id):
+    box = synth_boxscore(game_id)
+    data = []
+    for side in ("homeTeam", "awayTeam"):
+        team_id = box[side]["id"]
+        stats = box["playerByGameStats"][side]
+        for p in stats["forwards"] + stats["defense"]:
+            data.append({
+                "statsType": "skater",
+                "playerId": p["playerId"],
+                "teamId": team_id,
+                "goals": p["goals"],
+                "assists": p["assists"],
+                "points": p["points"],
+                "shots": p["sog"],
+                "hits": p["hits"],
+                "timeOnIce": p["toi"],
+            })
+    return {"data": data, "total": len(data)}
+
+
+# -------------------------------------------------
+# Server
+# -------------------------------------------------
+
+class FaultConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 rate_limit=0.0, fixtures_dir=None, today=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.fixtures_dir = fixtures_dir
+        self.today = today
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.counters = {"requests": 0, "errors": 0, "throttled": 0}
+
+    def over_limit(self):
+        # Fixed one-second window, like most upstream gateways
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            return self.window_count > self.rate_limit
+
+
+def create_app(config=None):
+    config = config or FaultConfig()
+    app = Flask(__name__)
+    app.config["FAULTS"] = config
+
+    @app.before_request
+    def inject_faults():
+        if request.path == "/_stats":
+            return None
+        with config.lock:
+            config.counters["requests"] += 1
+        if config.over_limit():
+            with config.lock:
+                config.counters["throttled"] += 1
+            return Response("rate limited", status=429, headers={"Retry-After": "1"})
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        if config.error_rate and random.random() < config.error_rate:
+            with config.lock:
+                config.counters["errors"] += 1
+            return Response("injected error", status=503)
+        if config.fixtures_dir:
+            path = os.path.join(config.fixtures_dir, request.path.lstrip("/") + ".json")
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    return Response(f.read(), mimetype="application/json")
+        return None
+
+    def _today():
+        return config.today or date.today()
+
+    @app.route("/v1/schedule")
+    @app.route("/v1/schedule/now")
+    def schedule_now():
+        return jsonify(synth_schedule_week(_today(), _today()))
+
+    @app.route("/v1/schedule/<day>")
+    def schedule(day):
+        try:
+            start = datetime.strptime(day, "%Y-%m-%d").date()
+        except ValueError:
+            abort(404)
+        return jsonify(synth_schedule_week(start, _today()))
+
+    @app.route("/v1/score")
+    @app.route("/v1/score/now")
+    @app.route("/v1/score/<day>")
+    def score(day=None):
+        try:
+            d = datetime.strptime(day, "%Y-%m-%d").date() if day else _today()
+        except ValueError:
+            abort(404)
+        # Scoreboard supports If-None-Match, so unchanged polls get a 304
+        resp = jsonify(synth_score_day(d))
+        resp.add_etag()
+        return resp.make_conditional(request)
+
+    @app.route("/v1/gamecenter/<int:game_id>/boxscore")
+    def boxscore(game_id):
+        return jsonify(synth_boxscore(game_id))
+
+    @app.route("/v1/gamecenter/<int:game_id>/play-by-play")
+    def play_by_play(game_id):
+        return jsonify(synth_play_by_play(game_id))
+
+    @app.route("/stats/rest/en/team")
+    def stats_teams():
+        return jsonify(synth_stats_teams())
+
+    @app.route("/stats/rest/en/players")
+    def stats_players():
+        start = request.args.get("start", 0, type=int)
+        limit = request.args.get("limit", 100, type=int)
+        return jsonify(synth_stats_players(start, limit))
+
+    @app.route("/stats/rest/en/game/boxscore")
+    def stats_boxscore():
+        game_id = request.args.get("gameId", type=int)
+        if game_id is None:
+            abort(400)
+        return jsonify(synth_stats_boxscore(game_id))
+
+    @app.route("/_stats")
+    def stats():
+        with config.lock:
+            return jsonify(dict(config.counters))
+
+    return app
+
+
+def record_fixture(url, fixtures_dir, path):
+    """
+    Save a live API response under fixtures_dir so the mock replays it.
+    """
+    from nhl_api import get_client
+
+    payload = get_client().get_json(url, endpoint="record")
+    out = os.path.join(fixtures_dir, path.lstrip("/") + ".json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(payload, f)
+    print(f"Recorded {url} -> {out}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local NHL API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="requests/sec before answering 429 (0 = unlimited)")
+    parser.add_argument("--fixtures", help="directory of recorded payloads to serve first")
+    parser.add_argument("--today", help="YYYY-MM-DD; games before it are final")
+    parser.add_argument("--record", nargs=2, metavar=("URL", "PATH"),
+                        help="fetch URL from the live API into fixtures at PATH and exit")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record_fixture(args.record[0], args.fixtures or "fixtures", args.record[1])
+        return
+
+    config = FaultConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        fixtures_dir=args.fixtures,
+        today=datetime.strptime(args.today, "%Y-%m-%d").date() if args.today else None,
+    )
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
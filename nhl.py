@@ -0,0 +1,312 @@
+"""
+Single entry point for the pipeline: `python nhl.py <command> [options]`.
+
+Only argparse is imported up front; each command imports the modules it
+needs when it runs, so `--help` and `health` start instantly.
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Commands that expose/push Prometheus metrics (METRICS_PORT / PUSHGATEWAY_URL)
+INGEST_COMMANDS = {"ingest-schedule", "ingest-live", "ingest-defense", "ingest-player-stats", "pull-stats"}
+
+BACKTEST_MODULES = {
+    "base": "team_vs_opponent_predictions",
+    "r1": "team_vs_opponent_predictions_r1",
+    "r2": "team_vs_opponent_predictions_r2",
+}
+
+# -------------------------------------------------
+# Commands (imports stay inside each one)
+# -------------------------------------------------
+
+def cmd_ingest_schedule(args):
+    from ingest_game_schedule import ingest_schedule
+    ingest_schedule(args.start, args.end)
+
+
+def cmd_ingest_live(args):
+    from ingest_live import poll_live
+    poll_live(args.date, args.once)
+
+
+def cmd_ingest_defense(args):
+    if args.rebuild:
+        from ingest_team_game_defense_r1 import ingest_all_games
+        ingest_all_games(rebuild=True)
+    else:
+        from ingest_team_game_defense import ingest_all_games
+        ingest_all_games()
+
+
+def cmd_ingest_player_stats(args):
+    from ingest_player_stats import ingest_all_games
+    ingest_all_games()
+
+
+def cmd_pull_stats(args):
+    from pull_stats import main
+    main()
+
+
+def cmd_build_features(args):
+    if args.backend == "duckdb":
+        from team_vs_opponent_duckdb import main
+        main(args.duckdb_args)
+    else:
+        from team_vs_opponent import main
+        main()
+
+
+def cmd_refresh_view(args):
+    from team_vs_opponent_view import (
+        create_team_vs_opponent_view,
+        refresh_team_vs_opponent_view,
+    )
+    if args.create:
+        create_team_vs_opponent_view()
+    refresh_team_vs_opponent_view(concurrently=not args.blocking)
+
+
+def cmd_snapshot(args):
+    from feature_store import snapshot_training_frame
+    snapshot_training_frame(full=args.full)
+
+
+def cmd_backtest(args):
+    import importlib
+    importlib.import_module(BACKTEST_MODULES[args.model]).main()
+
+
+def cmd_serve(args):
+    from app import app
+    app.run(host=args.host, port=args.port)
+
+
+def cmd_mock_api(args):
+    from mock_nhl_api import main
+    main(args.mock_args)
+
+
+def cmd_bench_ingest(args):
+    from bench_ingest import main
+    main(args.bench_args)
+
+
+def cmd_synth_data(args):
+    from synth_data import main
+    main(args.synth_args)
+
+
+def cmd_strength(args):
+    from strength_model import main
+    main(args.strength_args)
+
+
+def cmd_matchups(args):
+    from matchups import main
+    main(args.matchups_args)
+
+
+def cmd_schedule_context(args):
+    from schedule_context import main
+    main(args.schedule_context_args)
+
+
+def cmd_pbp(args):
+    from play_by_play import main
+    main(args.pbp_args)
+
+
+def cmd_export_model(args):
+    from export_model import main
+    main(args.export_args)
+
+
+def cmd_ensemble(args):
+    from ensemble import main
+    main(args.ensemble_args)
+
+
+def cmd_lineup(args):
+    from lineup_model import main
+    main(args.lineup_args)
+
+
+def cmd_elo(args):
+    from elo import main
+    main(args.elo_args)
+
+
+def cmd_season_sim(args):
+    from season_sim import main
+    main(args.sim_args)
+
+
+def cmd_orchestrate(args):
+    from orchestrator import main
+    main(args.orchestrate_args)
+
+
+def cmd_health(args):
+    from db import get_conn
+
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 AS ok")
+        cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    print("ok")
+
+
+# -------------------------------------------------
+# Parser
+# -------------------------------------------------
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nhl", description="NHL predictor pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest-schedule", help="ingest games from the NHL schedule API")
+    p.add_argument("start", help="YYYY-MM-DD")
+    p.add_argument("end", help="YYYY-MM-DD")
+    p.set_defaults(func=cmd_ingest_schedule)
+
+    p = sub.add_parser("ingest-live", help="poll today's games while they are played")
+    p.add_argument("--date", help="YYYY-MM-DD (default: today)")
+    p.add_argument("--once", action="store_true", help="run a single polling cycle")
+    p.set_defaults(func=cmd_ingest_live)
+
+    p = sub.add_parser("ingest-defense", help="ingest defensemen boxscore stats")
+    p.add_argument("--rebuild", action="store_true",
+                   help="truncate team_game_defense and re-ingest every game")
+    p.set_defaults(func=cmd_ingest_defense)
+
+    p = sub.add_parser("ingest-player-stats", help="ingest player boxscore stats")
+    p.set_defaults(func=cmd_ingest_player_stats)
+
+    p = sub.add_parser("pull-stats", help="refresh teams, players and today's games")
+    p.set_defaults(func=cmd_pull_stats)
+
+    p = sub.add_parser("build-features", help="rebuild public.team_vs_opponent")
+    p.add_argument("--backend", choices=["pandas", "duckdb"], default="pandas")
+    p.add_argument("duckdb_args", nargs=argparse.REMAINDER,
+                   help="extra options passed to the duckdb backend")
+    p.set_defaults(func=cmd_build_features)
+
+    p = sub.add_parser("refresh-view", help="refresh the team_vs_opponent materialized view")
+    p.add_argument("--create", action="store_true", help="create the view first if missing")
+    p.add_argument("--blocking", action="store_true", help="refresh without CONCURRENTLY")
+    p.set_defaults(func=cmd_refresh_view)
+
+    p = sub.add_parser("snapshot", help="export the training frame to Parquet")
+    p.add_argument("--full", action="store_true", help="ignore the watermark and re-export")
+    p.set_defaults(func=cmd_snapshot)
+
+    p = sub.add_parser("backtest", help="run a rolling-season backtest")
+    p.add_argument("--model", choices=sorted(BACKTEST_MODULES), default="base")
+    p.set_defaults(func=cmd_backtest)
+
+    p = sub.add_parser("serve", help="run the web app")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("mock-api", help="run the local NHL API stand-in")
+    p.add_argument("mock_args", nargs=argparse.REMAINDER,
+                   help="options passed to mock_nhl_api.py")
+    p.set_defaults(func=cmd_mock_api)
+
+    p = sub.add_parser("bench-ingest", help="benchmark write paths against a local database")
+    p.add_argument("bench_args", nargs=argparse.REMAINDER,
+                   help="options passed to bench_ingest.py")
+    p.set_defaults(func=cmd_bench_ingest)
+
+    p = sub.add_parser("synth-data", help="generate a seeded synthetic league history")
+    p.add_argument("synth_args", nargs=argparse.REMAINDER,
+                   help="options passed to synth_data.py")
+    p.set_defaults(func=cmd_synth_data)
+
+    p = sub.add_parser("strength", help="fit or walk-forward the team strength model")
+    p.add_argument("strength_args", nargs=argparse.REMAINDER,
+                   help="options passed to strength_model.py")
+    p.set_defaults(func=cmd_strength)
+
+    p = sub.add_parser("matchups", help="maintain or query the head-to-head matchup index")
+    p.add_argument("matchups_args", nargs=argparse.REMAINDER,
+                   help="options passed to matchups.py")
+    p.set_defaults(func=cmd_matchups)
+
+    p = sub.add_parser("schedule-context", help="rebuild rest, density and travel context per team-game")
+    p.add_argument("schedule_context_args", nargs=argparse.REMAINDER,
+                   help="options passed to schedule_context.py")
+    p.set_defaults(func=cmd_schedule_context)
+
+    p = sub.add_parser("pbp", help="ingest play-by-play events and per-team-game shot aggregates")
+    p.add_argument("pbp_args", nargs=argparse.REMAINDER,
+                   help="options passed to play_by_play.py")
+    p.set_defaults(func=cmd_pbp)
+
+    p = sub.add_parser("export-model", help="export a goals model for the NumPy-only scorer")
+    p.add_argument("export_args", nargs=argparse.REMAINDER,
+                   help="options passed to export_model.py")
+    p.set_defaults(func=cmd_export_model)
+
+    p = sub.add_parser("ensemble", help="fit the bootstrap ensemble behind prediction intervals")
+    p.add_argument("ensemble_args", nargs=argparse.REMAINDER,
+                   help="options passed to ensemble.py")
+    p.set_defaults(func=cmd_ensemble)
+
+    p = sub.add_parser("lineup", help="fit or evaluate the player lineup model")
+    p.add_argument("lineup_args", nargs=argparse.REMAINDER,
+                   help="options passed to lineup_model.py")
+    p.set_defaults(func=cmd_lineup)
+
+    p = sub.add_parser("elo", help="update, rebuild or tune team Elo ratings")
+    p.add_argument("elo_args", nargs=argparse.REMAINDER,
+                   help="options passed to elo.py")
+    p.set_defaults(func=cmd_elo)
+
+    p = sub.add_parser("season-sim", help="simulate the rest of the season for playoff odds")
+    p.add_argument("sim_args", nargs=argparse.REMAINDER,
+                   help="options passed to season_sim.py")
+    p.set_defaults(func=cmd_season_sim)
+
+    p = sub.add_parser("orchestrate", help="run the event-driven pipeline loop")
+    p.add_argument("orchestrate_args", nargs=argparse.REMAINDER,
+                   help="options passed to orchestrator.py")
+    p.set_defaults(func=cmd_orchestrate)
+
+    p = sub.add_parser("health", help="check database connectivity")
+    p.set_defaults(func=cmd_health)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    if args.command in INGEST_COMMANDS:
+        from metrics import push_metrics, start_metrics_server
+        start_metrics_server()
+
+    args.func(args)
+
+    if args.command in INGEST_COMMANDS:
+        push_metrics(args.command)
+
+    # Only report API latency if the command actually used the client
+    if "nhl_api" in sys.modules:
+        sys.modules["nhl_api"].get_client().log_latency_summary()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,351 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import API_ERRORS, API_LATENCY
+
+# Override to point every ingester at another host (e.g. mock_nhl_api.py)
+BASE_URL = os.getenv("NHL_API_WEB_URL", "https://api-web.nhle.com/v1").rstrip("/")
+STATS_URL = os.getenv("NHL_STATS_URL", "https://api.nhle.com/stats/rest/en").rstrip("/")
+SCHEDULE_URL = f"{BASE_URL}/schedule"
+BOXSCORE_URL = f"{BASE_URL}/gamecenter/{{game_id}}/boxscore"
+PLAY_BY_PLAY_URL = f"{BASE_URL}/gamecenter/{{game_id}}/play-by-play"
+SCORE_URL = f"{BASE_URL}/score"
+
+# -------------------------------------------------
+# Client config (env-tunable for bulk crawls)
+# -------------------------------------------------
+
+RATE_PER_SEC = float(os.getenv("NHL_API_RATE", "8"))
+BURST = int(os.getenv("NHL_API_BURST", "16"))
+MAX_RETRIES = int(os.getenv("NHL_API_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("NHL_API_BACKOFF", "0.5"))
+BACKOFF_MAX = 30.0
+TIMEOUT = float(os.getenv("NHL_API_TIMEOUT", "10"))
+POOL_SIZE = int(os.getenv("NHL_API_POOL_SIZE", "16"))
+STATS_PAGE_SIZE = int(os.getenv("NHL_STATS_PAGE_SIZE", "500"))
+BREAKER_THRESHOLD = 10
+BREAKER_COOLDOWN = 30.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+def _accept_encoding():
+    # urllib3 only decodes brotli when a brotli package is installed
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            return "gzip, deflate, br"
+        except ImportError:
+            return "gzip, deflate"
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling the API while the breaker is open."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens/sec, up to `capacity` banked.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures; lets one probe request
+    through once `cooldown` seconds have passed.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError(
+                    f"NHL API circuit open after {self.failures} consecutive failures"
+                )
+            # Half-open: allow a probe, re-open immediately if it fails
+            self.opened_at = None
+            self.failures = self.threshold - 1
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                logger.warning("NHL API circuit opened")
+
+
+class EndpointStats:
+    """
+    Per-endpoint request counters and latency totals.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = defaultdict(lambda: {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+        })
+
+    def record(self, endpoint, seconds, error=False, retry=False, status=None):
+        API_LATENCY.labels(endpoint).observe(seconds)
+        if error:
+            API_ERRORS.labels(endpoint, str(status or "connection")).inc()
+        with self.lock:
+            s = self.data[endpoint]
+            s["requests"] += 1
+            s["total_seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+            if error:
+                s["errors"] += 1
+            if retry:
+                s["retries"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            out = {}
+            for endpoint, s in self.data.items():
+                out[endpoint] = dict(s)
+                out[endpoint]["mean_seconds"] = (
+                    s["total_seconds"] / s["requests"] if s["requests"] else 0.0
+                )
+            return out
+
+
+class NHLClient:
+    """
+    Shared HTTP client for the NHL web and stats APIs: pooled keep-alive
+    session, compressed responses, retries with backoff on 429/5xx,
+    client-side rate limiting and a circuit breaker.
+    """
+
+    def __init__(
+        self,
+        rate=RATE_PER_SEC,
+        burst=BURST,
+        max_retries=MAX_RETRIES,
+        timeout=TIMEOUT,
+        pool_size=POOL_SIZE,
+    ):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": _accept_encoding(),
+            "User-Agent": "nhl-predictor",
+        })
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+        self.stats = EndpointStats()
+
+    def _backoff(self, attempt, resp=None):
+        if resp is not None:
+            retry_after = resp.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), BACKOFF_MAX)
+        delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+        return delay * (0.5 + random.random() / 2)
+
+    def get(self, url, endpoint="other", params=None, headers=None):
+        """
+        GET with retries. Returns the final response, which may still be a
+        non-2xx status (e.g. 404) for the caller to handle.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            self.bucket.acquire()
+
+            start = time.perf_counter()
+            try:
+                resp = self.session.get(
+                    url, params=params, headers=headers, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.stats.record(endpoint, time.perf_counter() - start,
+                                  error=True, retry=attempt < self.max_retries)
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{endpoint}: {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            elapsed = time.perf_counter() - start
+            if resp.status_code in RETRY_STATUSES:
+                self.stats.record(endpoint, elapsed, error=True,
+                                  retry=attempt < self.max_retries,
+                                  status=resp.status_code)
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    return resp
+                delay = self._backoff(attempt, resp)
+                logger.warning(
+                    f"{endpoint}: HTTP {resp.status_code}; retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+
+            self.stats.record(endpoint, elapsed, error=resp.status_code >= 400,
+                              status=resp.status_code)
+            self.breaker.record_success()
+            return resp
+
+    def get_json(self, url, endpoint="other", params=None):
+        resp = self.get(url, endpoint=endpoint, params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    def get_if_changed(self, url, endpoint="other", validators=None):
+        """
+        Conditional GET. `validators` is a dict the caller keeps between
+        calls; it holds the last ETag / Last-Modified per URL and is sent back
+        as If-None-Match / If-Modified-Since. Returns None on 304 Not
+        Modified, otherwise the response.
+        """
+        headers = {}
+        seen = validators.get(url, {}) if validators is not None else {}
+        if seen.get("etag"):
+            headers["If-None-Match"] = seen["etag"]
+        if seen.get("last_modified"):
+            headers["If-Modified-Since"] = seen["last_modified"]
+
+        resp = self.get(url, endpoint=endpoint, headers=headers or None)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        if validators is not None:
+            validators[url] = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            }
+        return resp
+
+    def latency_stats(self):
+        return self.stats.snapshot()
+
+    def log_latency_summary(self):
+        for endpoint, s in sorted(self.latency_stats().items()):
+            logger.info(
+                f"{endpoint}: {s['requests']} requests, {s['errors']} errors, "
+                f"{s['retries']} retries, mean {s['mean_seconds'] * 1000:.0f} ms, "
+                f"max {s['max_seconds'] * 1000:.0f} ms"
+            )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Process-wide client so every caller shares one pool and one rate limit.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NHLClient()
+        return _client
 
-BASE_URL = "https://api-web.nhle.com/v1"
 
 def get_schedule_for_date(date_str: str):
     """
     Fetch NHL schedule for a specific YYYY-MM-DD date.
     """
-    url = f"{BASE_URL}/schedule/{date_str}"
-    r = requests.get(url, timeout=10)
-    r.raise_for_status()
-    return r.json()
+    url = f"{SCHEDULE_URL}/{date_str}"
+    return get_client().get_json(url, endpoint="schedule")
+
+
+def get_boxscore(game_id):
+    """
+    Fetch the gamecenter boxscore for an NHL game id.
+    """
+    url = BOXSCORE_URL.format(game_id=game_id)
+    return get_client().get_json(url, endpoint="boxscore")
+
+
+def get_play_by_play(game_id):
+    """
+    Fetch the gamecenter play-by-play feed for an NHL game id.
+    """
+    url = PLAY_BY_PLAY_URL.format(game_id=game_id)
+    return get_client().get_json(url, endpoint="play-by-play")
+
+
+def iter_stats_pages(path, endpoint, page_size=STATS_PAGE_SIZE, params=None):
+    """
+    Yield the `data` list of each page of a stats REST resource, paging with
+    start/limit so only one page is held in memory at a time, until `total`
+    rows (or an empty page) have been seen.
+    """
+    url = f"{STATS_URL}/{path.lstrip('/')}"
+    start = 0
+    while True:
+        page = get_client().get_json(
+            url, endpoint=endpoint, params={**(params or {}), "start": start, "limit": page_size}
+        )
+        data = page.get("data", [])
+        if not data:
+            return
+        yield data
+        start += len(data)
+        total = page.get("total")
+        if total is not None:
+            if start >= total:
+                return
+        # The server may cap limit below page_size, so a short page only
+        # means the end when there is no total to go by
+        elif len(data) < page_size:
+            return
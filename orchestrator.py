@@ -0,0 +1,293 @@
+"""
+Long-running pipeline driver.
+
+ingest_schedule queues a game_final event (public.pipeline_events + NOTIFY)
+for every game it flips to final. This process wakes on the NOTIFY (or a
+poll timeout), and runs each downstream stage over only the affected games
+and teams:
+
+    player_stats  fetch boxscores and upsert players / player_stats, which
+                  the view and the head-to-head shots are built from
+    ratings       apply the games to the team Elo ratings (elo.py)
+    matchups      upsert the games into the head-to-head index (matchups.py)
+    defense       fetch boxscores and upsert team_game_defense for those games
+    view          refresh team_vs_opponent_mv (concurrently) once per batch,
+                  which also tells the web app to drop cached predictions
+    snapshot      rewrite the Parquet feature store seasons that changed
+
+Each stage keeps its own watermark (last processed event id) in
+public.pipeline_watermarks, only consumes events its upstream stage has
+finished, and retries from its watermark after a failure or restart.
+Head-to-head rows of games whose player_stats came late are filled in by a
+catch-up pass at startup and every CATCH_UP_SECONDS.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from events import GAME_FINAL, ensure_event_tables, listen
+
+POLL_SECONDS = 60.0
+# Let a burst of finals from one ingest run land before processing
+DEBOUNCE_SECONDS = 5.0
+BATCH_EVENTS = 500
+# Re-index head-to-head rows whose shots arrived late at most this often
+CATCH_UP_SECONDS = 3600.0
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------
+# Watermarks and event batches
+# -------------------------------------------------
+
+def get_watermark(conn, stage):
+    wm = conn.execute(
+        text("SELECT event_id FROM public.pipeline_watermarks WHERE stage = :stage"),
+        {"stage": stage},
+    ).scalar()
+    return wm or 0
+
+
+def set_watermark(conn, stage, event_id):
+    conn.execute(text("""
+        INSERT INTO public.pipeline_watermarks (stage, event_id, updated_at)
+        VALUES (:stage, :event_id, now())
+        ON CONFLICT (stage) DO UPDATE
+        SET event_id = EXCLUDED.event_id, updated_at = EXCLUDED.updated_at
+    """), {"stage": stage, "event_id": event_id})
+
+
+def pending_batch(conn, after, upto):
+    """
+    game_final events in (after, upto], merged into one batch.
+    """
+    rows = conn.execute(text("""
+        SELECT id, payload
+        FROM public.pipeline_events
+        WHERE event = :event AND id > :after AND id <= :upto
+        ORDER BY id
+        LIMIT :limit
+    """), {"event": GAME_FINAL, "after": after, "upto": upto, "limit": BATCH_EVENTS}).all()
+    if not rows:
+        return None
+
+    game_ids, team_ids = set(), set()
+    for _, payload in rows:
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        game_ids.update(payload.get("game_ids", []))
+        team_ids.update(payload.get("team_ids", []))
+    return {"last_id": rows[-1][0], "game_ids": sorted(game_ids), "team_ids": sorted(team_ids)}
+
+# -------------------------------------------------
+# Stages (each gets the merged batch)
+# -------------------------------------------------
+
+def stage_player_stats(bind, batch):
+    from ingest_player_stats import upsert_player_stats
+    return upsert_player_stats(bind, batch["game_ids"])
+
+
+def stage_ratings(bind, batch):
+    from elo import rate_games
+    return rate_games(bind, batch["game_ids"])
+
+
+def stage_matchups(bind, batch):
+    from matchups import index_games
+    return index_games(bind, batch["game_ids"])
+
+
+def stage_defense(bind, batch):
+    from ingest_team_game_defense import Session, fetch_boxscore, insert_defense_stats
+
+    with bind.connect() as conn:
+        games = conn.execute(text("""
+            SELECT nhl_game_id, season, home_team_id, away_team_id
+            FROM public.games
+            WHERE id = ANY(:ids)
+        """), {"ids": batch["game_ids"]}).all()
+
+    session = Session(bind=bind)
+    try:
+        for game_id, season, home_id, away_id in games:
+            box = fetch_boxscore(game_id)
+            if not box:
+                # Leave the watermark where it is so the batch is retried
+                raise RuntimeError(f"boxscore unavailable for game {game_id}")
+            stats = box.get("playerByGameStats", {})
+            insert_defense_stats(session, game_id, season, away_id,
+                                 stats.get("awayTeam", {}).get("defense", []))
+            insert_defense_stats(session, game_id, season, home_id,
+                                 stats.get("homeTeam", {}).get("defense", []))
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return len(games)
+
+
+def stage_view(bind, batch):
+    from team_vs_opponent_view import refresh_team_vs_opponent_view
+    refresh_team_vs_opponent_view(bind)
+    return len(batch["game_ids"])
+
+
+def stage_snapshot(bind, batch):
+    from feature_store import snapshot_training_frame
+    manifest = snapshot_training_frame(bind)
+    return manifest["row_count"]
+
+
+STAGES = [
+    ("player_stats", stage_player_stats),
+    ("ratings", stage_ratings),
+    ("matchups", stage_matchups),
+    ("defense", stage_defense),
+    ("view", stage_view),
+    ("snapshot", stage_snapshot),
+]
+
+# -------------------------------------------------
+# Driver
+# -------------------------------------------------
+
+def catch_up_matchups(bind):
+    """
+    Index final games the matchup stage has not covered, and fill shots of
+    games indexed before their player_stats arrived. Scans every final
+    game, so it runs at startup and every CATCH_UP_SECONDS, not per batch.
+    """
+    from matchups import index_games
+
+    try:
+        n = index_games(bind)
+    except Exception as e:
+        logger.error(f"Matchup catch-up failed: {e}")
+        return 0
+    logger.info(f"Matchup catch-up: {n} games")
+    return n
+
+
+def process_pending(bind, stages=STAGES):
+    """
+    Run every stage over the events its upstream has finished. Returns the
+    number of (stage, batch) steps executed.
+    """
+    steps = 0
+    with bind.connect() as conn:
+        upstream = conn.execute(
+            text("SELECT COALESCE(MAX(id), 0) FROM public.pipeline_events")
+        ).scalar()
+
+    for name, fn in stages:
+        while True:
+            with bind.connect() as conn:
+                after = get_watermark(conn, name)
+                batch = pending_batch(conn, after, upstream)
+            if batch is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                n = fn(bind, batch)
+            except Exception as e:
+                logger.error(f"Stage {name} failed on events {after + 1}..{batch['last_id']}: {e}")
+                # Downstream stages stop at this stage's watermark
+                with bind.connect() as conn:
+                    upstream = get_watermark(conn, name)
+                break
+
+            with bind.begin() as conn:
+                set_watermark(conn, name, batch["last_id"])
+            steps += 1
+            logger.info(
+                f"Stage {name}: {len(batch['game_ids'])} games, "
+                f"{len(batch['team_ids'])} teams -> {n} in {time.perf_counter() - start:.1f}s "
+                f"(watermark {batch['last_id']})"
+            )
+    return steps
+
+
+def run_forever(bind, schedule_interval=0.0):
+    """
+    Process on every NOTIFY and at least every POLL_SECONDS. With
+    schedule_interval > 0 the schedule for yesterday/today is also
+    re-ingested on that cadence, which is what emits new finals.
+    """
+    from db import get_conn
+
+    wake = threading.Event()
+    threading.Thread(
+        target=listen,
+        args=(get_conn, lambda event: event.get("event") == GAME_FINAL and wake.set()),
+        daemon=True,
+    ).start()
+
+    next_schedule = time.monotonic()
+    next_catch_up = time.monotonic()
+    while True:
+        if time.monotonic() >= next_catch_up:
+            catch_up_matchups(bind)
+            next_catch_up = time.monotonic() + CATCH_UP_SECONDS
+        if schedule_interval and time.monotonic() >= next_schedule:
+            from ingest_game_schedule import ingest_schedule
+
+            today = date.today()
+            try:
+                ingest_schedule((today - timedelta(days=1)).isoformat(), today.isoformat())
+            except Exception as e:
+                logger.error(f"Schedule ingest failed: {e}")
+            next_schedule = time.monotonic() + schedule_interval
+
+        process_pending(bind)
+
+        timeout = POLL_SECONDS
+        if schedule_interval:
+            timeout = max(0.0, min(timeout, next_schedule - time.monotonic()))
+        if wake.wait(timeout):
+            time.sleep(DEBOUNCE_SECONDS)
+            wake.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event-driven pipeline orchestrator")
+    parser.add_argument("--once", action="store_true",
+                        help="process pending events and exit")
+    parser.add_argument("--schedule-interval", type=float, default=0.0,
+                        help="also re-ingest yesterday/today's schedule every N seconds")
+    args = parser.parse_args(argv)
+
+    from db import get_engine
+    from elo import ensure_rating_tables
+    from matchups import ensure_matchup_tables
+    from team_vs_opponent_view import create_team_vs_opponent_view
+
+    bind = get_engine()
+    with bind.begin() as conn:
+        ensure_event_tables(conn)
+        ensure_rating_tables(conn)
+        ensure_matchup_tables(conn)
+    # The view stage refreshes it concurrently, which needs it to exist
+    create_team_vs_opponent_view(bind)
+
+    if args.once:
+        process_pending(bind)
+        catch_up_matchups(bind)
+    else:
+        run_forever(bind, args.schedule_interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
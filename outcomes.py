@@ -0,0 +1,214 @@
+"""
+Game outcome probabilities from per-team expected goals.
+
+The models predict one goals number per team-game. Pairing the home and
+away predictions of a game gives a bivariate Poisson for the regulation
+score (independent when `shared` is 0, i.e. Skellam for the margin), from
+which win / regulation / OT-shootout, puck line and totals probabilities
+follow. Two interchangeable methods:
+
+    exact  closed-form score grid, (games, G, G) in one array op
+    mc     N_SIMS correlated Poisson draws per game in one NumPy batch
+
+Regulation ties go to OT/shootout: the winner is credited one goal, and the
+home side wins it with a probability between its share of the expected
+goals (3-on-3 OT) and a coin flip (shootout).
+"""
+import numpy as np
+import pandas as pd
+
+N_SIMS = 100_000
+MAX_GOALS = 15
+# Share of OT games settled before the shootout
+OT_DECIDED = 0.6
+TOTAL_LINES = (5.5, 6.5)
+# Games per MC batch, bounding memory at about 8 * CHUNK * N_SIMS bytes per array
+CHUNK = 16
+
+# -------------------------------------------------
+# Inputs
+# -------------------------------------------------
+
+def pair_predictions(df, pred_col="pred_goals"):
+    """
+    One row per game (game_id, home_team_id, away_team_id, home_mu,
+    away_mu) from team-game rows with game_id, team_id, home_away (1/0 or
+    'home'/'away') and `pred_col`.
+    """
+    home_flag = df["home_away"].isin([1, "home"])
+    cols = ["game_id", "team_id", pred_col]
+    home = df.loc[home_flag, cols].rename(columns={"team_id": "home_team_id", pred_col: "home_mu"})
+    away = df.loc[~home_flag, cols].rename(columns={"team_id": "away_team_id", pred_col: "away_mu"})
+    return home.merge(away, on="game_id", how="inner")
+
+
+def home_ot_share(home_mu, away_mu):
+    scoring_share = home_mu / (home_mu + away_mu)
+    return OT_DECIDED * scoring_share + (1 - OT_DECIDED) * 0.5
+
+
+def _split_rates(home_mu, away_mu, shared):
+    # Bivariate Poisson: home = X1 + X3, away = X2 + X3, cov = shared
+    home_mu = np.asarray(home_mu, dtype="float64")
+    away_mu = np.asarray(away_mu, dtype="float64")
+    lam3 = np.minimum(shared, 0.99 * np.minimum(home_mu, away_mu))
+    return home_mu - lam3, away_mu - lam3, lam3
+
+# -------------------------------------------------
+# Exact
+# -------------------------------------------------
+
+def _log_factorial(k):
+    table = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, k.max() + 1)))])
+    return table[k]
+
+
+def _poisson_pmf(mu, k):
+    # mu: (n,), k: (G,) -> (n, G)
+    mu = np.maximum(mu, 1e-12)[:, None]
+    return np.exp(k * np.log(mu) - mu - _log_factorial(k))
+
+
+def _dixon_coles(grid, home_mu, away_mu, rho):
+    # Low-score correction (scalar or per-game rho), renormalized
+    rho = np.broadcast_to(np.asarray(rho, dtype="float64"), home_mu.shape)
+    grid = grid.copy()
+    grid[:, 0, 0] *= 1 - home_mu * away_mu * rho
+    grid[:, 0, 1] *= 1 + home_mu * rho
+    grid[:, 1, 0] *= 1 + away_mu * rho
+    grid[:, 1, 1] *= 1 - rho
+    grid = np.maximum(grid, 0.0)
+    return grid / grid.sum(axis=(1, 2), keepdims=True)
+
+
+def score_matrix(home_mu, away_mu, shared=0.0, max_goals=MAX_GOALS, rho=0.0):
+    """
+    Regulation score pmf, shape (games, G, G) indexed [game, home, away].
+    Mass beyond max_goals is dropped (negligible for hockey rates). A
+    non-zero `rho` applies the Dixon-Coles correction to the 0-0, 0-1, 1-0
+    and 1-1 cells.
+    """
+    lam1, lam2, lam3 = _split_rates(home_mu, away_mu, shared)
+    k = np.arange(max_goals + 1)
+    p1, p2 = _poisson_pmf(lam1, k), _poisson_pmf(lam2, k)
+    grid = p1[:, :, None] * p2[:, None, :]
+    if np.any(lam3 > 0):
+        # Convolve with the shared component: shift the grid by j along the diagonal
+        p3 = _poisson_pmf(lam3, k)
+        out = np.zeros_like(grid)
+        for j in range(max_goals + 1):
+            out[:, j:, j:] += p3[:, j, None, None] * grid[:, :max_goals + 1 - j, :max_goals + 1 - j]
+        grid = out
+    if np.any(rho):
+        grid = _dixon_coles(grid, lam1 + lam3, lam2 + lam3, rho)
+    return grid
+
+
+def _summarize_exact(grid, home_mu, away_mu, lines):
+    n, size, _ = grid.shape
+    k = np.arange(size)
+    margin = k[:, None] - k[None, :]
+    total = k[:, None] + k[None, :]
+
+    p_reg_home = (grid * (margin > 0)).sum(axis=(1, 2))
+    p_reg_away = (grid * (margin < 0)).sum(axis=(1, 2))
+    p_tie = (grid * (margin == 0)).sum(axis=(1, 2))
+    ot_home = home_ot_share(home_mu, away_mu)
+
+    out = {
+        "p_home_reg": p_reg_home,
+        "p_away_reg": p_reg_away,
+        "p_ot": p_tie,
+        "p_home_win": p_reg_home + p_tie * ot_home,
+        "p_away_win": p_reg_away + p_tie * (1 - ot_home),
+        # OT/SO winners win by exactly one
+        "p_home_cover_1_5": (grid * (margin >= 2)).sum(axis=(1, 2)),
+        "p_away_cover_1_5": 1 - (grid * (margin >= 2)).sum(axis=(1, 2)),
+        "expected_total": (grid * total).sum(axis=(1, 2)) + p_tie,
+    }
+    # Final total = regulation total, plus the credited goal after a tie
+    final_total = np.zeros((n, 2 * size))
+    np.add.at(final_total, (slice(None), total[margin != 0]), grid[:, margin != 0])
+    ties = np.arange(size)
+    final_total[:, 2 * ties + 1] += grid[:, ties, ties]
+    for line in lines:
+        out[f"p_over_{line}"] = final_total[:, int(np.floor(line)) + 1:].sum(axis=1)
+    return out, final_total
+
+# -------------------------------------------------
+# Monte Carlo
+# -------------------------------------------------
+
+def _summarize_mc(home_mu, away_mu, shared, n_sims, lines, rng):
+    lam1, lam2, lam3 = _split_rates(home_mu, away_mu, shared)
+    ot_home = home_ot_share(home_mu, away_mu)
+    parts = []
+    for lo in range(0, len(lam1), CHUNK):
+        sl = slice(lo, lo + CHUNK)
+        size = (len(lam1[sl]), n_sims)
+        common = rng.poisson(lam3[sl, None], size)
+        home = rng.poisson(lam1[sl, None], size) + common
+        away = rng.poisson(lam2[sl, None], size) + common
+
+        margin = home - away
+        tie = margin == 0
+        home_ot = tie & (rng.random(size) < ot_home[sl, None])
+        total = home + away + tie
+
+        chunk = {
+            "p_home_reg": (margin > 0).mean(axis=1),
+            "p_away_reg": (margin < 0).mean(axis=1),
+            "p_ot": tie.mean(axis=1),
+            "p_home_win": ((margin > 0) | home_ot).mean(axis=1),
+            "p_away_win": ((margin < 0) | (tie & ~home_ot)).mean(axis=1),
+            "p_home_cover_1_5": (margin >= 2).mean(axis=1),
+            "p_away_cover_1_5": (margin < 2).mean(axis=1),
+            "expected_total": total.mean(axis=1),
+        }
+        for line in lines:
+            chunk[f"p_over_{line}"] = (total > line).mean(axis=1)
+        parts.append(chunk)
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+# -------------------------------------------------
+# Entry point
+# -------------------------------------------------
+
+def simulate_slate(games, method="exact", shared=0.0, n_sims=N_SIMS,
+                   lines=TOTAL_LINES, seed=None, return_totals=False, rho=0.0):
+    """
+    Outcome probabilities for each row of `games` (home_mu, away_mu, plus
+    any id columns, which are kept). With return_totals=True the exact
+    method also returns the (games, 2 * (MAX_GOALS + 1)) pmf of final total
+    goals. `rho` (scalar or per game) is the Dixon-Coles low-score
+    correction; only the exact method supports it.
+    """
+    home_mu = games["home_mu"].to_numpy(dtype="float64")
+    away_mu = games["away_mu"].to_numpy(dtype="float64")
+
+    totals = None
+    if method == "exact":
+        grid = score_matrix(home_mu, away_mu, shared, rho=rho)
+        probs, totals = _summarize_exact(grid, home_mu, away_mu, lines)
+    elif method == "mc":
+        if np.any(rho):
+            raise ValueError("rho needs method='exact'")
+        rng = np.random.default_rng(seed)
+        probs = _summarize_mc(home_mu, away_mu, shared, n_sims, lines, rng)
+    else:
+        raise ValueError(f"Unknown method {method!r}")
+
+    out = pd.concat(
+        [games.reset_index(drop=True), pd.DataFrame(probs).astype("float32")], axis=1
+    )
+    return (out, totals) if return_totals else out
+
+
+def estimate_shared(df):
+    """
+    Shared-goal component (covariance of home and away goals) from a
+    team-game frame with game_id, home_away and goals; never negative.
+    """
+    pairs = pair_predictions(df, pred_col="goals")
+    cov = np.cov(pairs["home_mu"], pairs["away_mu"])[0, 1] if len(pairs) > 1 else 0.0
+    return max(float(cov), 0.0)
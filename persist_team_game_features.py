@@ -1,7 +1,9 @@
 from sqlalchemy import text
-from db import engine
+from db import get_engine
+from instrument import stage
+from metrics import ROWS_WRITTEN
 
-def persist_team_game_features(df):
+def persist_team_game_features(df, bind=None):
     df = df.copy()  # avoid SettingWithCopyWarning
 
     numeric_cols = df.select_dtypes(include="number").columns
@@ -76,7 +78,9 @@ def persist_team_game_features(df):
         opp_team_id = EXCLUDED.opp_team_id
     """
 
-    with engine.begin() as conn:
+    bind = bind or get_engine()
+    with stage("upsert team_vs_opponent", rows_in=len(df)), bind.begin() as conn:
         conn.execute(text(upsert_sql), df.to_dict(orient="records"))
 
+    ROWS_WRITTEN.labels("team_vs_opponent").inc(len(df))
     print(f"Persisted {len(df)} rows into public.team_vs_opponent")
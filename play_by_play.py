@@ -0,0 +1,527 @@
+"""
+Play-by-play ingestion into compact columnar storage.
+
+A season is ~1,300 games of 300+ events each, far too many rows for the
+row-by-row inserts the other ingesters use. Instead the feed is streamed:
+
+    fetch    a thread pool pulls gamecenter/{id}/play-by-play through the
+             shared, rate-limited client, keeping a bounded number of games
+             in flight
+    parse    each game becomes typed columns (event type as an int8 code,
+             coordinates as int16, period / game time in seconds)
+    load     every BATCH games are written at once, either COPY'd into
+             public.pbp_events / public.pbp_team_games or appended to
+             per-season Parquet files
+
+Each batch is also aggregated (vectorized, one groupby) into per-team-game
+shot attempts, shot locations and strength states.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from db import copy_frame, fetch_dicts
+from metrics import GAMES_FETCHED, LAST_SUCCESS, ROWS_WRITTEN
+
+PBP_DIR = os.getenv("NHL_PBP_DIR", "play_by_play")
+WORKERS = 8
+# Games per COPY / Parquet row group
+BATCH = 100
+
+# typeDescKey -> int8 code; 0 is anything else
+EVENT_TYPES = {
+    "faceoff": 1,
+    "hit": 2,
+    "giveaway": 3,
+    "takeaway": 4,
+    "shot-on-goal": 5,
+    "missed-shot": 6,
+    "blocked-shot": 7,
+    "goal": 8,
+    "penalty": 9,
+    "delayed-penalty": 10,
+    "stoppage": 11,
+    "period-start": 12,
+    "period-end": 13,
+    "game-end": 14,
+    "shootout-complete": 15,
+    "failed-shot-attempt": 16,
+}
+SHOT_TYPES = {
+    name: i + 1 for i, name in enumerate([
+        "wrist", "snap", "slap", "backhand", "tip-in", "deflected",
+        "wrap-around", "bat", "between-legs", "cradle", "poke",
+    ])
+}
+PERIOD_TYPES = {"REG": 0, "OT": 1, "SO": 2}
+
+GOAL, SHOT, MISSED, BLOCKED = (EVENT_TYPES[k] for k in ("goal", "shot-on-goal", "missed-shot", "blocked-shot"))
+# Detail keys naming the event's main actor, in order of preference
+PLAYER_KEYS = ("scoringPlayerId", "shootingPlayerId", "hittingPlayerId", "winningPlayerId",
+               "committedByPlayerId", "playerId")
+
+PERIOD_SECONDS = 1200
+# Goal lines are at x = +/-89 ft; attempts are measured to the nearer net
+GOAL_LINE_X = 89
+HIGH_DANGER_FT = 25
+
+EVENT_DTYPES = {
+    "game_id": "int32",
+    "event_idx": "int16",
+    "period": "int8",
+    "period_type": "int8",
+    "period_seconds": "int16",
+    "game_seconds": "int16",
+    "type_code": "int8",
+    "team_id": "Int16",
+    "player_id": "Int32",
+    "goalie_id": "Int32",
+    "x": "Int16",
+    "y": "Int16",
+    "shot_type": "int8",
+    "home_skaters": "int8",
+    "away_skaters": "int8",
+    "home_goalie": "bool",
+    "away_goalie": "bool",
+}
+EVENT_COLUMNS = list(EVENT_DTYPES)
+
+TEAM_GAME_COLUMNS = [
+    "game_id", "team_id", "opp_team_id", "season",
+    "attempts_for", "attempts_against",
+    "unblocked_for", "unblocked_against",
+    "shots_for", "shots_against",
+    "goals_for", "goals_against",
+    "attempts_5v5_for", "attempts_5v5_against",
+    "attempts_pp_for", "attempts_sh_for",
+    "high_danger_for", "high_danger_against",
+    "mean_distance_for", "mean_distance_against",
+]
+
+logger = logging.getLogger(__name__)
+
+PBP_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.pbp_events (
+        game_id INTEGER NOT NULL,
+        event_idx SMALLINT NOT NULL,
+        period SMALLINT NOT NULL,
+        period_type SMALLINT NOT NULL,
+        period_seconds SMALLINT NOT NULL,
+        game_seconds SMALLINT NOT NULL,
+        type_code SMALLINT NOT NULL,
+        team_id SMALLINT,
+        player_id INTEGER,
+        goalie_id INTEGER,
+        x SMALLINT,
+        y SMALLINT,
+        shot_type SMALLINT NOT NULL,
+        home_skaters SMALLINT NOT NULL,
+        away_skaters SMALLINT NOT NULL,
+        home_goalie BOOLEAN NOT NULL,
+        away_goalie BOOLEAN NOT NULL,
+        PRIMARY KEY (game_id, event_idx)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.pbp_team_games (
+        game_id INTEGER NOT NULL,
+        team_id INTEGER NOT NULL,
+        opp_team_id INTEGER NOT NULL,
+        season INTEGER,
+        attempts_for SMALLINT NOT NULL,
+        attempts_against SMALLINT NOT NULL,
+        unblocked_for SMALLINT NOT NULL,
+        unblocked_against SMALLINT NOT NULL,
+        shots_for SMALLINT NOT NULL,
+        shots_against SMALLINT NOT NULL,
+        goals_for SMALLINT NOT NULL,
+        goals_against SMALLINT NOT NULL,
+        attempts_5v5_for SMALLINT NOT NULL,
+        attempts_5v5_against SMALLINT NOT NULL,
+        attempts_pp_for SMALLINT NOT NULL,
+        attempts_sh_for SMALLINT NOT NULL,
+        high_danger_for SMALLINT NOT NULL,
+        high_danger_against SMALLINT NOT NULL,
+        mean_distance_for REAL,
+        mean_distance_against REAL,
+        PRIMARY KEY (game_id, team_id)
+    )
+    """,
+]
+
+# Final games, keyed by games.id; team ids are the local ones
+GAMES_SQL = """
+    SELECT id AS game_id, nhl_game_id, season, home_team_id, away_team_id
+    FROM public.games
+    WHERE status = 'final' AND nhl_game_id IS NOT NULL
+"""
+
+
+def ensure_pbp_tables(target):
+    from events import _execute
+
+    for stmt in PBP_TABLES_SQL:
+        _execute(target, stmt)
+
+# -------------------------------------------------
+# Parse
+# -------------------------------------------------
+
+def _seconds(clock):
+    if not clock:
+        return 0
+    m, s = clock.split(":")
+    return int(m) * 60 + int(s)
+
+
+def _situation(code):
+    # situationCode digits: away goalie in net, away skaters, home skaters, home goalie
+    if code and len(code) == 4 and code.isdigit():
+        return int(code[2]), int(code[1]), code[3] == "1", code[0] == "1"
+    return 5, 5, True, True
+
+
+def parse_game(payload, game_id, home_team_id, away_team_id):
+    """
+    Typed event columns (EVENT_DTYPES) for one play-by-play payload; the
+    feed's team ids are mapped to the local home / away ids.
+    """
+    teams = {
+        payload["homeTeam"]["id"]: home_team_id,
+        payload["awayTeam"]["id"]: away_team_id,
+    }
+    rows = []
+    for idx, play in enumerate(payload.get("plays", [])):
+        details = play.get("details") or {}
+        period_desc = play.get("periodDescriptor") or {}
+        period = period_desc.get("number", 0)
+        period_seconds = _seconds(play.get("timeInPeriod"))
+        home_sk, away_sk, home_g, away_g = _situation(play.get("situationCode"))
+        player = next((details[k] for k in PLAYER_KEYS if details.get(k) is not None), None)
+        rows.append((
+            idx,
+            period,
+            PERIOD_TYPES.get(period_desc.get("periodType"), 0),
+            period_seconds,
+            max(period - 1, 0) * PERIOD_SECONDS + period_seconds,
+            EVENT_TYPES.get(play.get("typeDescKey"), 0),
+            teams.get(details.get("eventOwnerTeamId")),
+            player,
+            details.get("goalieInNetId"),
+            details.get("xCoord"),
+            details.get("yCoord"),
+            SHOT_TYPES.get(details.get("shotType"), 0),
+            home_sk,
+            away_sk,
+            home_g,
+            away_g,
+        ))
+
+    names = EVENT_COLUMNS[1:]
+    columns = list(zip(*rows)) or [()] * len(names)
+    df = pd.DataFrame({name: pd.array(col, dtype=EVENT_DTYPES[name]) for name, col in zip(names, columns)})
+    df.insert(0, "game_id", np.full(len(df), game_id, dtype="int32"))
+    return df
+
+# -------------------------------------------------
+# Aggregate
+# -------------------------------------------------
+
+def aggregate(events, games):
+    """
+    Per-team-game rows (TEAM_GAME_COLUMNS) from the events of `games`
+    (game_id, season, home_team_id, away_team_id). Blocked shots count for
+    the shooting team, the opponent of the blocker that owns the event;
+    shootout attempts are left out.
+    """
+    games = games[["game_id", "season", "home_team_id", "away_team_id"]]
+    attempts = events[
+        events["type_code"].isin([GOAL, SHOT, MISSED, BLOCKED]).to_numpy()
+        & (events["period_type"] != PERIOD_TYPES["SO"]).to_numpy()
+        & events["team_id"].notna().to_numpy()
+    ].merge(games, on="game_id")
+
+    code = attempts["type_code"].to_numpy()
+    home = attempts["home_team_id"].to_numpy()
+    away = attempts["away_team_id"].to_numpy()
+    owner = attempts["team_id"].to_numpy(dtype="int64")
+    blocked = code == BLOCKED
+    shooter = np.where(blocked, np.where(owner == home, away, home), owner)
+    shooter_home = shooter == home
+
+    own = np.where(shooter_home, attempts["home_skaters"], attempts["away_skaters"])
+    opp = np.where(shooter_home, attempts["away_skaters"], attempts["home_skaters"])
+    goalies = attempts["home_goalie"].to_numpy() & attempts["away_goalie"].to_numpy()
+
+    x = attempts["x"].to_numpy(dtype="float64", na_value=np.nan)
+    y = attempts["y"].to_numpy(dtype="float64", na_value=np.nan)
+    # Blocked shots are located where the block happened, so only unblocked
+    # attempts get a distance
+    distance = np.where(blocked, np.nan, np.hypot(GOAL_LINE_X - np.abs(x), y))
+
+    flags = pd.DataFrame({
+        "game_id": attempts["game_id"].to_numpy(),
+        "team_id": shooter,
+        "attempts": 1,
+        "unblocked": ~blocked,
+        "shots": (code == SHOT) | (code == GOAL),
+        "goals": code == GOAL,
+        "attempts_5v5": (own == 5) & (opp == 5) & goalies,
+        "attempts_pp": own > opp,
+        "attempts_sh": own < opp,
+        "high_danger": distance <= HIGH_DANGER_FT,
+        "distance": distance,
+    })
+    counts = [c for c in flags.columns if c not in ("game_id", "team_id", "distance")]
+    per_team = flags.groupby(["game_id", "team_id"]).agg(
+        **{c: (c, "sum") for c in counts}, mean_distance=("distance", "mean"),
+    ).reset_index()
+
+    out = pd.concat([
+        games.rename(columns={"home_team_id": "team_id", "away_team_id": "opp_team_id"}),
+        games.rename(columns={"away_team_id": "team_id", "home_team_id": "opp_team_id"}),
+    ], ignore_index=True)
+    out = out.merge(per_team.add_suffix("_for").rename(columns={"game_id_for": "game_id", "team_id_for": "team_id"}),
+                    on=["game_id", "team_id"], how="left")
+    out = out.merge(per_team.add_suffix("_against").rename(columns={"game_id_against": "game_id",
+                                                                    "team_id_against": "opp_team_id"}),
+                    on=["game_id", "opp_team_id"], how="left")
+
+    for c in TEAM_GAME_COLUMNS:
+        if c.startswith("mean_distance"):
+            out[c] = out[c].astype("float32")
+        elif c.endswith(("_for", "_against")):
+            out[c] = out[c].fillna(0).astype("int16")
+    return out[TEAM_GAME_COLUMNS].sort_values(["game_id", "team_id"], ignore_index=True)
+
+# -------------------------------------------------
+# Sinks
+# -------------------------------------------------
+
+class PostgresSink:
+    """
+    COPY each batch into public.pbp_events / public.pbp_team_games,
+    replacing earlier rows of the same games, one transaction per batch.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        cur = conn.cursor()
+        ensure_pbp_tables(cur)
+        conn.commit()
+        cur.close()
+
+    def done_game_ids(self):
+        cur = self.conn.cursor()
+        cur.execute("SELECT DISTINCT game_id FROM public.pbp_team_games")
+        ids = {r["game_id"] if isinstance(r, dict) else r[0] for r in cur.fetchall()}
+        cur.close()
+        return ids
+
+    def write(self, events, team_games):
+        ids = [int(g) for g in team_games["game_id"].unique()]
+        cur = self.conn.cursor()
+        for table, df in (("pbp_events", events), ("pbp_team_games", team_games)):
+            cur.execute(f"DELETE FROM public.{table} WHERE game_id = ANY(%s)", (ids,))
+            copy_frame(cur, table, df)
+        self.conn.commit()
+        cur.close()
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    """
+    Per-season Parquet under out_dir/{events,team_games}/season=S/, one
+    file per run and season with a row group per batch.
+    """
+
+    def __init__(self, out_dir=PBP_DIR):
+        self.out_dir = out_dir
+        self.run = datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.writers = {}
+
+    def done_game_ids(self):
+        try:
+            return set(read_parquet("team_games", out_dir=self.out_dir, columns=["game_id"])["game_id"])
+        except FileNotFoundError:
+            return set()
+
+    def _append(self, dataset, season, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        key = (dataset, season)
+        if key not in self.writers:
+            part_dir = os.path.join(self.out_dir, dataset, f"season={season}")
+            os.makedirs(part_dir, exist_ok=True)
+            self.writers[key] = pq.ParquetWriter(os.path.join(part_dir, f"part-{self.run}.parquet"), table.schema)
+        writer = self.writers[key]
+        writer.write_table(table.cast(writer.schema))
+
+    def write(self, events, team_games):
+        season_of = team_games.drop_duplicates("game_id").set_index("game_id")["season"]
+        event_season = season_of.reindex(events["game_id"]).to_numpy()
+        for season in team_games["season"].unique():
+            self._append("events", season, events[event_season == season])
+            self._append("team_games", season, team_games[team_games["season"] == season].drop(columns="season"))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def read_parquet(dataset="events", seasons=None, out_dir=PBP_DIR, columns=None):
+    """
+    A Parquet dataset ("events" or "team_games") as one frame with a season
+    column; games fetched again in a later run keep only their newest rows.
+    """
+    import pyarrow.parquet as pq
+
+    root = os.path.join(out_dir, dataset)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(root)
+    frames = []
+    for part in sorted(os.listdir(root)):
+        season = int(part.split("=", 1)[1])
+        if seasons is not None and season not in seasons:
+            continue
+        files = sorted(os.listdir(os.path.join(root, part)))
+        for i, name in enumerate(files):
+            df = pq.read_table(os.path.join(root, part, name), columns=columns).to_pandas()
+            frames.append(df.assign(season=season, _run=i))
+    if not frames:
+        return pd.DataFrame(columns=(columns or []) + ["season"])
+    df = pd.concat(frames, ignore_index=True)
+    if columns is None or "game_id" in columns:
+        newest = df.groupby("game_id")["_run"].transform("max")
+        df = df[df["_run"] == newest]
+    return df.drop(columns="_run").reset_index(drop=True)
+
+# -------------------------------------------------
+# Fetch and load
+# -------------------------------------------------
+
+def _fetch(game):
+    import requests
+    from nhl_api import get_play_by_play
+
+    try:
+        payload = get_play_by_play(game["nhl_game_id"])
+    except requests.RequestException as e:
+        logger.error(f"Failed to fetch play-by-play for game {game['nhl_game_id']}: {e}")
+        return game, None
+    return game, parse_game(payload, game["game_id"], game["home_team_id"], game["away_team_id"])
+
+
+def fetch_games(games, workers=WORKERS):
+    """
+    Yield (game, events) as downloads finish, keeping at most 2 * workers
+    games in flight; events is None when the fetch failed.
+    """
+    games = iter(games)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_fetch, g) for g in islice(games, 2 * workers)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                nxt = next(games, None)
+                if nxt is not None:
+                    pending.add(pool.submit(_fetch, nxt))
+                yield future.result()
+
+
+def ingest(games, sink, workers=WORKERS, batch=BATCH):
+    """
+    Stream `games` (dicts from GAMES_SQL) through fetch -> parse -> sink.
+    Returns (games loaded, events written, games failed).
+    """
+    loaded = written = failed = 0
+    buffer = []
+
+    def flush():
+        nonlocal loaded, written
+        events = pd.concat([e for _, e in buffer], ignore_index=True)
+        team_games = aggregate(events, pd.DataFrame([g for g, _ in buffer]))
+        sink.write(events, team_games)
+        ROWS_WRITTEN.labels("pbp_events").inc(len(events))
+        ROWS_WRITTEN.labels("pbp_team_games").inc(len(team_games))
+        loaded += len(buffer)
+        written += len(events)
+        buffer.clear()
+        logger.info(f"Loaded {loaded} games, {written} events")
+
+    for game, events in fetch_games(games, workers):
+        if events is None:
+            failed += 1
+            continue
+        GAMES_FETCHED.labels("play_by_play").inc()
+        buffer.append((game, events))
+        if len(buffer) >= batch:
+            flush()
+    if buffer:
+        flush()
+    sink.close()
+    return loaded, written, failed
+
+
+def games_to_ingest(conn, seasons=None, skip=()):
+    sql, params = GAMES_SQL, {}
+    if seasons:
+        sql += " AND season = ANY(%(seasons)s)"
+        params["seasons"] = list(seasons)
+    cur = conn.cursor()
+    cur.execute(sql + " ORDER BY game_date, id", params)
+    rows = fetch_dicts(cur)
+    cur.close()
+    skip = set(skip)
+    return [r for r in rows if r["game_id"] not in skip]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest play-by-play events")
+    parser.add_argument("--season", type=int, action="append",
+                        help="only this season (repeatable); default: all")
+    parser.add_argument("--parquet", nargs="?", const=PBP_DIR, metavar="DIR",
+                        help=f"write per-season Parquet (default dir {PBP_DIR}) instead of Postgres")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="concurrent fetches")
+    parser.add_argument("--batch", type=int, default=BATCH, help="games per write")
+    parser.add_argument("--refetch", action="store_true", help="also fetch games already loaded")
+    parser.add_argument("--limit", type=int, help="at most this many games")
+    args = parser.parse_args(argv)
+
+    from db import get_conn
+
+    conn = get_conn()
+    try:
+        sink = ParquetSink(args.parquet) if args.parquet else PostgresSink(conn)
+        skip = () if args.refetch else sink.done_game_ids()
+        games = games_to_ingest(conn, args.season, skip)[:args.limit]
+        start = time.perf_counter()
+        loaded, written, failed = ingest(games, sink, args.workers, args.batch)
+    finally:
+        conn.close()
+    seconds = time.perf_counter() - start
+    print(
+        f"Loaded {loaded} games ({written} events) in {seconds:.1f}s, "
+        f"{loaded / max(seconds, 1e-9):.1f} games/s; {failed} failed."
+    )
+    LAST_SUCCESS.labels("play_by_play").set_to_current_time()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
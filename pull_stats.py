@@ -1,159 +1,183 @@
-import requests
-import psycopg2
-from datetime import date
 import os
 from urllib.parse import urlparse
+from nhl_api import SCHEDULE_URL, STATS_URL, get_client, iter_stats_pages
+from metrics import GAMES_FETCHED, LAST_SUCCESS, ROWS_WRITTEN
 
 
-# Get DATABASE_URL from environment
-DATABASE_URL = os.environ.get("DATABASE_URL")
+def get_connection():
+    import psycopg2
 
-if not DATABASE_URL:
-    raise Exception("DATABASE_URL environment variable not set")
+    # Get DATABASE_URL from environment
+    DATABASE_URL = os.environ.get("DATABASE_URL")
 
-# Parse the URL and convert to DSN format
-result = urlparse(DATABASE_URL)
-username = result.username
-password = result.password
-database = result.path[1:]  # remove leading '/'
-hostname = result.hostname
-port = result.port
+    if not DATABASE_URL:
+        raise Exception("DATABASE_URL environment variable not set")
 
-# Connect with SSL enabled
-conn = psycopg2.connect(
-    dbname=database,
-    user=username,
-    password=password,
-    host=hostname,
-    port=port,
-    sslmode="require"
-)
+    # Parse the URL and convert to DSN format
+    result = urlparse(DATABASE_URL)
 
-cur = conn.cursor()
+    # Connect with SSL enabled
+    return psycopg2.connect(
+        dbname=result.path[1:],  # remove leading '/'
+        user=result.username,
+        password=result.password,
+        host=result.hostname,
+        port=result.port,
+        sslmode="require"
+    )
 
 # =======================
 # 1. Insert Teams
 # =======================
-teams_url = "https://api.nhle.com/stats/rest/en/team"
-teams_response = requests.get(teams_url).json()
-teams_data = teams_response.get("data", [])
-
-for team in teams_data:
-    team_id = team.get('id')
-    name = team.get('fullName')
-    abbr = team.get('rawTricode')
-
-    # Does this team already exist?
-    cur.execute(
-        "SELECT 1 FROM teams WHERE id = %s",
-        (team_id,)
-    )
 
-    if cur.fetchone():
-        # Update existing team (rebrand-safe)
-        cur.execute("""
-            UPDATE teams
-            SET name = %s,
-                abbreviation = %s
-            WHERE id = %s
-        """, (name, abbr, team_id))
-    else:
-        # Insert new team
-        cur.execute("""
+def upsert_page(cur, sql, rows):
+    """
+    One INSERT ... ON CONFLICT for a whole page, committed so a long crawl
+    keeps its progress. Rows are de-duplicated on their first column (the
+    id), since one statement cannot update the same row twice.
+    """
+    from psycopg2.extras import execute_values
+
+    rows = list({r[0]: r for r in rows}.values())
+    execute_values(cur, sql, rows, page_size=max(len(rows), 1))
+    cur.connection.commit()
+    return len(rows)
+
+
+def insert_teams(cur):
+    total = 0
+    for page in iter_stats_pages("team", endpoint="stats/team"):
+        # Update existing teams in place (rebrand-safe)
+        total += upsert_page(cur, """
             INSERT INTO teams (id, name, abbreviation)
-            VALUES (%s, %s, %s)
-        """, (team_id, name, abbr))
-
-conn.commit()
-print("Teams inserted / updated successfully.")
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE
+            SET name = EXCLUDED.name,
+                abbreviation = EXCLUDED.abbreviation
+        """, [(t.get('id'), t.get('fullName'), t.get('rawTricode')) for t in page])
+    ROWS_WRITTEN.labels("teams").inc(total)
+    return total
 
 # =======================
 # 2. Insert Players
 # =======================
-players_url = "https://api.nhle.com/stats/rest/en/players"
-players_response = requests.get(players_url).json()
-players_data = players_response.get("data", [])
-
-for player in players_data:
-    cur.execute("""
-        INSERT INTO players (id, team_id, full_name, position)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (id) DO NOTHING
-    """, (
-        player.get('playerId'),
-        player.get('teamId'),
-        player.get('fullName'),
-        player.get('positionCode', 'N/A')
-    ))
-conn.commit()
-print("Players inserted successfully.")
+
+def insert_players(cur):
+    total = 0
+    for page in iter_stats_pages("players", endpoint="stats/players"):
+        # Skip rewriting players whose team/name/position are unchanged
+        total += upsert_page(cur, """
+            INSERT INTO players (id, team_id, full_name, position)
+            VALUES %s
+            ON CONFLICT (id) DO UPDATE
+            SET team_id = EXCLUDED.team_id,
+                full_name = EXCLUDED.full_name,
+                position = EXCLUDED.position
+            WHERE (players.team_id, players.full_name, players.position)
+                IS DISTINCT FROM (EXCLUDED.team_id, EXCLUDED.full_name, EXCLUDED.position)
+        """, [
+            (
+                p.get('playerId'),
+                p.get('teamId'),
+                p.get('fullName'),
+                p.get('positionCode', 'N/A'),
+            )
+            for p in page
+        ])
+    ROWS_WRITTEN.labels("players").inc(total)
+    return total
 
 # =======================
 # 3. Insert Today's Games
 # =======================
-schedule_url = "https://api-web.nhle.com/v1/schedule/now"
-schedule_data = requests.get(schedule_url).json()
-games_to_update_stats = []
-
-for game in schedule_data.get("dates", []):
-    for g in game.get("games", []):
-        game_id = g.get("gamePk")
-        game_date = g.get("gameDate")
-        home_team = g["teams"]["home"]["team"].get("id")
-        away_team = g["teams"]["away"]["team"].get("id")
-
-        cur.execute("""
-            INSERT INTO games (game_id, game_date, home_team_id, away_team_id)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (game_id) DO NOTHING
-        """, (game_id, game_date, home_team, away_team))
-
-        # Track games that are finished to pull stats
-        if g["status"]["detailedState"] == "Final":
-            games_to_update_stats.append(game_id)
-
-conn.commit()
-print("Today's games inserted successfully.")
 
-# =======================
-# 4. Insert Player Stats for Finished Games
-# =======================
-for game_id in games_to_update_stats:
-    stats_url = f"https://api.nhle.com/stats/rest/en/game/boxscore?gameId={game_id}"
-    stats_response = requests.get(stats_url).json()
-    
-    for player in stats_response.get("data", []):
-        # Ensure it's a skater
-        if player.get("statsType") == "skater":
+def insert_todays_games(cur):
+    schedule_url = f"{SCHEDULE_URL}/now"
+    schedule_data = get_client().get_json(schedule_url, endpoint="schedule")
+    games_to_update_stats = []
+
+    for game in schedule_data.get("dates", []):
+        for g in game.get("games", []):
+            game_id = g.get("gamePk")
+            game_date = g.get("gameDate")
+            home_team = g["teams"]["home"]["team"].get("id")
+            away_team = g["teams"]["away"]["team"].get("id")
+
             cur.execute("""
-                INSERT INTO player_stats (player_id, game_id, team_id, goals, assists, points, shots, hits, time_on_ice)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (player_id, game_id) DO UPDATE
-                SET goals=%s, assists=%s, points=%s, shots=%s, hits=%s, time_on_ice=%s
-            """, (
-                player.get("playerId"),
-                game_id,
-                player.get("teamId"),
-                player.get("goals", 0),
-                player.get("assists", 0),
-                player.get("points", 0),
-                player.get("shots", 0),
-                player.get("hits", 0),
-                player.get("timeOnIce", "00:00"),
-                player.get("goals", 0),
-                player.get("assists", 0),
-                player.get("points", 0),
-                player.get("shots", 0),
-                player.get("hits", 0),
-                player.get("timeOnIce", "00:00"),
-            ))
-
-conn.commit()
-print("Player stats updated successfully.")
+                INSERT INTO games (game_id, game_date, home_team_id, away_team_id)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (game_id) DO NOTHING
+            """, (game_id, game_date, home_team, away_team))
+
+            # Track games that are finished to pull stats
+            if g["status"]["detailedState"] == "Final":
+                games_to_update_stats.append(game_id)
+    return games_to_update_stats
 
 # =======================
-# Close connection
+# 4. Insert Player Stats for Finished Games
 # =======================
-cur.close()
-conn.close()
-print("Database update complete.")
+
+def insert_player_stats(cur, games_to_update_stats):
+    for game_id in games_to_update_stats:
+        stats_url = f"{STATS_URL}/game/boxscore?gameId={game_id}"
+        stats_response = get_client().get_json(stats_url, endpoint="stats/boxscore")
+        GAMES_FETCHED.labels("pull_stats").inc()
+    
+        for player in stats_response.get("data", []):
+            # Ensure it's a skater
+            if player.get("statsType") == "skater":
+                cur.execute("""
+                    INSERT INTO player_stats (player_id, game_id, team_id, goals, assists, points, shots, hits, time_on_ice)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (player_id, game_id) DO UPDATE
+                    SET goals=%s, assists=%s, points=%s, shots=%s, hits=%s, time_on_ice=%s
+                """, (
+                    player.get("playerId"),
+                    game_id,
+                    player.get("teamId"),
+                    player.get("goals", 0),
+                    player.get("assists", 0),
+                    player.get("points", 0),
+                    player.get("shots", 0),
+                    player.get("hits", 0),
+                    player.get("timeOnIce", "00:00"),
+                    player.get("goals", 0),
+                    player.get("assists", 0),
+                    player.get("points", 0),
+                    player.get("shots", 0),
+                    player.get("hits", 0),
+                    player.get("timeOnIce", "00:00"),
+                ))
+                ROWS_WRITTEN.labels("player_stats").inc()
+
+
+def main():
+    conn = get_connection()
+    cur = conn.cursor()
+
+    n = insert_teams(cur)
+    print(f"Teams inserted / updated successfully ({n}).")
+
+    n = insert_players(cur)
+    print(f"Players inserted / updated successfully ({n}).")
+
+    games_to_update_stats = insert_todays_games(cur)
+    conn.commit()
+    print("Today's games inserted successfully.")
+
+    insert_player_stats(cur, games_to_update_stats)
+    conn.commit()
+    print("Player stats updated successfully.")
+
+    # =======================
+    # Close connection
+    # =======================
+    cur.close()
+    conn.close()
+    print("Database update complete.")
+    LAST_SUCCESS.labels("pull_stats").set_to_current_time()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Schedule context for every team-game: rest, back-to-backs, density,
+home/road streaks and travel.
+
+Context depends only on the schedule (dates, venues, home/away), not on
+results, so it covers scheduled games too and a whole season's pre-game
+features exist as soon as its schedule is ingested. One vectorized pass
+over (team, date)-sorted team-games computes:
+
+    days_since_last  calendar days since the team's previous game (season)
+    rest_days        days off in between (0 on a back-to-back)
+    back_to_back     played the previous day
+    games_last_4d    games in the 4 / 7 days ending with this one
+    games_last_7d
+    home_streak      consecutive home (or road) games including this one
+    road_streak
+    travel_km        great-circle distance from the previous game's venue
+                     (from the home arena for a season opener)
+
+Venue coordinates come from public.venues, seeded with the current arenas;
+games at an unknown venue fall back to the home team's usual arena.
+ingest_schedule recomputes the affected teams' seasons in the same
+transaction whenever it inserts or reschedules games.
+"""
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from db import copy_frame, fetch_dicts
+
+# Game days are counted in North American evenings: 02:00 UTC is still the
+# previous day's game
+DAY_OFFSET = pd.Timedelta(hours=10)
+WINDOWS = (4, 7)
+EARTH_RADIUS_KM = 6371.0
+
+# venue -> (latitude, longitude); names as the schedule API reports them,
+# with former names of the same buildings
+VENUES = {
+    "Honda Center": (33.8078, -117.8765),
+    "Delta Center": (40.7683, -111.9011),
+    "Mullett Arena": (33.4255, -111.9325),
+    "Gila River Arena": (33.5319, -112.2611),
+    "TD Garden": (42.3662, -71.0621),
+    "KeyBank Center": (42.8750, -78.8764),
+    "Scotiabank Saddledome": (51.0374, -114.0519),
+    "PNC Arena": (35.8033, -78.7220),
+    "Lenovo Center": (35.8033, -78.7220),
+    "United Center": (41.8807, -87.6742),
+    "Ball Arena": (39.7487, -105.0077),
+    "Nationwide Arena": (39.9693, -83.0061),
+    "American Airlines Center": (32.7905, -96.8103),
+    "Little Caesars Arena": (42.3411, -83.0553),
+    "Rogers Place": (53.5469, -113.4979),
+    "Amerant Bank Arena": (26.1584, -80.3257),
+    "FLA Live Arena": (26.1584, -80.3257),
+    "BB&T Center": (26.1584, -80.3257),
+    "Crypto.com Arena": (34.0430, -118.2673),
+    "STAPLES Center": (34.0430, -118.2673),
+    "Xcel Energy Center": (44.9448, -93.1010),
+    "Grand Casino Arena": (44.9448, -93.1010),
+    "Centre Bell": (45.4961, -73.5693),
+    "Bell Centre": (45.4961, -73.5693),
+    "Bridgestone Arena": (36.1592, -86.7785),
+    "Prudential Center": (40.7334, -74.1711),
+    "UBS Arena": (40.7117, -73.7256),
+    "Nassau Veterans Memorial Coliseum": (40.7229, -73.5904),
+    "Madison Square Garden": (40.7505, -73.9934),
+    "Canadian Tire Centre": (45.2969, -75.9272),
+    "Wells Fargo Center": (39.9012, -75.1720),
+    "Xfinity Mobile Arena": (39.9012, -75.1720),
+    "PPG Paints Arena": (40.4394, -79.9892),
+    "SAP Center at San Jose": (37.3327, -121.9012),
+    "Climate Pledge Arena": (47.6221, -122.3540),
+    "Enterprise Center": (38.6268, -90.2026),
+    "Amalie Arena": (27.9427, -82.4519),
+    "Benchmark International Arena": (27.9427, -82.4519),
+    "Scotiabank Arena": (43.6435, -79.3791),
+    "Rogers Arena": (49.2778, -123.1089),
+    "T-Mobile Arena": (36.1029, -115.1784),
+    "Capital One Arena": (38.8981, -77.0209),
+    "Canada Life Centre": (49.8928, -97.1436),
+}
+
+CONTEXT_COLUMNS = [
+    "game_id", "team_id", "opp_team_id", "season", "date", "is_home",
+    "days_since_last", "rest_days", "back_to_back",
+    *(f"games_last_{n}d" for n in WINDOWS),
+    "home_streak", "road_streak", "travel_km",
+]
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS public.venues (
+        name TEXT PRIMARY KEY,
+        latitude DOUBLE PRECISION NOT NULL,
+        longitude DOUBLE PRECISION NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.schedule_context (
+        game_id INTEGER NOT NULL,
+        team_id INTEGER NOT NULL,
+        opp_team_id INTEGER NOT NULL,
+        season INTEGER,
+        date TIMESTAMP NOT NULL,
+        is_home BOOLEAN NOT NULL,
+        days_since_last INTEGER,
+        rest_days INTEGER,
+        back_to_back BOOLEAN NOT NULL,
+        games_last_4d SMALLINT NOT NULL,
+        games_last_7d SMALLINT NOT NULL,
+        home_streak SMALLINT NOT NULL,
+        road_streak SMALLINT NOT NULL,
+        travel_km REAL,
+        PRIMARY KEY (game_id, team_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS schedule_context_team_date_idx
+    ON public.schedule_context (team_id, date)
+    """,
+]
+
+GAMES_SQL = """
+    SELECT g.id AS game_id, g.season, g.game_date AS date,
+           g.home_team_id, g.away_team_id, v.latitude, v.longitude
+    FROM public.games g
+    LEFT JOIN public.venues v ON v.name = g.venue
+    WHERE g.game_date IS NOT NULL
+"""
+
+
+def ensure_schedule_tables(target):
+    """
+    Create the tables and seed public.venues on a DB-API cursor or a
+    SQLAlchemy connection (existing rows are kept, so corrected coordinates
+    survive).
+    """
+    from events import _execute
+
+    for stmt in SCHEDULE_TABLES_SQL:
+        _execute(target, stmt)
+    rows = ", ".join(["(%s, %s, %s)"] * len(VENUES))
+    params = tuple(v for name, (lat, lon) in VENUES.items() for v in (name, lat, lon))
+    _execute(target, f"""
+        INSERT INTO public.venues (name, latitude, longitude)
+        VALUES {rows}
+        ON CONFLICT (name) DO NOTHING
+    """, params)
+
+# -------------------------------------------------
+# Vectorized pass
+# -------------------------------------------------
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype="float64")) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _home_arenas(games):
+    """
+    Each team's most frequent known home venue coordinates.
+    """
+    known = games.dropna(subset=["latitude", "longitude"])
+    counts = known.groupby(["home_team_id", "latitude", "longitude"]).size().reset_index(name="n")
+    best = counts.sort_values("n", ascending=False).drop_duplicates("home_team_id")
+    return best.set_index("home_team_id")[["latitude", "longitude"]]
+
+
+def build_context(games):
+    """
+    One row per team-game (CONTEXT_COLUMNS) from games with game_id,
+    season, date, home_team_id, away_team_id, latitude, longitude.
+    """
+    games = games.copy()
+    arenas = _home_arenas(games)
+    missing = games["latitude"].isna()
+    home_arena = arenas.reindex(games.loc[missing, "home_team_id"]).to_numpy()
+    games.loc[missing, ["latitude", "longitude"]] = home_arena
+
+    tg = pd.concat([
+        games.assign(team_id=games["home_team_id"], opp_team_id=games["away_team_id"], is_home=True),
+        games.assign(team_id=games["away_team_id"], opp_team_id=games["home_team_id"], is_home=False),
+    ], ignore_index=True)
+    tg = tg.sort_values(["team_id", "date", "game_id"], ignore_index=True)
+
+    team = tg["team_id"].to_numpy()
+    season = tg["season"].to_numpy()
+    is_home = tg["is_home"].to_numpy()
+    day = ((pd.to_datetime(tg["date"]) - DAY_OFFSET).dt.normalize().to_numpy()
+           .astype("datetime64[D]").astype("int64"))
+
+    # Previous game of the same team and season
+    same_prev = np.r_[False, (team[1:] == team[:-1]) & (season[1:] == season[:-1])]
+    days_since = day - np.r_[0, day[:-1]]
+
+    out = tg[["game_id", "team_id", "opp_team_id", "season", "date", "is_home"]].copy()
+    out["days_since_last"] = pd.Series(days_since).where(same_prev).astype("Int64")
+    out["rest_days"] = out["days_since_last"] - 1
+    out["back_to_back"] = same_prev & (days_since == 1)
+
+    # Games in the trailing window: a range count on the (team, day) key
+    _, team_code = np.unique(team, return_inverse=True)
+    key = team_code.astype("int64") * 1_000_000 + day
+    pos = np.arange(len(key))
+    for n in WINDOWS:
+        first = np.searchsorted(key, key - (n - 1), side="left")
+        out[f"games_last_{n}d"] = (pos - first + 1).astype("int16")
+
+    # Run lengths of consecutive home / road games
+    new_run = ~same_prev | np.r_[True, is_home[1:] != is_home[:-1]]
+    run_id = np.cumsum(new_run)
+    streak = (pos - np.flatnonzero(new_run)[run_id - 1] + 1).astype("int16")
+    out["home_streak"] = np.where(is_home, streak, 0).astype("int16")
+    out["road_streak"] = np.where(is_home, 0, streak).astype("int16")
+
+    # Travel from the previous venue, or from home for a season opener
+    lat = tg["latitude"].to_numpy(dtype="float64")
+    lon = tg["longitude"].to_numpy(dtype="float64")
+    own = arenas.reindex(team)
+    prev_lat = np.where(same_prev, np.r_[np.nan, lat[:-1]], own["latitude"].to_numpy(dtype="float64"))
+    prev_lon = np.where(same_prev, np.r_[np.nan, lon[:-1]], own["longitude"].to_numpy(dtype="float64"))
+    out["travel_km"] = haversine_km(prev_lat, prev_lon, lat, lon).astype("float32")
+    return out[CONTEXT_COLUMNS]
+
+# -------------------------------------------------
+# Storage
+# -------------------------------------------------
+
+def update_schedule_context(cur, team_ids=None, seasons=None):
+    """
+    Recompute and replace the context rows of `team_ids` in `seasons`
+    (None: all) on a DB-API cursor; the caller commits. Returns the number
+    of rows written.
+    """
+    game_where, ctx_where, params = "", "", {}
+    if seasons is not None:
+        game_where += " AND g.season = ANY(%(seasons)s)"
+        ctx_where += " AND season = ANY(%(seasons)s)"
+        params["seasons"] = list(seasons)
+    if team_ids is not None:
+        game_where += " AND (g.home_team_id = ANY(%(teams)s) OR g.away_team_id = ANY(%(teams)s))"
+        ctx_where += " AND team_id = ANY(%(teams)s)"
+        params["teams"] = list(team_ids)
+    cur.execute(GAMES_SQL + game_where, params)
+    games = pd.DataFrame(fetch_dicts(cur), columns=[d[0] for d in cur.description])
+
+    ctx = build_context(games) if len(games) else pd.DataFrame(columns=CONTEXT_COLUMNS)
+    if team_ids is not None:
+        ctx = ctx[ctx["team_id"].isin(list(team_ids))]
+
+    if params:
+        cur.execute("DELETE FROM public.schedule_context WHERE TRUE" + ctx_where, params)
+    else:
+        cur.execute("TRUNCATE public.schedule_context")
+
+    copy_frame(cur, "schedule_context", ctx[CONTEXT_COLUMNS])
+    return len(ctx)
+
+
+def context_for_games(bind, game_ids):
+    """
+    Context rows (game_id, team_id, ...) for merging into team-game features.
+    """
+    from sqlalchemy import text
+
+    with bind.connect() as conn:
+        return pd.read_sql(
+            text(f"SELECT {', '.join(CONTEXT_COLUMNS)} FROM public.schedule_context WHERE game_id = ANY(:ids)"),
+            conn, params={"ids": list(game_ids)},
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the schedule-context table")
+    parser.add_argument("--season", type=int, action="append",
+                        help="only recompute this season (repeatable); default: all")
+    args = parser.parse_args(argv)
+
+    from db import get_conn
+
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        ensure_schedule_tables(cur)
+        n = update_schedule_context(cur, seasons=args.season)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    print(f"Wrote {n} schedule-context rows.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
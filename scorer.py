@@ -0,0 +1,139 @@
+"""
+Dependency-free scorer for exported Poisson goals models.
+
+export_model.py compiles a fitted PoissonRegressor and the preprocessing of
+its training module into one JSON artifact:
+
+    inputs    raw columns the model reads (view / training frame columns)
+    steps     derived columns, in order: eq, div, mul, sub_lookup
+    clip      {feature: [lo, hi]} applied after the steps
+    features  model columns, in coefficient order
+    coef, intercept, dtype, output_clip
+
+Scoring is then the same NumPy operations the training code runs through
+pandas, followed by exp(X @ coef + intercept) in the coefficients' dtype
+(sklearn keeps float32 coefficients for float32 training data), so
+predictions match sklearn's and serving needs neither sklearn nor scipy.
+"""
+import json
+import os
+
+import numpy as np
+
+MODEL_DIR = os.getenv("NHL_MODEL_DIR", "models")
+FORMAT_VERSION = 1
+
+
+def artifact_path(name):
+    return os.path.join(MODEL_DIR, f"{name}.json")
+
+
+def _column(values):
+    arr = np.asarray(values)
+    # Numbers from DB rows (None, Decimal) become float; labels stay as they are
+    if arr.dtype == object and not any(isinstance(v, str) for v in arr):
+        arr = np.array([np.nan if v is None else v for v in arr], dtype="float64")
+    return arr
+
+
+def _lookup(keys, table, default):
+    return np.array([table.get(str(k), default) for k in keys.tolist()], dtype="float64")
+
+
+class Scorer:
+    def __init__(self, artifact):
+        if artifact.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact format {artifact.get('format')!r}")
+        self.name = artifact["name"]
+        self.version = artifact["version"]
+        self.inputs = artifact["inputs"]
+        self.steps = artifact["steps"]
+        self.clip = artifact["clip"]
+        self.features = artifact["features"]
+        dtype = np.dtype(artifact.get("dtype", "float64"))
+        self.coef = np.asarray(artifact["coef"], dtype=dtype)
+        self.intercept = dtype.type(artifact["intercept"])
+        self.output_clip = artifact.get("output_clip")
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def transform(self, frame):
+        """
+        float32 feature matrix from raw input columns (a DataFrame or a dict
+        of arrays), preprocessed the way the training module does it.
+        """
+        cols = {c: _column(frame[c]) for c in self.inputs}
+        # Flags are mapped first, then missing numbers become 0, as in preprocess()
+        for step in self.steps:
+            if step["op"] == "eq":
+                cols[step["out"]] = (cols[step["in"][0]] == step["value"]).astype("int8")
+        for name, arr in cols.items():
+            if arr.dtype.kind == "f":
+                cols[name] = np.where(np.isnan(arr), 0, arr).astype(arr.dtype)
+
+        for step in self.steps:
+            op, args = step["op"], [cols[c] for c in step["in"]]
+            if op == "eq":
+                continue
+            elif op == "div":
+                out = args[0] / step["value"]
+            elif op == "mul":
+                out = args[0] * args[1]
+            elif op == "sub_lookup":
+                out = args[0] - _lookup(args[1], step["table"], step["default"])
+            else:
+                raise ValueError(f"Unknown step {op!r}")
+            cols[step["out"]] = out
+
+        for name, (lo, hi) in self.clip.items():
+            cols[name] = np.clip(cols[name], lo, hi)
+        # Column-major like DataFrame.to_numpy(); float32 sums depend on the layout
+        X = np.empty((len(cols[self.inputs[0]]), len(self.features)), dtype="float32", order="F")
+        for j, name in enumerate(self.features):
+            X[:, j] = cols[name]
+        return X
+
+    def predict(self, X):
+        """
+        Expected goals for an already preprocessed feature matrix.
+        """
+        pred = np.exp(X @ self.coef + self.intercept)
+        if self.output_clip:
+            pred = pred.clip(*self.output_clip)
+        return pred
+
+    def score(self, frame):
+        return self.predict(self.transform(frame))
+
+
+def export(model, name, version, inputs, steps, features, clip=None, output_clip=None):
+    """
+    Artifact dict for a fitted PoissonRegressor (only coef_ / intercept_
+    are read, so sklearn itself isn't imported here).
+    """
+    return {
+        "format": FORMAT_VERSION,
+        "name": name,
+        "version": version,
+        "inputs": list(inputs),
+        "steps": steps,
+        "clip": {k: [lo, hi] for k, (lo, hi) in (clip or {}).items()},
+        "features": list(features),
+        "coef": [float(c) for c in model.coef_],
+        "intercept": float(model.intercept_),
+        "dtype": str(np.asarray(model.coef_).dtype),
+        "output_clip": list(output_clip) if output_clip else None,
+    }
+
+
+def save_artifact(artifact):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = artifact_path(artifact["name"])
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
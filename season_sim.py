@@ -0,0 +1,296 @@
+"""
+Remaining-season simulator: standings points and playoff odds.
+
+Final games in `games` count as played; every scheduled regular-season game
+is scored by the served goals model (each side's latest rolling form from the
+feature view) and turned into home/away regulation, OT and OT-loss
+probabilities with outcomes.py. Seasons are simulated as (sims, games)
+arrays, split across worker processes, with tiebreaks and the 3-per-division
+plus two wild cards format applied to whole batches at once.
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from instrument import run, stage
+from outcomes import home_ot_share, simulate_slate
+
+N_SIMS = 10_000
+# Sims per worker task; bounds each worker's (sims, games) arrays
+BATCH = 2_000
+REGULAR_SEASON = 2
+DIVISION_SPOTS = 3
+WILD_CARDS = 2
+
+# abbreviation -> (conference, division)
+DIVISIONS = {
+    **{t: ("Eastern", "Atlantic") for t in ("BOS", "BUF", "DET", "FLA", "MTL", "OTT", "TBL", "TOR")},
+    **{t: ("Eastern", "Metropolitan") for t in ("CAR", "CBJ", "NJD", "NYI", "NYR", "PHI", "PIT", "WSH")},
+    **{t: ("Western", "Central") for t in ("ARI", "CHI", "COL", "DAL", "MIN", "NSH", "STL", "UTA", "WPG")},
+    **{t: ("Western", "Pacific") for t in ("ANA", "CGY", "EDM", "LAK", "SEA", "SJS", "VAN", "VGK")},
+}
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------
+# Inputs
+# -------------------------------------------------
+
+SEASON_GAMES_SQL = """
+    SELECT g.id AS game_id, g.game_date, g.home_team_id, g.away_team_id,
+           g.home_score, g.away_score, g.status
+    FROM public.games g
+    WHERE g.season = :season
+      AND COALESCE(g.game_type, :regular) = :regular
+    ORDER BY g.game_date, g.id
+"""
+
+# Latest rolling form per team, the same columns the model is fed
+FORM_SQL = """
+    SELECT DISTINCT ON (team_id)
+        team_id, shots_last5, hits_last5, points_last5
+    FROM public.team_vs_opponent_mv
+    ORDER BY team_id, date DESC, game_id DESC
+"""
+
+FORM_COLS = ["shots_last5", "hits_last5", "points_last5"]
+
+
+def latest_season(bind):
+    with bind.connect() as conn:
+        return conn.execute(text("SELECT MAX(season) FROM public.games")).scalar()
+
+
+def load_season(bind, season):
+    with bind.connect() as conn:
+        games = pd.read_sql(text(SEASON_GAMES_SQL), conn,
+                            params={"season": season, "regular": REGULAR_SEASON})
+        teams = pd.read_sql(text("SELECT id AS team_id, abbreviation FROM public.teams"), conn)
+    playing = set(games["home_team_id"]) | set(games["away_team_id"])
+    return teams[teams["team_id"].isin(playing)].reset_index(drop=True), games
+
+
+def load_form(bind):
+    with bind.connect() as conn:
+        return pd.read_sql(text(FORM_SQL), conn)
+
+
+def assign_divisions(teams):
+    """
+    Add conference/division columns. Unknown abbreviations (e.g. synthetic
+    leagues) are dealt into two conferences of two divisions by team id.
+    """
+    teams = teams.copy()
+    known = teams["abbreviation"].map(DIVISIONS)
+    teams["conference"] = known.map(lambda k: k[0], na_action="ignore").astype(object)
+    teams["division"] = known.map(lambda k: k[1], na_action="ignore").astype(object)
+    unknown = known.isna()
+    if unknown.any():
+        logger.warning(f"{int(unknown.sum())} team(s) without a division mapping; assigning by id")
+        order = teams.loc[unknown, "team_id"].rank(method="first").astype(int) - 1
+        teams.loc[unknown, "conference"] = [f"Conference {i % 2 + 1}" for i in order]
+        teams.loc[unknown, "division"] = [f"Division {i % 4 + 1}" for i in order]
+    return teams
+
+
+def expected_goals(games, form, model=None):
+    """
+    (home_mu, away_mu) for scheduled games from each side's latest form.
+    Teams without a row yet get the league average form.
+    """
+    import team_vs_opponent_predictions as base
+
+    if model is None:
+        from serving import get_model
+        model = get_model().model
+
+    form = form.set_index("team_id")[FORM_COLS]
+    league = form.mean()
+
+    def side(team_ids):
+        return form.reindex(team_ids).fillna(league).to_numpy(dtype="float32")
+
+    def predict(own, opp, home_away):
+        X = pd.DataFrame(np.hstack([own, opp]), columns=FORM_COLS + [f"opp_{c}" for c in FORM_COLS])
+        X["home_away"] = home_away
+        return model.predict(X[base.FEATURES].to_numpy(dtype="float32"))
+
+    home, away = side(games["home_team_id"]), side(games["away_team_id"])
+    return predict(home, away, 1), predict(away, home, 0)
+
+# -------------------------------------------------
+# Batch simulation (runs in worker processes)
+# -------------------------------------------------
+
+def _simulate_batch(args):
+    """
+    Simulate n seasons; returns summed counts so only small arrays cross
+    the process boundary.
+    """
+    (n, seed, cum, home_idx, away_idx, base_points, base_rw, base_wins,
+     div_members, conf_members, max_points) = args
+    rng = np.random.default_rng(seed)
+    n_teams = len(base_points)
+
+    # Outcome per game: 0 home reg win, 1 home OT win, 2 away OT win, 3 away reg win
+    u = rng.random((n, cum.shape[1]), dtype="float32")
+    outcome = (u >= cum[0]).astype("int8") + (u >= cum[1]) + (u >= cum[2])
+
+    home_pts = np.select([outcome <= 1, outcome == 2], [2, 1], 0).astype("float32")
+    away_pts = np.select([outcome == 3, outcome == 1], [2, 1], 0).astype("float32")
+
+    # Game -> team incidence, so per-team sums are two matmuls
+    H = np.zeros((len(home_idx), n_teams), dtype="float32")
+    A = np.zeros_like(H)
+    H[np.arange(len(home_idx)), home_idx] = 1
+    A[np.arange(len(away_idx)), away_idx] = 1
+
+    points = base_points + home_pts @ H + away_pts @ A
+    rw = base_rw + (outcome == 0).astype("float32") @ H + (outcome == 3).astype("float32") @ A
+    wins = base_wins + (outcome <= 1).astype("float32") @ H + (outcome >= 2).astype("float32") @ A
+
+    # Tiebreaks: points, regulation wins, wins, then a coin flip
+    key = (points.astype("float64") * 1e6 + rw.astype("float64") * 1e3 + wins
+           + rng.random((n, n_teams)))
+
+    playoffs = np.zeros((n, n_teams), dtype=bool)
+    div_winner = np.zeros((n, n_teams), dtype=bool)
+    rows = np.arange(n)[:, None]
+    for members in div_members:
+        order = members[np.argsort(-key[:, members], axis=1)]
+        playoffs[rows, order[:, :DIVISION_SPOTS]] = True
+        div_winner[rows, order[:, :1]] = True
+    for members in conf_members:
+        wild = np.where(playoffs[:, members], -np.inf, key[:, members])
+        order = members[np.argsort(-wild, axis=1)]
+        playoffs[rows, order[:, :WILD_CARDS]] = True
+
+    hist = np.zeros((n_teams, max_points + 1), dtype="int64")
+    pts = points.astype("int64").T
+    for t in range(n_teams):
+        hist[t] = np.bincount(pts[t], minlength=max_points + 1)
+    return hist, playoffs.sum(axis=0), div_winner.sum(axis=0)
+
+
+def simulate_season(teams, games, home_mu, away_mu, n_sims=N_SIMS, workers=None, seed=None):
+    """
+    teams: team_id, abbreviation, conference, division. games: the season's
+    games, final or scheduled; home_mu/away_mu line up with the scheduled ones.
+    """
+    index = {t: i for i, t in enumerate(teams["team_id"])}
+    n_teams = len(teams)
+    played = games[games["status"] == "final"]
+    remaining = games[games["status"] != "final"]
+
+    # Played results. OT/SO isn't stored, so played losses score 0 points
+    # and every played win counts as a regulation win.
+    home_won = (played["home_score"] > played["away_score"]).to_numpy()
+    h = played["home_team_id"].map(index).to_numpy()
+    a = played["away_team_id"].map(index).to_numpy()
+    base_wins = (np.bincount(h[home_won], minlength=n_teams)
+                 + np.bincount(a[~home_won], minlength=n_teams)).astype("float32")
+    base_points = 2 * base_wins
+    base_rw = base_wins.copy()
+
+    home_mu = np.asarray(home_mu, dtype="float64")
+    away_mu = np.asarray(away_mu, dtype="float64")
+    if len(home_mu):
+        probs = simulate_slate(pd.DataFrame({"home_mu": home_mu, "away_mu": away_mu}))
+        share = home_ot_share(home_mu, away_mu)
+        p = np.column_stack([
+            probs["p_home_reg"], probs["p_ot"] * share, probs["p_ot"] * (1 - share), probs["p_away_reg"],
+        ])
+        p /= p.sum(axis=1, keepdims=True)
+        cum = np.cumsum(p, axis=1)[:, :3].T.astype("float32")
+    else:
+        cum = np.zeros((3, 0), dtype="float32")
+
+    home_idx = remaining["home_team_id"].map(index).to_numpy()
+    away_idx = remaining["away_team_id"].map(index).to_numpy()
+    per_team = np.bincount(np.concatenate([home_idx, away_idx]), minlength=n_teams)
+    max_points = int((base_points + 2 * per_team).max())
+
+    div_members = [np.flatnonzero(teams["division"].to_numpy() == d) for d in teams["division"].unique()]
+    conf_members = [np.flatnonzero(teams["conference"].to_numpy() == c) for c in teams["conference"].unique()]
+
+    sizes = [min(BATCH, n_sims - lo) for lo in range(0, n_sims, BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [
+        (n, s, cum, home_idx, away_idx, base_points, base_rw, base_wins,
+         div_members, conf_members, max_points)
+        for n, s in zip(sizes, seeds)
+    ]
+
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_batch, tasks))
+    else:
+        results = [_simulate_batch(t) for t in tasks]
+
+    hist = sum(r[0] for r in results)
+    playoff_counts = sum(r[1] for r in results)
+    div_counts = sum(r[2] for r in results)
+
+    cdf = hist.cumsum(axis=1) / n_sims
+    pts_axis = np.arange(max_points + 1)
+    out = teams[["team_id", "abbreviation", "conference", "division"]].copy()
+    out["points"] = base_points.astype(int)
+    out["remaining"] = per_team
+    out["mean_points"] = (hist * pts_axis).sum(axis=1) / n_sims
+    for q in (10, 50, 90):
+        out[f"p{q}_points"] = (cdf < q / 100).sum(axis=1)
+    out["playoff_prob"] = playoff_counts / n_sims
+    out["division_prob"] = div_counts / n_sims
+    return out.sort_values(["conference", "mean_points"], ascending=[True, False], ignore_index=True)
+
+# -------------------------------------------------
+# Entry point
+# -------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the rest of the season")
+    parser.add_argument("--season", type=int, help="e.g. 20252026 (default: latest)")
+    parser.add_argument("--sims", type=int, default=N_SIMS)
+    parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", help="write the table to this CSV")
+    args = parser.parse_args(argv)
+
+    from db import get_engine
+
+    bind = get_engine()
+    with run("season_sim"):
+        season = args.season or latest_season(bind)
+        with stage("load season") as s:
+            teams, games = load_season(bind, season)
+            s.out(games)
+        teams = assign_divisions(teams)
+
+        remaining = games[games["status"] != "final"]
+        with stage("score remaining", rows_in=len(remaining)):
+            home_mu, away_mu = expected_goals(remaining, load_form(bind))
+
+        with stage("simulate", rows_in=args.sims) as s:
+            table = s.out(simulate_season(
+                teams, games, home_mu, away_mu, args.sims, args.workers, args.seed
+            ))
+
+    print(f"Season {season}: {len(games) - len(remaining)} played, "
+          f"{len(remaining)} remaining, {args.sims} simulations")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if args.out:
+        table.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
@@ -0,0 +1,239 @@
+"""
+Serves the base Poisson goals model from team_vs_opponent_predictions on
+pre-game features (each team's latest form before the game, so scheduled
+games can be scored), with win / OT / puck line / totals probabilities from outcomes.py and, when
+a bootstrap ensemble has been saved (ensemble.py), a 90% interval on each
+team's expected goals.
+
+The model is loaded from its exported artifact (export_model.py) when one
+exists, which needs only NumPy; otherwise it is fitted with sklearn on the
+full training frame. Either happens once, the first time it is needed. Feature rows and predictions are
+cached per (game_id, model_version) and dropped when a game involving the
+same teams goes final or the feature view is refreshed.
+"""
+import os
+import threading
+import time
+
+import team_vs_opponent_predictions as base
+from cache import MISSING, LRUTTLCache
+from db import fetch_dicts
+from elo import pregame_ratings
+from ensemble import get_ensemble, predict_interval
+from events import GAME_FINAL, VIEW_REFRESHED
+from metrics import MODEL_LOAD_SECONDS, PREDICTIONS
+from outcomes import simulate_slate
+from scorer import Scorer, artifact_path
+from team_vs_opponent_view import VIEW_NAME
+
+MODEL_NAME = "poisson_base"
+
+CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+
+FEATURE_CACHE = LRUTTLCache("features", maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+PREDICTION_CACHE = LRUTTLCache("predictions", maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+# Pre-game features for any game in `games`, scheduled ones included: each
+# side's form is its latest view row strictly before the game, so a final
+# game's own box score never reaches its features (the view's rolling
+# window includes the current row)
+GAME_FEATURES_SQL = f"""
+    WITH sides AS (
+        SELECT g.id AS game_id, g.game_date AS date, g.season,
+               g.home_team_id AS team_id, g.away_team_id AS opp_team_id,
+               'home' AS home_away, g.home_score AS goals, g.away_score AS goals_against
+        FROM public.games g
+        WHERE g.id = %s
+        UNION ALL
+        SELECT g.id, g.game_date, g.season,
+               g.away_team_id, g.home_team_id,
+               'away', g.away_score, g.home_score
+        FROM public.games g
+        WHERE g.id = %s
+    )
+    SELECT
+        s.game_id, s.team_id, t.abbreviation AS team_abbrev, s.home_away,
+        s.opp_team_id, o.abbreviation AS opp_abbrev, s.goals, s.goals_against,
+        f.shots_last5, f.hits_last5, f.points_last5,
+        fo.shots_last5 AS opp_shots_last5,
+        fo.hits_last5 AS opp_hits_last5,
+        fo.points_last5 AS opp_points_last5,
+        s.date, s.season
+    FROM sides s
+    JOIN public.teams t ON t.id = s.team_id
+    JOIN public.teams o ON o.id = s.opp_team_id
+    LEFT JOIN LATERAL (
+        SELECT shots_last5, hits_last5, points_last5
+        FROM {VIEW_NAME} v
+        WHERE v.team_id = s.team_id AND v.date < s.date
+        ORDER BY v.date DESC, v.game_id DESC
+        LIMIT 1
+    ) f ON true
+    LEFT JOIN LATERAL (
+        SELECT shots_last5, hits_last5, points_last5
+        FROM {VIEW_NAME} v
+        WHERE v.team_id = s.opp_team_id AND v.date < s.date
+        ORDER BY v.date DESC, v.game_id DESC
+        LIMIT 1
+    ) fo ON true
+    ORDER BY s.home_away DESC
+"""
+
+_model = None
+_model_lock = threading.Lock()
+
+
+class ServedModel:
+    def __init__(self, model, version, load_seconds):
+        self.model = model
+        self.version = version
+        self.load_seconds = load_seconds
+
+
+def fit_model():
+    from sklearn.linear_model import PoissonRegressor
+    from feature_store import load_training_frame
+
+    start = time.perf_counter()
+    df = base.preprocess(load_training_frame(columns=base.COLUMNS))
+    model = PoissonRegressor(alpha=0.001, max_iter=1000)
+    model.fit(df[base.FEATURES].to_numpy(dtype="float32"), df[base.TARGET].to_numpy())
+    seconds = time.perf_counter() - start
+
+    # Changes whenever the training data does
+    version = f"{MODEL_NAME}-{df['date'].max():%Y%m%d}-{len(df)}"
+    MODEL_LOAD_SECONDS.labels(MODEL_NAME).set(seconds)
+    print(f"Loaded model {version} in {seconds:.2f}s")
+    return ServedModel(model, version, seconds)
+
+
+def load_exported():
+    """
+    The exported scorer for MODEL_NAME, or None if there is no usable one.
+    """
+    path = artifact_path(MODEL_NAME)
+    if not os.path.exists(path):
+        return None
+
+    start = time.perf_counter()
+    scorer = Scorer.load(path)
+    if scorer.features != base.FEATURES:
+        print(f"Ignoring {path}: exported for features {scorer.features}")
+        return None
+    seconds = time.perf_counter() - start
+    MODEL_LOAD_SECONDS.labels(MODEL_NAME).set(seconds)
+    print(f"Loaded exported model {scorer.version} in {seconds:.3f}s")
+    return ServedModel(scorer, scorer.version, seconds)
+
+
+def get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_exported() or fit_model()
+        return _model
+
+
+def _tags(game_id, team_ids):
+    return [("game", game_id)] + [("team", int(t)) for t in team_ids]
+
+
+def game_features(connection, game_id, version):
+    """
+    Preprocessed pre-game feature rows for both teams of a game, or None if
+    the game does not exist. Teams with no earlier final game get zero form.
+    `connection` is a context manager yielding a DB-API connection; it is
+    only entered on a cache miss.
+    """
+    import pandas as pd
+
+    key = (game_id, version)
+    df = FEATURE_CACHE.get(key)
+    if df is not MISSING:
+        return df
+
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute(GAME_FEATURES_SQL, (game_id, game_id))
+        rows = fetch_dicts(cur)
+        ratings = pregame_ratings(cur, game_id) if rows else {}
+        cur.close()
+    if not rows:
+        return None
+
+    df = base.preprocess(pd.DataFrame(rows))
+    df["elo_pre"] = df["team_id"].map(ratings)
+    FEATURE_CACHE.set(key, df, tags=_tags(game_id, df["team_id"]))
+    return df
+
+
+def predict_game(connection, game_id):
+    """
+    Predicted goals for both teams of a game plus outcome probabilities,
+    or None if the game does not exist.
+    """
+    import pandas as pd
+
+    served = get_model()
+    key = (game_id, served.version)
+    cached = PREDICTION_CACHE.get(key)
+    if cached is not MISSING:
+        return cached
+
+    df = game_features(connection, game_id, served.version)
+    if df is None:
+        return None
+
+    X = df[base.FEATURES].to_numpy(dtype="float32")
+    preds = served.model.predict(X)
+    PREDICTIONS.labels(MODEL_NAME).inc()
+
+    result = {
+        "game_id": game_id,
+        "model_version": served.version,
+        "teams": [
+            {
+                "team_id": int(r.team_id),
+                "team_abbrev": str(r.team_abbrev),
+                "opp_abbrev": str(r.opp_abbrev),
+                "home": bool(r.home_away),
+                "pred_goals": round(float(p), 3),
+                "elo": None if pd.isna(r.elo_pre) else round(float(r.elo_pre), 1),
+            }
+            for r, p in zip(df.itertuples(), preds)
+        ],
+    }
+
+    ensemble = get_ensemble()
+    if ensemble and ensemble["features"] == base.FEATURES:
+        _, lo, hi = predict_interval(ensemble, X)
+        for team, low, high in zip(result["teams"], lo, hi):
+            team["pred_goals_interval"] = [round(float(low), 3), round(float(high), 3)]
+
+    home = df["home_away"].to_numpy() == 1
+    if home.sum() == 1 and (~home).sum() == 1:
+        probs = simulate_slate(pd.DataFrame({"home_mu": preds[home], "away_mu": preds[~home]}))
+        result["outcome"] = {
+            k: round(float(v), 4) for k, v in probs.iloc[0].items()
+            if k not in ("home_mu", "away_mu")
+        }
+
+    PREDICTION_CACHE.set(key, result, tags=_tags(game_id, df["team_id"]))
+    return result
+
+
+def handle_event(event):
+    """
+    Invalidate cached features/predictions for an events.py notification.
+    """
+    kind = event.get("event")
+    if kind == GAME_FINAL:
+        tags = [("game", g) for g in event.get("game_ids", [])]
+        tags += [("team", t) for t in event.get("team_ids", [])]
+        for cache in (FEATURE_CACHE, PREDICTION_CACHE):
+            cache.invalidate(tags, reason=GAME_FINAL)
+    elif kind == VIEW_REFRESHED:
+        # Every team's rolling features may have moved
+        for cache in (FEATURE_CACHE, PREDICTION_CACHE):
+            cache.clear(reason=VIEW_REFRESHED)
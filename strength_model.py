@@ -0,0 +1,321 @@
+"""
+Dixon-Coles team strength model on final scores.
+
+log(mu_home) = base + home + attack[home_team] - defense[away_team]
+log(mu_away) = base        + attack[away_team] - defense[home_team]
+
+Every game adds two rows to a sparse design matrix (four non-zeros each), so
+the weighted Poisson likelihood is fitted by Newton steps whose Hessian is
+only (2 * teams + 2) square. Games are weighted by exp(-xi * days ago), and
+the Dixon-Coles low-score correction rho is fitted on top. Parameters are
+saved to MODEL_DIR; the nightly refit starts from them and converges in a
+couple of steps, which also keeps the daily walk-forward evaluation cheap.
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import minimize_scalar
+
+from instrument import run, stage
+from scorer import MODEL_DIR
+
+PARAMS_FILE = "strength_params.json"
+
+# Daily decay; exp(-0.0019 * 365) ~ one half per season
+XI = 0.0019
+# Ridge on team terms; keeps them identifiable and new teams near zero
+RIDGE = 1.0
+MAX_ITER = 50
+TOL = 1e-6
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------
+# Design
+# -------------------------------------------------
+
+def design(home_idx, away_idx, n_teams):
+    """
+    CSR design with rows [game 0 home goals, game 0 away goals, game 1 ...]
+    and columns [base, home, attack[0..n), defense[0..n)]. Interleaving keeps
+    the first k games in the first 2k rows, so date-sorted prefixes slice.
+    """
+    g = len(home_idx)
+    att = np.column_stack([home_idx, away_idx]).ravel()
+    dfn = np.column_stack([away_idx, home_idx]).ravel()
+    is_home = np.tile([1.0, 0.0], g)
+    rows = np.repeat(np.arange(2 * g), 4)
+    cols = np.column_stack([
+        np.zeros(2 * g, dtype=int), np.ones(2 * g, dtype=int), 2 + att, 2 + n_teams + dfn,
+    ]).ravel()
+    data = np.column_stack([np.ones(2 * g), is_home, np.ones(2 * g), -np.ones(2 * g)]).ravel()
+    return sp.csr_matrix((data, (rows, cols)), shape=(2 * g, 2 + 2 * n_teams))
+
+
+def _arrays(games, teams):
+    index = {t: i for i, t in enumerate(teams)}
+    X = design(
+        games["home_team_id"].map(index).to_numpy(),
+        games["away_team_id"].map(index).to_numpy(),
+        len(teams),
+    )
+    y = np.column_stack([games["home_score"], games["away_score"]]).ravel().astype("float64")
+    return X, y
+
+
+def _day_numbers(dates):
+    return pd.to_datetime(dates).to_numpy().astype("datetime64[s]").astype("float64") / 86400
+
+
+def decay_weights(dates, as_of, xi=XI):
+    days = _day_numbers(pd.Series([pd.Timestamp(as_of)]))[0] - _day_numbers(dates)
+    return np.exp(-xi * np.maximum(days, 0))
+
+
+def _team_index(games, teams=None):
+    ids = np.unique(np.concatenate([games["home_team_id"], games["away_team_id"]]))
+    if teams is not None:
+        ids = np.union1d(ids, teams)
+    return ids
+
+# -------------------------------------------------
+# Fit
+# -------------------------------------------------
+
+def fit_poisson(X, y, w, beta0=None, ridge=RIDGE, max_iter=MAX_ITER, tol=TOL):
+    """
+    Weighted, ridge-penalized Poisson regression by Newton's method.
+    Returns (beta, iterations).
+    """
+    k = X.shape[1]
+    penalty = np.full(k, ridge)
+    penalty[:2] = 0.0
+    beta = np.zeros(k) if beta0 is None else beta0.astype("float64").copy()
+    if beta0 is None:
+        beta[0] = np.log(max(np.average(y, weights=w), 1e-6))
+
+    XT = X.T.tocsr()
+    for it in range(1, max_iter + 1):
+        mu = np.exp(X @ beta)
+        grad = XT @ (w * (y - mu)) - penalty * beta
+        hess = (XT @ sp.diags(w * mu) @ X).toarray() + np.diag(penalty)
+        step = np.linalg.solve(hess, grad)
+        beta += step
+        if np.max(np.abs(step)) < tol:
+            return beta, it
+    logger.warning(f"Newton did not converge in {max_iter} iterations")
+    return beta, max_iter
+
+
+def _tau(h, a, mu_h, mu_a, rho):
+    tau = np.ones_like(mu_h)
+    tau = np.where((h == 0) & (a == 0), 1 - mu_h * mu_a * rho, tau)
+    tau = np.where((h == 0) & (a == 1), 1 + mu_h * rho, tau)
+    tau = np.where((h == 1) & (a == 0), 1 + mu_a * rho, tau)
+    tau = np.where((h == 1) & (a == 1), 1 - rho, tau)
+    return tau
+
+
+def fit_rho(h, a, mu_h, mu_a, w):
+    """
+    Low-score dependence, by weighted likelihood over the feasible range.
+    """
+    low = (h <= 1) & (a <= 1)
+    if not low.any():
+        return 0.0
+    h, a, mu_h, mu_a, w = h[low], a[low], mu_h[low], mu_a[low], w[low]
+    bound = 0.99 / max(np.max(mu_h * mu_a), 1.0)
+
+    def nll(rho):
+        return -np.sum(w * np.log(np.maximum(_tau(h, a, mu_h, mu_a, rho), 1e-12)))
+
+    return float(minimize_scalar(nll, bounds=(-bound, bound), method="bounded").x)
+
+
+def _fit_arrays(X, y, w, teams, as_of, xi, warm, ridge):
+    beta0 = _warm_beta(warm, teams) if warm else None
+    beta, iters = fit_poisson(X, y, w, beta0, ridge)
+
+    mu = np.exp(X @ beta)
+    rho = fit_rho(y[0::2], y[1::2], mu[0::2], mu[1::2], w[0::2])
+    n = len(teams)
+    return {
+        "as_of": pd.Timestamp(as_of).isoformat(),
+        "xi": xi,
+        "base": float(beta[0]),
+        "home": float(beta[1]),
+        "rho": rho,
+        "team_ids": [int(t) for t in teams],
+        "attack": beta[2:2 + n].tolist(),
+        "defense": beta[2 + n:].tolist(),
+        "games": len(y) // 2,
+        "iterations": iters,
+    }
+
+
+def fit(games, as_of=None, xi=XI, warm=None, ridge=RIDGE):
+    """
+    Fit on final games (home/away team ids and scores, date) played before
+    `as_of`. `warm` is a previous params dict to start from.
+    """
+    as_of = pd.Timestamp(as_of or pd.to_datetime(games["date"]).max() + pd.Timedelta(days=1))
+    games = games[pd.to_datetime(games["date"]) < as_of]
+    teams = _team_index(games, warm and warm["team_ids"])
+    X, y = _arrays(games, teams)
+    w = np.repeat(decay_weights(games["date"], as_of, xi), 2)
+    return _fit_arrays(X, y, w, teams, as_of, xi, warm, ridge)
+
+
+def _warm_beta(params, teams):
+    old = {t: i for i, t in enumerate(params["team_ids"])}
+    n = len(teams)
+    beta = np.zeros(2 + 2 * n)
+    beta[0], beta[1] = params["base"], params["home"]
+    for i, t in enumerate(teams):
+        j = old.get(int(t))
+        if j is not None:
+            beta[2 + i] = params["attack"][j]
+            beta[2 + n + i] = params["defense"][j]
+    return beta
+
+# -------------------------------------------------
+# Predict / evaluate
+# -------------------------------------------------
+
+def predict(params, home_team_ids, away_team_ids):
+    """
+    (home_mu, away_mu); teams the model hasn't seen get average strength.
+    """
+    index = {t: i for i, t in enumerate(params["team_ids"])}
+    att = np.append(params["attack"], 0.0)
+    dfn = np.append(params["defense"], 0.0)
+    h = np.array([index.get(int(t), -1) for t in home_team_ids])
+    a = np.array([index.get(int(t), -1) for t in away_team_ids])
+    home_mu = np.exp(params["base"] + params["home"] + att[h] - dfn[a])
+    away_mu = np.exp(params["base"] + att[a] - dfn[h])
+    return home_mu, away_mu
+
+
+def walk_forward(games, start, end=None, xi=XI, ridge=RIDGE):
+    """
+    Refit before every game day in [start, end], warm-started from the
+    previous day, and score that day's games. The design is built once;
+    each refit uses its date-sorted prefix. Returns one row per game.
+    """
+    games = games.sort_values(["date", "game_id"], ignore_index=True)
+    days = pd.to_datetime(games["date"]).dt.normalize()
+    end = pd.Timestamp(end) if end else days.max()
+    test_days = days[(days >= pd.Timestamp(start)) & (days <= end)].unique()
+
+    teams = _team_index(games)
+    X, y = _arrays(games, teams)
+    day_num = _day_numbers(games["date"])
+    test_num = _day_numbers(pd.Series(test_days))
+    first = np.searchsorted(days.to_numpy(), test_days.to_numpy(), side="left")
+    last = np.searchsorted(days.to_numpy(), test_days.to_numpy(), side="right")
+
+    params, rows, iters = None, [], 0
+    for day, now, k, stop in zip(test_days, test_num, first, last):
+        w = np.repeat(np.exp(-xi * np.maximum(now - day_num[:k], 0)), 2)
+        params = _fit_arrays(X[:2 * k], y[:2 * k], w, teams, day, xi, params, ridge)
+        iters += params["iterations"]
+        today = games.iloc[k:stop]
+        home_mu, away_mu = predict(params, today["home_team_id"], today["away_team_id"])
+        rows.append(pd.DataFrame({
+            "game_id": today["game_id"].to_numpy(),
+            "date": day,
+            "home_mu": home_mu,
+            "away_mu": away_mu,
+            "rho": params["rho"],
+            "home_score": today["home_score"].to_numpy(),
+            "away_score": today["away_score"].to_numpy(),
+        }))
+    logger.info(f"Walk-forward: {len(test_days)} refits, {iters / max(len(test_days), 1):.1f} Newton steps each")
+    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+
+
+def summarize(scored):
+    """
+    Goals MAE and home-win log loss (via outcomes.py, with each day's
+    low-score correction) of walk-forward rows.
+    """
+    from outcomes import simulate_slate
+
+    probs = simulate_slate(scored[["home_mu", "away_mu"]], rho=scored["rho"].to_numpy())
+    home_won = (scored["home_score"] > scored["away_score"]).to_numpy()
+    p = np.clip(np.where(home_won, probs["p_home_win"], probs["p_away_win"]), 1e-9, 1)
+    mae = np.mean(np.abs(np.concatenate([
+        scored["home_mu"] - scored["home_score"], scored["away_mu"] - scored["away_score"],
+    ])))
+    return {"games": len(scored), "goals_mae": float(mae), "win_log_loss": float(-np.log(p).mean())}
+
+# -------------------------------------------------
+# Persistence
+# -------------------------------------------------
+
+def params_path():
+    return os.path.join(MODEL_DIR, PARAMS_FILE)
+
+
+def load_params():
+    path = params_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_params(params):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    params = {**params, "created_at": datetime.now(timezone.utc).isoformat()}
+    tmp = params_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(params, f)
+    os.replace(tmp, params_path())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dixon-Coles team strength model")
+    parser.add_argument("--xi", type=float, default=XI, help="daily time-decay rate")
+    parser.add_argument("--cold", action="store_true", help="ignore the saved parameters")
+    parser.add_argument("--walk-forward", metavar="START",
+                        help="evaluate daily refits from START (YYYY-MM-DD) instead of fitting")
+    parser.add_argument("--end", help="last walk-forward day")
+    args = parser.parse_args(argv)
+
+    from db import get_engine
+    from elo import load_final_games
+
+    with run("strength_model"):
+        with stage("load games") as s:
+            games = s.out(load_final_games(get_engine()))
+
+        if args.walk_forward:
+            with stage("walk forward", rows_in=len(games)) as s:
+                scored = s.out(walk_forward(games, args.walk_forward, args.end, args.xi))
+            print(json.dumps(summarize(scored), indent=2))
+            return
+
+        warm = None if args.cold else load_params()
+        with stage("fit", rows_in=len(games)):
+            params = fit(games, as_of=date.today(), xi=args.xi, warm=warm)
+        save_params(params)
+
+    print(
+        f"Fitted on {params['games']} games in {params['iterations']} Newton steps "
+        f"({'warm' if warm else 'cold'}): home {params['home']:.3f}, rho {params['rho']:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+    main()
@@ -0,0 +1,401 @@
+"""
+Seeded synthetic league history for scale testing.
+
+Writes teams, players, games, player_stats and team_game_defense with the
+same columns the ingesters produce, either into the DB_* Postgres or as
+Parquet files named like the DuckDB backend's raw export:
+
+    python synth_data.py --seasons 40 --teams 32 --target parquet
+    python nhl.py build-features --backend duckdb
+
+The same arguments and seed always produce the same dataset. Generation is
+vectorized and streamed one season at a time, so 50x the real history fits
+comfortably in memory.
+"""
+import argparse
+import itertools
+import os
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import copy_frame
+
+OUT_DIR = os.getenv("RAW_EXPORT_DIR", "raw_export")
+
+SEASON_DAYS = 185
+HOME_ADVANTAGE = 0.08
+BASE_GOALS = np.log(2.9)
+TURNOVER = 0.25
+
+GOALIES = 2
+# Dressed skaters split roughly like an NHL lineup (12 F / 6 D)
+DEFENSE_SHARE = 6 / 18
+
+# -------------------------------------------------
+# League setup
+# -------------------------------------------------
+
+def roster_positions(roster_size):
+    skaters = roster_size - GOALIES
+    n_def = max(1, round(skaters * DEFENSE_SHARE))
+    forwards = ["C", "L", "R"] * skaters
+    return np.array(forwards[:skaters - n_def] + ["D"] * n_def + ["G"] * GOALIES)
+
+
+def make_teams(n_teams, rng):
+    codes = ["".join(c) for c in itertools.product(string.ascii_uppercase, repeat=3)]
+    picks = sorted(rng.choice(len(codes), size=n_teams, replace=False))
+    abbrevs = [codes[i] for i in picks]
+    return pd.DataFrame({
+        "id": np.arange(1, n_teams + 1, dtype="int32"),
+        "name": [f"Synthetic {a}" for a in abbrevs],
+        "abbreviation": abbrevs,
+    })
+
+
+class League:
+    """
+    Team strengths and rosters carried from season to season.
+    """
+
+    def __init__(self, n_teams, roster_size, rng):
+        self.rng = rng
+        self.n_teams = n_teams
+        self.positions = roster_positions(roster_size)
+        self.attack = rng.normal(0, 0.12, n_teams)
+        self.defense = rng.normal(0, 0.12, n_teams)
+        self.next_player_id = 8_000_001
+        self.roster = self._new_ids((n_teams, roster_size))
+        self.skill = rng.lognormal(0, 0.5, self.roster.shape)
+        self.players = {}
+        self._record_players()
+
+    def _new_ids(self, shape):
+        n = int(np.prod(shape))
+        ids = np.arange(self.next_player_id, self.next_player_id + n, dtype="int32")
+        self.next_player_id += n
+        return ids.reshape(shape)
+
+    def _record_players(self):
+        for t in range(self.n_teams):
+            for slot, pid in enumerate(self.roster[t]):
+                self.players[int(pid)] = (t + 1, self.positions[slot])
+
+    def next_season(self):
+        rng = self.rng
+        # Mean-reverting drift in team quality
+        self.attack = 0.7 * self.attack + rng.normal(0, 0.08, self.n_teams)
+        self.defense = 0.7 * self.defense + rng.normal(0, 0.08, self.n_teams)
+        replaced = rng.random(self.roster.shape) < TURNOVER
+        self.roster[replaced] = self._new_ids(int(replaced.sum()))
+        self.skill[replaced] = rng.lognormal(0, 0.5, int(replaced.sum()))
+        self._record_players()
+
+    def players_frame(self):
+        ids = np.fromiter(self.players, dtype="int32", count=len(self.players))
+        team_ids, positions = zip(*self.players.values())
+        return pd.DataFrame({
+            "id": ids,
+            "team_id": np.array(team_ids, dtype="int32"),
+            "full_name": [f"Player {i}" for i in ids],
+            "position": positions,
+        })
+
+# -------------------------------------------------
+# One season
+# -------------------------------------------------
+
+def _toi(seconds):
+    seconds = np.asarray(seconds, dtype="int64")
+    m = pd.Series(seconds // 60).astype(str).str.zfill(2)
+    s = pd.Series(seconds % 60).astype(str).str.zfill(2)
+    return (m + ":" + s).to_numpy()
+
+
+def season_games(league, start_year, games_per_team, first_game_id):
+    rng = league.rng
+    n_teams = league.n_teams
+    per_round = n_teams // 2
+
+    # Every round pairs all teams once; rounds are spread over the season
+    order = rng.permuted(np.tile(np.arange(n_teams), (games_per_team, 1)), axis=1)
+    home = order[:, 0:2 * per_round:2].ravel()
+    away = order[:, 1:2 * per_round:2].ravel()
+    round_idx = np.repeat(np.arange(games_per_team), per_round)
+    day = round_idx * SEASON_DAYS // games_per_team + np.tile(np.arange(per_round) % 2, games_per_team)
+
+    sort = np.lexsort((np.arange(len(day)), day))
+    home, away, day = home[sort], away[sort], day[sort]
+    n = len(home)
+
+    lam_home = np.exp(BASE_GOALS + league.attack[home] - league.defense[away] + HOME_ADVANTAGE)
+    lam_away = np.exp(BASE_GOALS + league.attack[away] - league.defense[home] - HOME_ADVANTAGE)
+    home_score = rng.poisson(lam_home)
+    away_score = rng.poisson(lam_away)
+    # No ties: overtime/shootout winner gets one more
+    tied = home_score == away_score
+    home_wins_ot = rng.random(n) < 0.5
+    home_score = home_score + (tied & home_wins_ot)
+    away_score = away_score + (tied & ~home_wins_ot)
+
+    season = start_year * 10000 + start_year + 1
+    dates = pd.Timestamp(f"{start_year}-10-08 23:00") + pd.to_timedelta(day, unit="D")
+    return pd.DataFrame({
+        "id": np.arange(first_game_id, first_game_id + n, dtype="int32"),
+        "nhl_game_id": start_year * 1_000_000 + 20_000 + np.arange(1, n + 1),
+        "season": np.full(n, season, dtype="int32"),
+        "game_date": dates,
+        "home_team_id": (home + 1).astype("int32"),
+        "away_team_id": (away + 1).astype("int32"),
+        "home_score": home_score.astype("int32"),
+        "away_score": away_score.astype("int32"),
+        "status": "final",
+        "venue": [f"Arena {t + 1}" for t in home],
+        "game_type": np.full(n, 2, dtype="int16"),
+    })
+
+
+def _allocate(rng, counts, weights):
+    """
+    Spread counts[i] events over the columns of weights[i]; returns the
+    (rows, cols) tally without a Python loop per row.
+    """
+    totals = np.zeros(weights.shape, dtype="int32")
+    owner = np.repeat(np.arange(len(counts)), counts)
+    if len(owner):
+        cdf = np.cumsum(weights / weights.sum(axis=1, keepdims=True), axis=1)[owner]
+        slot = (rng.random(len(owner))[:, None] > cdf).sum(axis=1)
+        np.add.at(totals, (owner, np.minimum(slot, weights.shape[1] - 1)), 1)
+    return totals
+
+
+def season_box_stats(league, games):
+    """
+    player_stats and team_game_defense rows for every team-game.
+    """
+    rng = league.rng
+    positions = league.positions
+    skater_slots = np.flatnonzero(positions != "G")
+    goalie_slots = np.flatnonzero(positions == "G")
+    is_def = positions[skater_slots] == "D"
+
+    n = len(games)
+    team = np.concatenate([games["home_team_id"], games["away_team_id"]]) - 1
+    goals_for = np.concatenate([games["home_score"], games["away_score"]])
+    goals_against = np.concatenate([games["away_score"], games["home_score"]])
+    game_pk = np.tile(games["id"].to_numpy(), 2)
+    nhl_id = np.tile(games["nhl_game_id"].to_numpy(), 2)
+    season = np.tile(games["season"].to_numpy(), 2)
+    tg = len(team)
+    ns = len(skater_slots)
+
+    skill = league.skill[team][:, skater_slots]
+    scoring = skill * np.where(is_def, 0.35, 1.0)
+    goals = _allocate(rng, goals_for, scoring)
+    n_assists = rng.choice([0, 1, 2], size=goals_for.sum(), p=[0.08, 0.27, 0.65])
+    assist_counts = np.bincount(
+        np.repeat(np.arange(tg), goals_for), weights=n_assists, minlength=tg
+    ).astype("int64")
+    assists = _allocate(rng, assist_counts, skill)
+    shots = goals + rng.poisson(np.where(is_def, 1.3, 1.9) * np.ones((tg, ns)))
+    hits = rng.poisson(np.where(is_def, 1.8, 1.5) * np.ones((tg, ns)))
+    toi_sec = np.clip(
+        rng.normal(np.where(is_def, 21 * 60, 15 * 60), 180, (tg, ns)), 240, 1800
+    ).astype("int64")
+
+    skaters = pd.DataFrame({
+        "player_id": league.roster[team][:, skater_slots].ravel(),
+        "game_id": np.repeat(game_pk, ns),
+        "team_id": np.repeat(team + 1, ns).astype("int32"),
+        "goals": goals.ravel(),
+        "assists": assists.ravel(),
+        "points": (goals + assists).ravel(),
+        "shots": shots.ravel(),
+        "hits": hits.ravel(),
+        "time_on_ice": _toi(toi_sec.ravel()),
+    })
+
+    # Starter takes ~80% of games; goalie rows carry goals/shots against
+    starter = np.where(rng.random(tg) < 0.8, goalie_slots[0], goalie_slots[-1])
+    opp = np.concatenate([np.arange(n, tg), np.arange(n)])
+    goalies = pd.DataFrame({
+        "player_id": league.roster[team, starter],
+        "game_id": game_pk,
+        "team_id": (team + 1).astype("int32"),
+        "goals": goals_against,
+        "assists": 0,
+        "points": 0,
+        "shots": shots.sum(axis=1)[opp],
+        "hits": 0,
+        "time_on_ice": "60:00",
+    })
+    player_stats = pd.concat([skaters, goalies], ignore_index=True)
+
+    # Defensemen only, keyed by the NHL game id like the boxscore ingesters
+    d_cols = skater_slots[is_def]
+    nd = len(d_cols)
+    d_mask = np.tile(is_def, tg)
+    diff = np.repeat(goals_for - goals_against, nd)
+    defense = pd.DataFrame({
+        "game_id": np.repeat(nhl_id, nd),
+        "season": np.repeat(season, nd),
+        "team_id": np.repeat(team + 1, nd).astype("int32"),
+        "player_id": league.roster[team][:, d_cols].ravel(),
+        "name": None,
+        "position": "D",
+        "goals": skaters["goals"].to_numpy()[d_mask],
+        "assists": skaters["assists"].to_numpy()[d_mask],
+        "points": skaters["points"].to_numpy()[d_mask],
+        "plus_minus": np.clip(np.round(diff * 0.3 + rng.normal(0, 1, len(diff))), -4, 4).astype("int32"),
+        "pim": rng.choice([0, 0, 0, 0, 2, 2, 4], size=len(diff)),
+        "hits": skaters["hits"].to_numpy()[d_mask],
+        "blocked_shots": rng.poisson(1.6, len(diff)),
+        "shifts": rng.poisson(24, len(diff)),
+        "giveaways": rng.poisson(0.8, len(diff)),
+        "takeaways": rng.poisson(0.6, len(diff)),
+        "toi": skaters["time_on_ice"].to_numpy()[d_mask],
+    })
+    defense["name"] = "Player " + defense["player_id"].astype(str)
+    return player_stats, defense
+
+# -------------------------------------------------
+# Sinks
+# -------------------------------------------------
+
+class ParquetSink:
+    """
+    One Parquet file per table, appended season by season.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.writers = {}
+        os.makedirs(out_dir, exist_ok=True)
+
+    def write(self, table, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrow = pa.Table.from_pandas(df, preserve_index=False)
+        if table not in self.writers:
+            path = os.path.join(self.out_dir, f"{table}.parquet")
+            self.writers[table] = pq.ParquetWriter(path, arrow.schema)
+        writer = self.writers[table]
+        writer.write_table(arrow.cast(writer.schema))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+class PostgresSink:
+    """
+    COPY into the pipeline tables of a (scratch) Postgres database.
+    """
+
+    def __init__(self, bind, replace=False):
+        from local_schema import create_schema, truncate_tables
+
+        self.bind = bind
+        create_schema(bind)
+        if replace:
+            truncate_tables(bind)
+
+    def write(self, table, df):
+        conn = self.bind.raw_connection()
+        try:
+            cur = conn.cursor()
+            copy_frame(cur, table, df)
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+    def close(self):
+        from sqlalchemy import text
+        from team_vs_opponent_view import refresh_team_vs_opponent_view
+
+        # Explicit ids were copied in; move the serials past them
+        with self.bind.begin() as conn:
+            for table in ("teams", "games"):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('public.{table}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM public.{table}), 1))"
+                ))
+        refresh_team_vs_opponent_view(self.bind, concurrently=False)
+
+# -------------------------------------------------
+# Driver
+# -------------------------------------------------
+
+def generate(sink, seasons=10, teams=32, roster=20, games_per_team=82,
+             first_season=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    league = League(teams, roster, rng)
+    sink.write("teams", make_teams(teams, rng))
+
+    counts = {"games": 0, "player_stats": 0, "team_game_defense": 0}
+    next_game_id = 1
+    for i in range(seasons):
+        t0 = time.perf_counter()
+        if i:
+            league.next_season()
+        games = season_games(league, first_season + i, games_per_team, next_game_id)
+        player_stats, defense = season_box_stats(league, games)
+        next_game_id += len(games)
+
+        sink.write("games", games)
+        sink.write("player_stats", player_stats)
+        sink.write("team_game_defense", defense)
+        counts["games"] += len(games)
+        counts["player_stats"] += len(player_stats)
+        counts["team_game_defense"] += len(defense)
+        print(
+            f"Season {first_season + i}: {len(games)} games, "
+            f"{len(player_stats)} player rows ({time.perf_counter() - t0:.2f}s)"
+        )
+
+    players = league.players_frame()
+    sink.write("players", players)
+    counts["players"] = len(players)
+    sink.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic league history")
+    parser.add_argument("--seasons", type=int, default=10)
+    parser.add_argument("--teams", type=int, default=32)
+    parser.add_argument("--roster", type=int, default=20, help="players per team incl. 2 goalies")
+    parser.add_argument("--games-per-team", type=int, default=82)
+    parser.add_argument("--first-season", type=int, default=2000, help="start year of the first season")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", choices=["parquet", "postgres"], default="parquet")
+    parser.add_argument("--out", default=OUT_DIR, help="Parquet output directory")
+    parser.add_argument("--replace", action="store_true",
+                        help="truncate the Postgres tables first")
+    args = parser.parse_args(argv)
+
+    if args.target == "postgres":
+        from db import get_engine
+        sink = PostgresSink(get_engine(), replace=args.replace)
+    else:
+        sink = ParquetSink(args.out)
+
+    counts = generate(
+        sink,
+        seasons=args.seasons,
+        teams=args.teams,
+        roster=args.roster,
+        games_per_team=args.games_per_team,
+        first_season=args.first_season,
+        seed=args.seed,
+    )
+    print(f"Wrote {counts}")
+
+
+if __name__ == "__main__":
+    main()
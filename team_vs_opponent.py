@@ -1,12 +1,39 @@
+import numpy as np
 import pandas as pd
-from db import engine
-from persist_team_game_features import persist_team_game_features
+from pandas.api.types import union_categoricals
+from feature_dtypes import apply_dtype_policy, memory_report
+from instrument import run, stage
+
+ROLLING_COLS = ["goals", "goals_against", "shots", "hits", "points"]
+
+FINAL_COLS = [
+    "game_id",
+    "team_id",
+    "team_abbrev",
+    "home_away",
+    "opp_team_id",
+    "opp_abbrev",
+    "goals",
+    "goals_against",
+    "shots",
+    "hits",
+    "points",
+    "opp_goals",
+    "opp_shots",
+    "opp_hits",
+    "opp_points",
+    "goals_last5",
+    "goals_against_last5",
+    "shots_last5",
+    "hits_last5",
+    "points_last5",
+]
 
 # -------------------------------------------------
 # 1. Load FINAL games (single source of truth)
 # -------------------------------------------------
 
-games = pd.read_sql("""
+GAMES_SQL = """
     SELECT
         g.id AS game_id,
         g.game_date AS date,
@@ -18,13 +45,13 @@ games = pd.read_sql("""
     JOIN public.teams ht ON g.home_team_id = ht.id
     JOIN public.teams at ON g.away_team_id = at.id
     WHERE g.status = 'final'
-""", engine)
+"""
 
 # -------------------------------------------------
 # 2. Load player stats ONLY for final games
 # -------------------------------------------------
 
-player_stats = pd.read_sql("""
+PLAYER_STATS_SQL = """
     SELECT
         ps.game_id,
         ps.team_id,
@@ -39,193 +66,208 @@ player_stats = pd.read_sql("""
     JOIN public.games g ON ps.game_id = g.id
     JOIN public.players p ON ps.player_id = p.id
     WHERE g.status = 'final'
-""", engine)
+"""
+
+
+def load_inputs(bind):
+    with stage("read_sql games") as s:
+        games = s.out(apply_dtype_policy(pd.read_sql(GAMES_SQL, bind)))
+    memory_report("load games", games)
+    with stage("read_sql player_stats") as s:
+        player_stats = s.out(apply_dtype_policy(pd.read_sql(PLAYER_STATS_SQL, bind)))
+    memory_report("load player_stats", player_stats)
+    return games, player_stats
 
 # -------------------------------------------------
 # 3. TOI helper
 # -------------------------------------------------
 
 def toi_to_minutes(toi):
-    if pd.isna(toi):
-        return 0.0
-    m, s = toi.split(":")
-    return int(m) + int(s) / 60
-
-player_stats["toi_minutes"] = player_stats["time_on_ice"].apply(toi_to_minutes)
+    """
+    Vectorized "MM:SS" -> minutes; missing or malformed values become 0.
+    """
+    parts = toi.astype("string").str.extract(r"^(\d+):(\d+)$").astype("float32")
+    return (parts[0] + parts[1] / 60).fillna(0.0)
 
 # -------------------------------------------------
-# 4. Split skaters / goalies
+# 5. Team-game aggregation (NO abbrevs here)
 # -------------------------------------------------
 
-skaters = player_stats[player_stats["position"] != "G"]
-goalies = player_stats[player_stats["position"] == "G"]
+def build_team_game_stats(player_stats):
+    player_stats["toi_minutes"] = toi_to_minutes(player_stats["time_on_ice"])
 
-# -------------------------------------------------
-# 5. Team-game aggregation (NO abbrevs here)
-# -------------------------------------------------
+    # 4. Split skaters / goalies with a mask instead of two frame copies
+    is_goalie = (player_stats["position"] == "G").to_numpy()
+    keys = [player_stats["game_id"], player_stats["team_id"]]
 
-team_game_stats = (
-    skaters
-    .groupby(["game_id", "team_id"], as_index=False)
-    .agg(
-        goals=("goals", "sum"),
-        assists=("assists", "sum"),
-        points=("points", "sum"),
-        shots=("shots", "sum"),
-        hits=("hits", "sum"),
-        toi_minutes=("toi_minutes", "sum"),
+    team_game_stats = (
+        player_stats[["goals", "assists", "points", "shots", "hits", "toi_minutes"]]
+        [~is_goalie]
+        .groupby([k[~is_goalie] for k in keys])
+        .sum()
     )
-)
-
-goalie_game_stats = (
-    goalies
-    .groupby(["game_id", "team_id"], as_index=False)
-    .agg(
-        goals_against=("goals", "sum"),
-        shots_against=("shots", "sum"),
-        goalie_toi=("toi_minutes", "sum"),
+
+    goalie_game_stats = (
+        player_stats[["goals", "shots", "toi_minutes"]]
+        [is_goalie]
+        .groupby([k[is_goalie] for k in keys])
+        .sum()
+        .rename(columns={
+            "goals": "goals_against",
+            "shots": "shots_against",
+            "toi_minutes": "goalie_toi",
+        })
     )
-)
 
-team_game_stats = team_game_stats.merge(
-    goalie_game_stats,
-    on=["game_id", "team_id"],
-    how="left",
-)
+    team_game_stats = team_game_stats.join(goalie_game_stats, how="left")
+    return team_game_stats.reset_index()
 
 # -------------------------------------------------
 # 6. Build game-team perspective (games_long)
 # -------------------------------------------------
 
-games_long = pd.concat(
-    [
-        games.assign(
-            team_id=games.home_team_id,
-            opp_team_id=games.away_team_id,
-            team_abbrev=games.home_abbrev,
-            opp_abbrev=games.away_abbrev,
-            home_away="home",
+def build_games_long(games):
+    """
+    One row per (game, team), built column-wise without copying `games` twice.
+    """
+    n = len(games)
+    home_ids = games["home_team_id"].to_numpy()
+    away_ids = games["away_team_id"].to_numpy()
+    abbrevs = union_categoricals(
+        [games["home_abbrev"].astype("category"), games["away_abbrev"].astype("category")]
+    )
+    home_abbrev = pd.Categorical(games["home_abbrev"], categories=abbrevs.categories)
+    away_abbrev = pd.Categorical(games["away_abbrev"], categories=abbrevs.categories)
+
+    return pd.DataFrame({
+        "game_id": np.tile(games["game_id"].to_numpy(), 2),
+        "team_id": np.concatenate([home_ids, away_ids]),
+        "opp_team_id": np.concatenate([away_ids, home_ids]),
+        "team_abbrev": pd.Categorical.from_codes(
+            np.concatenate([home_abbrev.codes, away_abbrev.codes]),
+            abbrevs.categories,
+        ),
+        "opp_abbrev": pd.Categorical.from_codes(
+            np.concatenate([away_abbrev.codes, home_abbrev.codes]),
+            abbrevs.categories,
         ),
-        games.assign(
-            team_id=games.away_team_id,
-            opp_team_id=games.home_team_id,
-            team_abbrev=games.away_abbrev,
-            opp_abbrev=games.home_abbrev,
-            home_away="away",
+        "home_away": pd.Categorical.from_codes(
+            np.repeat(np.array([0, 1], dtype="int8"), n),
+            ["home", "away"],
         ),
-    ],
-    ignore_index=True,
-)
+        "date": np.tile(games["date"].to_numpy(), 2),
+    })
 
-# -------------------------------------------------
-# 7. Merge stats with game context (ID-safe)
-# -------------------------------------------------
 
-df = team_game_stats.merge(
-    games_long[
-        [
-            "game_id",
-            "team_id",
-            "opp_team_id",
-            "team_abbrev",
-            "opp_abbrev",
-            "home_away",
-            "date",
-        ]
-    ],
-    on=["game_id", "team_id"],
-    how="inner",
-    validate="one_to_one",
-)
-
-# 🔒 Invariants (fail fast)
-assert df["opp_team_id"].notna().all()
-assert df["team_abbrev"].notna().all()
-assert df["opp_abbrev"].notna().all()
-assert df["team_id"].ne(df["opp_team_id"]).all()
+def build_features(games, player_stats):
+    with stage("team-game aggregation", rows_in=len(player_stats)) as s:
+        team_game_stats = s.out(build_team_game_stats(player_stats))
+    memory_report("team-game aggregation", team_game_stats)
+
+    with stage("games_long", rows_in=len(games)) as s:
+        games_long = s.out(build_games_long(games))
+    memory_report("games_long", games_long)
+
+    # -------------------------------------------------
+    # 7. Merge stats with game context (ID-safe)
+    # -------------------------------------------------
+
+    with stage("merge game context", rows_in=len(team_game_stats)) as s:
+        df = s.out(team_game_stats.merge(
+            games_long,
+            on=["game_id", "team_id"],
+            how="inner",
+            validate="one_to_one",
+        ))
+    del games_long
+
+    # 🔒 Invariants (fail fast)
+    assert df["opp_team_id"].notna().all()
+    assert df["team_abbrev"].notna().all()
+    assert df["opp_abbrev"].notna().all()
+    assert df["team_id"].ne(df["opp_team_id"]).all()
+
+    # -------------------------------------------------
+    # 8. Opponent stats (NO collisions)
+    # -------------------------------------------------
+
+    opp_stats = (
+        team_game_stats
+        [["game_id", "team_id", "goals", "shots", "hits", "points"]]
+        .rename(columns={
+            "team_id": "opp_team_id",
+            "goals": "opp_goals",
+            "shots": "opp_shots",
+            "hits": "opp_hits",
+            "points": "opp_points",
+        })
+    )
+    del team_game_stats
 
-# -------------------------------------------------
-# 8. Opponent stats (NO collisions)
-# -------------------------------------------------
+    with stage("opponent merge", rows_in=len(df)) as s:
+        df = s.out(df.merge(
+            opp_stats,
+            on=["game_id", "opp_team_id"],
+            how="left",
+            validate="many_to_one",
+        ))
+    memory_report("opponent merge", df)
 
-opp_stats = (
-    team_game_stats
-    .rename(columns={
-        "team_id": "opp_team_id",
-        "goals": "opp_goals",
-        "shots": "opp_shots",
-        "hits": "opp_hits",
-        "points": "opp_points",
-    })
-    [["game_id", "opp_team_id", "opp_goals", "opp_shots", "opp_hits", "opp_points"]]
-)
+    # -------------------------------------------------
+    # 9. Rolling last-5 averages (one grouped pass)
+    # -------------------------------------------------
 
-df = df.merge(
-    opp_stats,
-    on=["game_id", "opp_team_id"],
-    how="left",
-    validate="many_to_one",
-)
+    with stage("rolling last5", rows_in=len(df)) as s:
+        df = df.sort_values(["team_id", "date"], ignore_index=True)
 
-# -------------------------------------------------
-# 9. Rolling last-5 averages
-# -------------------------------------------------
+        rolled = (
+            df.groupby("team_id")[ROLLING_COLS]
+            .rolling(5, min_periods=1)
+            .mean()
+            .reset_index(level=0, drop=True)
+        )
+        for col in ROLLING_COLS:
+            df[f"{col}_last5"] = rolled[col].astype("float32")
+        del rolled
+        s.out(df)
 
-df = df.sort_values(["team_id", "date"])
+    # -------------------------------------------------
+    # 10. Safe numeric fill (NEVER IDs or text)
+    # -------------------------------------------------
 
-for col in ["goals", "goals_against", "shots", "hits", "points"]:
-    df[f"{col}_last5"] = (
-        df.groupby("team_id")[col]
-        .rolling(5, min_periods=1)
-        .mean()
-        .reset_index(level=0, drop=True)
-    )
+    numeric_cols = [
+        c for c in df.columns
+        if df[c].dtype.kind in "fi" and not c.endswith("_id")
+    ]
 
-# -------------------------------------------------
-# 10. Safe numeric fill (NEVER IDs or text)
-# -------------------------------------------------
+    df[numeric_cols] = df[numeric_cols].fillna(0)
 
-numeric_cols = [
-    c for c in df.columns
-    if df[c].dtype.kind in "fi" and not c.endswith("_id")
-]
+    # -------------------------------------------------
+    # 11. Final dataset
+    # -------------------------------------------------
 
-df[numeric_cols] = df[numeric_cols].fillna(0)
+    final_df = apply_dtype_policy(df[FINAL_COLS])
+    memory_report("final features", final_df)
+    return final_df
 
-# -------------------------------------------------
-# 11. Final dataset
-# -------------------------------------------------
 
-final_cols = [
-    "game_id",
-    "team_id",
-    "team_abbrev",
-    "home_away",
-    "opp_team_id",
-    "opp_abbrev",
-    "goals",
-    "goals_against",
-    "shots",
-    "hits",
-    "points",
-    "opp_goals",
-    "opp_shots",
-    "opp_hits",
-    "opp_points",
-    "goals_last5",
-    "goals_against_last5",
-    "shots_last5",
-    "hits_last5",
-    "points_last5",
-]
+def main():
+    from db import get_engine
+    from persist_team_game_features import persist_team_game_features
 
-final_df = df[final_cols]
+    with run("team_vs_opponent"):
+        games, player_stats = load_inputs(get_engine())
+        final_df = build_features(games, player_stats)
 
-print(final_df.head())
-print(f"Final rows: {len(final_df)}")
+        print(final_df.head())
+        print(f"Final rows: {len(final_df)}")
+
+        # -------------------------------------------------
+        # 12. Persist
+        # -------------------------------------------------
+
+        persist_team_game_features(final_df)
 
-# -------------------------------------------------
-# 12. Persist
-# -------------------------------------------------
 
-persist_team_game_features(final_df)
+if __name__ == "__main__":
+    main()
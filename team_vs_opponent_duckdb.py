@@ -0,0 +1,291 @@
+import argparse
+import os
+
+import duckdb
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from feature_dtypes import apply_dtype_policy, memory_report
+from instrument import run, stage
+from team_vs_opponent import FINAL_COLS
+
+# -------------------------------------------------
+# Config
+# -------------------------------------------------
+
+EXPORT_DIR = os.getenv("RAW_EXPORT_DIR", "raw_export")
+SPILL_DIR = os.getenv("DUCKDB_TEMP_DIR", ".duckdb_tmp")
+MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "2GB")
+
+# Only the columns the feature build reads
+RAW_TABLES = {
+    "games": """
+        SELECT id, nhl_game_id, season, game_date, home_team_id, away_team_id, status
+        FROM public.games
+    """,
+    "teams": "SELECT id, abbreviation FROM public.teams",
+    "players": "SELECT id, position FROM public.players",
+    "player_stats": """
+        SELECT game_id, team_id, player_id, goals, assists, points, shots, hits, time_on_ice
+        FROM public.player_stats
+    """,
+}
+
+# -------------------------------------------------
+# Same logic as team_vs_opponent.build_features, in SQL
+# -------------------------------------------------
+
+FEATURES_SQL = """
+WITH final_games AS (
+    SELECT
+        g.id AS game_id,
+        g.game_date AS date,
+        g.home_team_id,
+        g.away_team_id,
+        ht.abbreviation AS home_abbrev,
+        awt.abbreviation AS away_abbrev
+    FROM games g
+    JOIN teams ht ON g.home_team_id = ht.id
+    JOIN teams awt ON g.away_team_id = awt.id
+    WHERE g.status = 'final'
+),
+player_rows AS (
+    SELECT ps.*, p.position
+    FROM player_stats ps
+    JOIN final_games fg ON ps.game_id = fg.game_id
+    JOIN players p ON ps.player_id = p.id
+),
+skater_stats AS (
+    SELECT
+        game_id,
+        team_id,
+        COALESCE(SUM(goals), 0) AS goals,
+        COALESCE(SUM(shots), 0) AS shots,
+        COALESCE(SUM(hits), 0) AS hits,
+        COALESCE(SUM(points), 0) AS points
+    FROM player_rows
+    WHERE position IS DISTINCT FROM 'G'
+    GROUP BY game_id, team_id
+),
+goalie_stats AS (
+    SELECT
+        game_id,
+        team_id,
+        COALESCE(SUM(goals), 0) AS goals_against
+    FROM player_rows
+    WHERE position = 'G'
+    GROUP BY game_id, team_id
+),
+team_game_stats AS (
+    SELECT s.*, gs.goals_against
+    FROM skater_stats s
+    LEFT JOIN goalie_stats gs USING (game_id, team_id)
+),
+games_long AS (
+    SELECT game_id, date,
+           home_team_id AS team_id, away_team_id AS opp_team_id,
+           home_abbrev AS team_abbrev, away_abbrev AS opp_abbrev,
+           'home' AS home_away
+    FROM final_games
+    UNION ALL
+    SELECT game_id, date,
+           away_team_id AS team_id, home_team_id AS opp_team_id,
+           away_abbrev AS team_abbrev, home_abbrev AS opp_abbrev,
+           'away' AS home_away
+    FROM final_games
+),
+joined AS (
+    SELECT
+        gl.game_id,
+        gl.team_id,
+        gl.team_abbrev,
+        gl.home_away,
+        gl.opp_team_id,
+        gl.opp_abbrev,
+        gl.date,
+        t.goals,
+        t.goals_against,
+        t.shots,
+        t.hits,
+        t.points,
+        o.goals AS opp_goals,
+        o.shots AS opp_shots,
+        o.hits AS opp_hits,
+        o.points AS opp_points
+    FROM team_game_stats t
+    JOIN games_long gl
+      ON gl.game_id = t.game_id AND gl.team_id = t.team_id
+    LEFT JOIN team_game_stats o
+      ON o.game_id = gl.game_id AND o.team_id = gl.opp_team_id
+)
+SELECT
+    game_id,
+    team_id,
+    team_abbrev,
+    home_away,
+    opp_team_id,
+    opp_abbrev,
+    goals,
+    COALESCE(goals_against, 0) AS goals_against,
+    shots,
+    hits,
+    points,
+    COALESCE(opp_goals, 0) AS opp_goals,
+    COALESCE(opp_shots, 0) AS opp_shots,
+    COALESCE(opp_hits, 0) AS opp_hits,
+    COALESCE(opp_points, 0) AS opp_points,
+    AVG(goals) OVER w AS goals_last5,
+    COALESCE(AVG(goals_against) OVER w, 0) AS goals_against_last5,
+    AVG(shots) OVER w AS shots_last5,
+    AVG(hits) OVER w AS hits_last5,
+    AVG(points) OVER w AS points_last5
+FROM joined
+WINDOW w AS (
+    PARTITION BY team_id
+    ORDER BY date, game_id
+    ROWS BETWEEN 4 PRECEDING AND CURRENT ROW
+)
+ORDER BY team_id, date
+"""
+
+
+def export_raw_tables(bind, out_dir=EXPORT_DIR):
+    """
+    Dump the raw tables the feature build needs to Parquet,
+    streaming each query result in chunks instead of one big frame.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, sql in RAW_TABLES.items():
+        path = os.path.join(out_dir, f"{name}.parquet")
+        writer = None
+        rows = 0
+        with bind.connect() as conn:
+            # Arrow-backed dtypes keep nullable ints as ints across chunks
+            chunks = pd.read_sql(
+                text(sql), conn, chunksize=200_000, dtype_backend="pyarrow"
+            )
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                rows += len(chunk)
+        if writer is not None:
+            writer.close()
+        print(f"Exported {rows} rows to {path}")
+
+
+def connect(threads=None):
+    """
+    DuckDB connection that spills to disk and uses every core.
+    """
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET threads = {threads or os.cpu_count() or 1}")
+    con.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+    con.execute(f"SET temp_directory = '{SPILL_DIR}'")
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def register_parquet_sources(con, export_dir=EXPORT_DIR):
+    for name in RAW_TABLES:
+        path = os.path.join(export_dir, f"{name}.parquet")
+        con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet('{path}')")
+
+
+def register_postgres_sources(con, dsn):
+    """
+    Scan Postgres directly through DuckDB's postgres extension.
+    """
+    con.execute("INSTALL postgres")
+    con.execute("LOAD postgres")
+    con.execute(f"ATTACH '{dsn}' AS pg (TYPE postgres, READ_ONLY)")
+    for name in RAW_TABLES:
+        con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM pg.public.{name}")
+
+
+def build_features_duckdb(con):
+    with stage("duckdb features") as s:
+        final_df = s.out(apply_dtype_policy(con.execute(FEATURES_SQL).df()[FINAL_COLS]))
+    memory_report("duckdb features", final_df)
+    return final_df
+
+
+# -------------------------------------------------
+# Row-for-row check against the pandas path
+# -------------------------------------------------
+
+def compare_with_pandas(duck_df, pandas_df, atol=1e-4):
+    """
+    Raise AssertionError if the two feature frames differ in any row.
+    """
+    keys = ["game_id", "team_id"]
+    a = duck_df.sort_values(keys, ignore_index=True)
+    b = pandas_df.sort_values(keys, ignore_index=True)
+
+    if len(a) != len(b):
+        raise AssertionError(f"Row count differs: duckdb={len(a)} pandas={len(b)}")
+
+    for col in FINAL_COLS:
+        x, y = a[col], b[col]
+        if x.dtype.kind in "fiu" and y.dtype.kind in "fiu":
+            bad = ~np.isclose(x.to_numpy("float64"), y.to_numpy("float64"), atol=atol)
+        else:
+            bad = x.astype(str).to_numpy() != y.astype(str).to_numpy()
+        if bad.any():
+            rows = a.loc[bad, keys].head().to_dict(orient="records")
+            raise AssertionError(f"{bad.sum()} rows differ in {col}, e.g. {rows}")
+
+    print(f"DuckDB and pandas features match on all {len(a)} rows")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build team-game features with DuckDB")
+    parser.add_argument("--source", choices=["parquet", "postgres"], default="parquet")
+    parser.add_argument("--export", action="store_true",
+                        help="re-export raw tables to Parquet first")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the result row for row against the pandas path")
+    parser.add_argument("--persist", action="store_true",
+                        help="upsert the result into public.team_vs_opponent")
+    args = parser.parse_args(argv)
+
+    with run("team_vs_opponent_duckdb"):
+        from db import get_config, get_engine
+        engine = get_engine()
+
+        if args.export:
+            with stage("export raw tables"):
+                export_raw_tables(engine)
+
+        con = connect()
+        if args.source == "parquet":
+            register_parquet_sources(con)
+        else:
+            c = get_config()
+            register_postgres_sources(
+                con,
+                f"host={c['DB_HOST']} port={c['DB_PORT']} dbname={c['DB_NAME']} "
+                f"user={c['DB_USER']} password={c['DB_PASSWORD']}",
+            )
+
+        final_df = build_features_duckdb(con)
+        print(f"Final rows: {len(final_df)}")
+
+        if args.verify:
+            from team_vs_opponent import build_features, load_inputs
+            games, player_stats = load_inputs(engine)
+            compare_with_pandas(final_df, build_features(games, player_stats))
+
+        if args.persist:
+            from persist_team_game_features import persist_team_game_features
+            persist_team_game_features(final_df)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import pandas as pd
-from sklearn.linear_model import PoissonRegressor
-from sklearn.metrics import mean_absolute_error
-from db import engine
+import numpy as np
+from feature_dtypes import memory_report
+from instrument import run, stage
 
 # -------------------------------------------------
 # Config
@@ -19,125 +19,166 @@ FEATURES = [
 
 TARGET = "goals"
 
-# -------------------------------------------------
-# 1. Load data
-# -------------------------------------------------
+COLUMNS = [
+    "game_id",
+    "team_id",
+    "team_abbrev",
+    "home_away",
+    "opp_team_id",
+    "opp_abbrev",
+    "goals",
+    "goals_against",
+    "shots_last5",
+    "hits_last5",
+    "points_last5",
+    "opp_shots_last5",
+    "opp_hits_last5",
+    "opp_points_last5",
+    "date",
+    "season",
+]
 
-query = """
-SELECT
-    t.game_id,
-    t.team_id,
-    t.team_abbrev,
-    t.home_away,
-    t.opp_team_id,
-    t.opp_abbrev,
-    t.goals,
-    t.goals_against,
-    t.shots_last5,
-    t.hits_last5,
-    t.points_last5,
-    t.opp_shots_last5,
-    t.opp_hits_last5,
-    t.opp_points_last5,
-    g.game_date AS date,
-    g.season
-FROM team_vs_opponent t
-JOIN games g
-  ON t.game_id = g.id
-ORDER BY g.game_date;
-"""
-
-df = pd.read_sql(query, engine)
-df["date"] = pd.to_datetime(df["date"])
 
-# -------------------------------------------------
-# 2. Sanity checks
-# -------------------------------------------------
+def load_data():
+    from feature_store import load_training_frame
 
-required_cols = FEATURES + [TARGET, "season", "date"]
-missing = [c for c in required_cols if c not in df.columns]
-if missing:
-    raise RuntimeError(f"Missing required columns: {missing}")
+    # -------------------------------------------------
+    # 1. Load data
+    # -------------------------------------------------
 
-if df.empty:
-    raise RuntimeError("Loaded dataframe is empty")
+    # Local Parquet snapshot, topped up from the DB past the watermark
+    df = load_training_frame(columns=COLUMNS)
+    memory_report("load training frame", df)
 
-if df["season"].isna().any():
-    raise RuntimeError("Null season values detected")
+    # -------------------------------------------------
+    # 2. Sanity checks
+    # -------------------------------------------------
 
-print("Loaded rows:", len(df))
-print("Seasons:", sorted(df["season"].unique()))
-print("Rows per season:")
-print(df.groupby("season").size())
+    required_cols = FEATURES + [TARGET, "season", "date"]
+    missing = [c for c in required_cols if c not in df.columns]
+    if missing:
+        raise RuntimeError(f"Missing required columns: {missing}")
 
-# -------------------------------------------------
-# 3. Preprocessing
-# -------------------------------------------------
+    if df.empty:
+        raise RuntimeError("Loaded dataframe is empty")
 
-df["home_away"] = df["home_away"].map({"home": 1, "away": 0})
+    if df["season"].isna().any():
+        raise RuntimeError("Null season values detected")
 
-numeric_cols = df.select_dtypes(include="number").columns
-df[numeric_cols] = df[numeric_cols].fillna(0)
+    print("Loaded rows:", len(df))
+    print("Seasons:", sorted(df["season"].unique()))
+    print("Rows per season:")
+    print(df.groupby("season").size())
 
-# -------------------------------------------------
-# 4. Rolling season backtest
-# -------------------------------------------------
+    return df
 
-seasons = sorted(df["season"].unique())
-results = []
 
-for i in range(1, len(seasons)):
-    train_seasons = seasons[:i]
-    test_season = seasons[i]
+def preprocess(df):
+    # -------------------------------------------------
+    # 3. Preprocessing
+    # -------------------------------------------------
 
-    train = df[df["season"].isin(train_seasons)]
-    test = df[df["season"] == test_season]
+    df["home_away"] = (df["home_away"] == "home").astype("int8")
 
-    if train.empty or test.empty:
-        print(f"Skipping season {test_season} (no data)")
-        continue
+    numeric_cols = df.select_dtypes(include="number").columns
+    df[numeric_cols] = df[numeric_cols].fillna(0)
 
-    X_train = train[FEATURES]
-    y_train = train[TARGET]
-    X_test = test[FEATURES]
-    y_test = test[TARGET]
+    return df
 
-    model = PoissonRegressor(alpha=0.001, max_iter=1000)
-    model.fit(X_train, y_train)
 
-    test = test.copy()
-    test["pred_goals"] = model.predict(X_test)
+def export_steps(df):
+    """
+    preprocess() as scorer.py steps: (inputs, steps, clip).
+    """
+    steps = [{"out": "home_away", "op": "eq", "in": ["home_away"], "value": "home"}]
+    return FEATURES, steps, {}
 
-    mae = mean_absolute_error(y_test, test["pred_goals"])
 
-    print(
-        f"Train seasons {train_seasons} → "
-        f"Test season {test_season} | MAE = {mae:.3f}"
-    )
+def run_backtest(df):
+    from sklearn.linear_model import PoissonRegressor
+    from sklearn.metrics import mean_absolute_error
 
-    results.append(
-        test.assign(
-            test_season=test_season,
-            train_seasons=",".join(map(str, train_seasons)),
-            mae=mae,
-        )
-    )
+    # -------------------------------------------------
+    # 4. Rolling season backtest
+    # -------------------------------------------------
 
-# -------------------------------------------------
-# 5. Results
-# -------------------------------------------------
+    # Seasons are contiguous once sorted, so each fold is an array slice
+    df = df.sort_values("season", kind="stable", ignore_index=True)
+    X_all = df[FEATURES].to_numpy(dtype="float32")
+    y_all = df[TARGET].to_numpy()
+    season_col = df["season"].to_numpy()
+    memory_report("backtest inputs", df)
+
+    seasons = sorted(df["season"].unique().tolist())
+    results = []
+
+    for i in range(1, len(seasons)):
+        train_seasons = seasons[:i]
+        test_season = seasons[i]
+
+        lo = np.searchsorted(season_col, test_season, side="left")
+        hi = np.searchsorted(season_col, test_season, side="right")
+
+        if lo == 0 or hi == lo:
+            print(f"Skipping season {test_season} (no data)")
+            continue
 
-if not results:
-    raise RuntimeError("No backtest results generated")
+        X_train, y_train = X_all[:lo], y_all[:lo]
+        X_test, y_test = X_all[lo:hi], y_all[lo:hi]
+
+        model = PoissonRegressor(alpha=0.001, max_iter=1000)
+        with stage(f"fit {test_season}", rows_in=len(X_train)):
+            model.fit(X_train, y_train)
+
+        pred_goals = model.predict(X_test)
+
+        mae = mean_absolute_error(y_test, pred_goals)
+
+        print(
+            f"Train seasons {train_seasons} → "
+            f"Test season {test_season} | MAE = {mae:.3f}"
+        )
+
+        # Keep only what the summary needs, not a full copy of the fold
+        results.append(pd.DataFrame({
+            "game_id": df["game_id"].to_numpy()[lo:hi],
+            "team_id": df["team_id"].to_numpy()[lo:hi],
+            TARGET: y_test,
+            "pred_goals": pred_goals.astype("float32"),
+            "test_season": test_season,
+            "train_seasons": ",".join(map(str, train_seasons)),
+            "mae": mae,
+        }))
+
+    # -------------------------------------------------
+    # 5. Results
+    # -------------------------------------------------
+
+    if not results:
+        raise RuntimeError("No backtest results generated")
+
+    return pd.concat(results, ignore_index=True)
+
+
+def main():
+    with run("team_vs_opponent_predictions"):
+        with stage("load training frame") as s:
+            df = s.out(load_data())
+        with stage("preprocess", rows_in=len(df)) as s:
+            df = s.out(preprocess(df))
+        with stage("backtest", rows_in=len(df)) as s:
+            all_results = s.out(run_backtest(df))
+
+        print("\nBacktest summary:")
+        print(
+            all_results
+            .groupby("test_season")["mae"]
+            .mean()
+            .round(3)
+        )
 
-all_results = pd.concat(results, ignore_index=True)
+        print("\nDone.")
 
-print("\nBacktest summary:")
-print(
-    all_results
-    .groupby("test_season")["mae"]
-    .mean()
-    .round(3)
-)
 
-print("\nDone.")
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,9 @@ import pandas as pd
 import numpy as np
 from sklearn.linear_model import PoissonRegressor
 from sklearn.metrics import mean_absolute_error
-from db import engine
+from feature_dtypes import memory_report
+from feature_store import load_training_frame
+from instrument import run, stage
 
 # -------------------------------------------------
 # Config
@@ -27,41 +29,7 @@ FEATURES = [
 
 TARGET = "goals"
 
-# -------------------------------------------------
-# 1. Load data
-# -------------------------------------------------
-
-query = """
-SELECT
-    t.game_id,
-    t.team_id,
-    t.team_abbrev,
-    t.home_away,
-    t.opp_team_id,
-    t.opp_abbrev,
-    t.goals,
-    t.goals_against,
-    t.shots_last5,
-    t.hits_last5,
-    t.points_last5,
-    t.opp_shots_last5,
-    t.opp_hits_last5,
-    t.opp_points_last5,
-    g.game_date AS date,
-    g.season
-FROM team_vs_opponent t
-JOIN games g
-  ON t.game_id = g.id
-ORDER BY g.game_date;
-"""
-
-df = pd.read_sql(query, engine)
-df["date"] = pd.to_datetime(df["date"])
-
-# -------------------------------------------------
-# 2. Sanity checks
-# -------------------------------------------------
-
+# Inputs the engineered features are derived from
 RAW_FEATURES = [
     "shots_last5",
     "hits_last5",
@@ -72,172 +40,263 @@ RAW_FEATURES = [
     "home_away",
 ]
 
-required_cols = RAW_FEATURES + [TARGET, "season", "date"]
-
-missing = [c for c in required_cols if c not in df.columns]
-if missing:
-    raise RuntimeError(f"Missing required columns: {missing}")
-
-if df.empty:
-    raise RuntimeError("Loaded dataframe is empty")
+COLUMNS = [
+    "game_id",
+    "team_id",
+    "team_abbrev",
+    "home_away",
+    "opp_team_id",
+    "opp_abbrev",
+    "goals",
+    "goals_against",
+    "shots_last5",
+    "hits_last5",
+    "points_last5",
+    "opp_shots_last5",
+    "opp_hits_last5",
+    "opp_points_last5",
+    "date",
+    "season",
+]
 
-if df["season"].isna().any():
-    raise RuntimeError("Null season values detected")
+FEATURE_CLIP = {
+    "shots_pg": (10, 45),
+    "hits_pg": (5, 40),
+    "points_pg": (0.5, 6),
+    "opp_shots_pg": (10, 45),
+    "opp_hits_pg": (5, 40),
+    "opp_points_pg": (0.5, 6),
+    "shot_pressure": (100, 2000),
+    "home_offense": (0, 6),
+    "adj_points_pg": (-3, 3),
+}
 
-print("Loaded rows:", len(df))
-print("Seasons:", sorted(df["season"].unique()))
-print("Rows per season:")
-print(df.groupby("season").size())
+# Predicted goals are clipped to this range
+PRED_CLIP = (0, 5.5)
 
-# -------------------------------------------------
-# 3. Preprocessing
-# -------------------------------------------------
 
-df["home_away"] = df["home_away"].map({"home": 1, "away": 0})
+def load_data():
+    # -------------------------------------------------
+    # 1. Load data
+    # -------------------------------------------------
 
-numeric_cols = df.select_dtypes(include="number").columns
-df[numeric_cols] = df[numeric_cols].fillna(0)
+    # Local Parquet snapshot, topped up from the DB past the watermark
+    df = load_training_frame(columns=COLUMNS)
+    memory_report("load training frame", df)
 
-# --------------------------
-# Rate features (Poisson-friendly)
-# --------------------------
+    # -------------------------------------------------
+    # 2. Sanity checks
+    # -------------------------------------------------
 
-df["shots_pg"] = df["shots_last5"] / 5
-df["hits_pg"] = df["hits_last5"] / 5
-df["points_pg"] = df["points_last5"] / 5
+    required_cols = RAW_FEATURES + [TARGET, "season", "date"]
 
-df["opp_shots_pg"] = df["opp_shots_last5"] / 5
-df["opp_hits_pg"] = df["opp_hits_last5"] / 5
-df["opp_points_pg"] = df["opp_points_last5"] / 5
+    missing = [c for c in required_cols if c not in df.columns]
+    if missing:
+        raise RuntimeError(f"Missing required columns: {missing}")
 
-# --------------------------
-# Interaction features
-# --------------------------
+    if df.empty:
+        raise RuntimeError("Loaded dataframe is empty")
 
-# Pace / chaos proxy
-df["shot_pressure"] = (
-    df["shots_pg"] * df["opp_shots_pg"]
-)
+    if df["season"].isna().any():
+        raise RuntimeError("Null season values detected")
 
-# Home boost to offense
-df["home_offense"] = (
-    df["home_away"] * df["points_pg"]
-)
+    print("Loaded rows:", len(df))
+    print("Seasons:", sorted(df["season"].unique()))
+    print("Rows per season:")
+    print(df.groupby("season").size())
 
-# --------------------------
-# Season scoring environment normalization
-# --------------------------
+    return df
 
-season_goal_env = df.groupby("season")["goals"].mean()
-df["season_goal_env"] = df["season"].map(season_goal_env)
 
-df["adj_points_pg"] = (
-    df["points_pg"] - df["season_goal_env"]
-)
+def preprocess(df):
+    # -------------------------------------------------
+    # 3. Preprocessing
+    # -------------------------------------------------
 
+    df["home_away"] = (df["home_away"] == "home").astype("int8")
 
-missing_engineered = [c for c in FEATURES if c not in df.columns]
-if missing_engineered:
-    raise RuntimeError(
-        f"Missing engineered features: {missing_engineered}"
-    )
-    
-FEATURE_CLIP = {
-    "shots_pg": (10, 45),
-    "hits_pg": (5, 40),
-    "points_pg": (0.5, 6),
-    "opp_shots_pg": (10, 45),
-    "opp_hits_pg": (5, 40),
-    "opp_points_pg": (0.5, 6),
-    "shot_pressure": (100, 2000),
-    "home_offense": (0, 6),
-    "adj_points_pg": (-3, 3),
-}
+    numeric_cols = df.select_dtypes(include="number").columns
+    df[numeric_cols] = df[numeric_cols].fillna(0)
 
-for col, (lo, hi) in FEATURE_CLIP.items():
-    df[col] = df[col].clip(lo, hi)
+    # --------------------------
+    # Rate features (Poisson-friendly)
+    # --------------------------
 
+    df["shots_pg"] = df["shots_last5"] / 5
+    df["hits_pg"] = df["hits_last5"] / 5
+    df["points_pg"] = df["points_last5"] / 5
 
-# -------------------------------------------------
-# 4. Rolling season backtest
-# -------------------------------------------------
+    df["opp_shots_pg"] = df["opp_shots_last5"] / 5
+    df["opp_hits_pg"] = df["opp_hits_last5"] / 5
+    df["opp_points_pg"] = df["opp_points_last5"] / 5
 
-X = df[FEATURES]
+    # --------------------------
+    # Interaction features
+    # --------------------------
 
-if not np.isfinite(X.to_numpy()).all():
-    raise RuntimeError("Non-finite values detected in features")
+    # Pace / chaos proxy
+    df["shot_pressure"] = (
+        df["shots_pg"] * df["opp_shots_pg"]
+    )
 
-print("Feature std dev:")
-print(X.std().round(3))
+    # Home boost to offense
+    df["home_offense"] = (
+        df["home_away"] * df["points_pg"]
+    )
 
+    # --------------------------
+    # Season scoring environment normalization
+    # --------------------------
 
-seasons = sorted(df["season"].unique())
-results = []
+    season_goal_env = df.groupby("season")["goals"].mean()
+    df["season_goal_env"] = df["season"].map(season_goal_env)
 
-for i in range(1, len(seasons)):
-    train_seasons = seasons[:i]
-    test_season = seasons[i]
+    df["adj_points_pg"] = (
+        df["points_pg"] - df["season_goal_env"]
+    )
 
-    train = df[df["season"].isin(train_seasons)]
-    test = df[df["season"] == test_season]
 
-    if train.empty or test.empty:
-        print(f"Skipping season {test_season} (no data)")
-        continue
+    missing_engineered = [c for c in FEATURES if c not in df.columns]
+    if missing_engineered:
+        raise RuntimeError(
+            f"Missing engineered features: {missing_engineered}"
+        )
 
-    X_train = train[FEATURES]
-    y_train = train[TARGET]
-    X_test = test[FEATURES]
-    y_test = test[TARGET]
+    for col, (lo, hi) in FEATURE_CLIP.items():
+        df[col] = df[col].clip(lo, hi)
+
+    return df
+
+
+def export_steps(df):
+    """
+    preprocess() as scorer.py steps: (inputs, steps, clip). The season
+    scoring environment is frozen from the preprocessed training frame `df`;
+    unseen seasons use the latest one.
+    """
+    env = df.groupby("season")["season_goal_env"].first().sort_index()
+    steps = [{"out": "home_away", "op": "eq", "in": ["home_away"], "value": "home"}]
+    for prefix in ("", "opp_"):
+        for stat in ("shots", "hits", "points"):
+            steps.append({
+                "out": f"{prefix}{stat}_pg", "op": "div",
+                "in": [f"{prefix}{stat}_last5"], "value": 5,
+            })
+    steps += [
+        {"out": "shot_pressure", "op": "mul", "in": ["shots_pg", "opp_shots_pg"]},
+        {"out": "home_offense", "op": "mul", "in": ["home_away", "points_pg"]},
+        {
+            "out": "adj_points_pg", "op": "sub_lookup", "in": ["points_pg", "season"],
+            "table": {str(k): float(v) for k, v in env.items()},
+            "default": float(env.iloc[-1]),
+        },
+    ]
+    return RAW_FEATURES + ["season"], steps, FEATURE_CLIP
+
+
+def run_backtest(df):
+    # -------------------------------------------------
+    # 4. Rolling season backtest
+    # -------------------------------------------------
+
+    X = df[FEATURES]
+
+    if not np.isfinite(X.to_numpy()).all():
+        raise RuntimeError("Non-finite values detected in features")
+
+    print("Feature std dev:")
+    print(X.std().round(3))
+
+
+    # Seasons are contiguous once sorted, so each fold is an array slice
+    df = df.sort_values("season", kind="stable", ignore_index=True)
+    X_all = df[FEATURES].to_numpy(dtype="float32")
+    y_all = df[TARGET].to_numpy()
+    season_col = df["season"].to_numpy()
+    memory_report("backtest inputs", df)
+
+    seasons = sorted(df["season"].unique().tolist())
+    results = []
+
+    for i in range(1, len(seasons)):
+        train_seasons = seasons[:i]
+        test_season = seasons[i]
+
+        lo = np.searchsorted(season_col, test_season, side="left")
+        hi = np.searchsorted(season_col, test_season, side="right")
+
+        if lo == 0 or hi == lo:
+            print(f"Skipping season {test_season} (no data)")
+            continue
+
+        X_train, y_train = X_all[:lo], y_all[:lo]
+        X_test, y_test = X_all[lo:hi], y_all[lo:hi]
     
-    baseline = y_train.mean()
-    baseline_mae = mean_absolute_error(
-    y_test, [baseline] * len(y_test)
-    )
-
-    print(f"Baseline MAE: {baseline_mae:.3f}")
+        baseline = y_train.mean()
+        baseline_mae = mean_absolute_error(
+        y_test, [baseline] * len(y_test)
+        )
 
+        print(f"Baseline MAE: {baseline_mae:.3f}")
 
-    model = PoissonRegressor(alpha=0.05, max_iter=5000)
-    model.fit(X_train, y_train)
 
-    test = test.copy()
-    test["pred_goals"] = (
-    model.predict(X_test)
-    .clip(0, 5.5)
-    )
+        model = PoissonRegressor(alpha=0.05, max_iter=5000)
+        with stage(f"fit {test_season}", rows_in=len(X_train)):
+            model.fit(X_train, y_train)
 
+        pred_goals = (
+        model.predict(X_test)
+        .clip(*PRED_CLIP)
+        )
 
-    mae = mean_absolute_error(y_test, test["pred_goals"])
 
-    print(
-        f"Train seasons {train_seasons} → "
-        f"Test season {test_season} | MAE = {mae:.3f}"
-    )
+        mae = mean_absolute_error(y_test, pred_goals)
 
-    results.append(
-        test.assign(
-            test_season=test_season,
-            train_seasons=",".join(map(str, train_seasons)),
-            mae=mae,
+        print(
+            f"Train seasons {train_seasons} → "
+            f"Test season {test_season} | MAE = {mae:.3f}"
         )
-    )
 
-# -------------------------------------------------
-# 5. Results
-# -------------------------------------------------
-
-if not results:
-    raise RuntimeError("No backtest results generated")
+        # Keep only what the summary needs, not a full copy of the fold
+        results.append(pd.DataFrame({
+            "game_id": df["game_id"].to_numpy()[lo:hi],
+            "team_id": df["team_id"].to_numpy()[lo:hi],
+            TARGET: y_test,
+            "pred_goals": pred_goals.astype("float32"),
+            "test_season": test_season,
+            "train_seasons": ",".join(map(str, train_seasons)),
+            "mae": mae,
+        }))
+
+    # -------------------------------------------------
+    # 5. Results
+    # -------------------------------------------------
+
+    if not results:
+        raise RuntimeError("No backtest results generated")
+
+    return pd.concat(results, ignore_index=True)
+
+
+def main():
+    with run("team_vs_opponent_predictions_r1"):
+        with stage("load training frame") as s:
+            df = s.out(load_data())
+        with stage("preprocess", rows_in=len(df)) as s:
+            df = s.out(preprocess(df))
+        with stage("backtest", rows_in=len(df)) as s:
+            all_results = s.out(run_backtest(df))
+
+        print("\nBacktest summary:")
+        print(
+            all_results
+            .groupby("test_season")["mae"]
+            .mean()
+            .round(3)
+        )
 
-all_results = pd.concat(results, ignore_index=True)
+        print("\nDone.")
 
-print("\nBacktest summary:")
-print(
-    all_results
-    .groupby("test_season")["mae"]
-    .mean()
-    .round(3)
-)
 
-print("\nDone.")
+if __name__ == "__main__":
+    main()
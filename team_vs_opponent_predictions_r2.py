@@ -1,7 +1,11 @@
 import pandas as pd
+import numpy as np
 from sklearn.linear_model import PoissonRegressor
 from sklearn.metrics import mean_absolute_error
-from db import engine
+from db import get_engine
+from feature_dtypes import memory_report
+from feature_store import load_training_frame
+from instrument import run, stage
 
 # -------------------------------------------------
 # Config
@@ -22,31 +26,22 @@ FEATURES = [
 
 TARGET = "goals"
 
-# -------------------------------------------------
-# 1. Load raw data
-# -------------------------------------------------
 # Team offense
-offense_query = """
-SELECT
-    t.game_id,
-    t.team_id,
-    t.team_abbrev,
-    t.home_away,
-    t.opp_team_id,
-    t.opp_abbrev,
-    t.goals,
-    t.goals_against,
-    t.shots,
-    t.hits,
-    t.points,
-    g.game_date AS date,
-    g.season
-FROM team_vs_opponent t
-JOIN games g ON t.game_id = g.id
-ORDER BY g.game_date;
-"""
-offense_df = pd.read_sql(offense_query, engine)
-offense_df["date"] = pd.to_datetime(offense_df["date"])
+OFFENSE_COLUMNS = [
+    "game_id",
+    "team_id",
+    "team_abbrev",
+    "home_away",
+    "opp_team_id",
+    "opp_abbrev",
+    "goals",
+    "goals_against",
+    "shots",
+    "hits",
+    "points",
+    "date",
+    "season",
+]
 
 # Team defense
 defense_query = """
@@ -59,103 +54,144 @@ FROM team_game_defense
 GROUP BY game_id, team_id
 ORDER BY game_id;
 """
-defense_df = pd.read_sql(defense_query, engine)
-
-# -------------------------------------------------
-# 2. Merge offense + defense
-# -------------------------------------------------
-df = offense_df.merge(
-    defense_df,
-    left_on=["game_id", "team_id"],
-    right_on=["game_id", "team_id"],
-    how="left"
-)
 
-# Fill missing defense stats with 0
-df[["blocked_shots", "plus_minus"]] = df[["blocked_shots", "plus_minus"]].fillna(0)
 
-# -------------------------------------------------
-# 3. Compute rolling last-5 features
-# -------------------------------------------------
 def compute_rolling(df, col_name, group_col, new_name):
     return df.groupby(group_col)[col_name].shift().rolling(5, min_periods=1).mean()
 
-# Team offense rolling
-df["shots_last5"] = compute_rolling(df, "shots", "team_id", "shots_last5")
-df["hits_last5"] = compute_rolling(df, "hits", "team_id", "hits_last5")
-df["points_last5"] = compute_rolling(df, "points", "team_id", "points_last5")
 
-# Team defense rolling
-df["def_blocked_shots_last5"] = compute_rolling(df, "blocked_shots", "team_id", "def_blocked_shots_last5")
-df["def_plus_minus_last5"] = compute_rolling(df, "plus_minus", "team_id", "def_plus_minus_last5")
+def load_data():
+    # -------------------------------------------------
+    # 1. Load raw data
+    # -------------------------------------------------
+    # Local Parquet snapshot, topped up from the DB past the watermark
+    offense_df = load_training_frame(columns=OFFENSE_COLUMNS)
+    memory_report("load training frame", offense_df)
+
+    defense_df = pd.read_sql(defense_query, get_engine())
+
+    # -------------------------------------------------
+    # 2. Merge offense + defense
+    # -------------------------------------------------
+    df = offense_df.merge(
+        defense_df,
+        left_on=["game_id", "team_id"],
+        right_on=["game_id", "team_id"],
+        how="left"
+    )
 
-# Opponent offense rolling
-df["opp_shots_last5"] = compute_rolling(df, "shots", "opp_team_id", "opp_shots_last5")
-df["opp_hits_last5"] = compute_rolling(df, "hits", "opp_team_id", "opp_hits_last5")
-df["opp_points_last5"] = compute_rolling(df, "points", "opp_team_id", "opp_points_last5")
+    # Fill missing defense stats with 0
+    df[["blocked_shots", "plus_minus"]] = df[["blocked_shots", "plus_minus"]].fillna(0)
 
-# Opponent defense rolling
-df["opp_def_blocked_shots_last5"] = compute_rolling(df, "blocked_shots", "opp_team_id", "opp_def_blocked_shots_last5")
-df["opp_def_plus_minus_last5"] = compute_rolling(df, "plus_minus", "opp_team_id", "opp_def_plus_minus_last5")
+    return df
 
-# -------------------------------------------------
-# 4. Preprocessing
-# -------------------------------------------------
-df["home_away"] = df["home_away"].map({"home": 1, "away": 0})
 
-numeric_cols = df.select_dtypes(include="number").columns
-df[numeric_cols] = df[numeric_cols].fillna(0)
+def preprocess(df):
+    # -------------------------------------------------
+    # 3. Compute rolling last-5 features
+    # -------------------------------------------------
+    # Team offense rolling
+    df["shots_last5"] = compute_rolling(df, "shots", "team_id", "shots_last5")
+    df["hits_last5"] = compute_rolling(df, "hits", "team_id", "hits_last5")
+    df["points_last5"] = compute_rolling(df, "points", "team_id", "points_last5")
 
-# -------------------------------------------------
-# 5. Rolling season backtest
-# -------------------------------------------------
-seasons = sorted(df["season"].unique())
-results = []
+    # Team defense rolling
+    df["def_blocked_shots_last5"] = compute_rolling(df, "blocked_shots", "team_id", "def_blocked_shots_last5")
+    df["def_plus_minus_last5"] = compute_rolling(df, "plus_minus", "team_id", "def_plus_minus_last5")
 
-for i in range(1, len(seasons)):
-    train_seasons = seasons[:i]
-    test_season = seasons[i]
+    # Opponent offense rolling
+    df["opp_shots_last5"] = compute_rolling(df, "shots", "opp_team_id", "opp_shots_last5")
+    df["opp_hits_last5"] = compute_rolling(df, "hits", "opp_team_id", "opp_hits_last5")
+    df["opp_points_last5"] = compute_rolling(df, "points", "opp_team_id", "opp_points_last5")
 
-    train = df[df["season"].isin(train_seasons)]
-    test = df[df["season"] == test_season]
+    # Opponent defense rolling
+    df["opp_def_blocked_shots_last5"] = compute_rolling(df, "blocked_shots", "opp_team_id", "opp_def_blocked_shots_last5")
+    df["opp_def_plus_minus_last5"] = compute_rolling(df, "plus_minus", "opp_team_id", "opp_def_plus_minus_last5")
 
-    if train.empty or test.empty:
-        print(f"Skipping season {test_season} (no data)")
-        continue
+    # -------------------------------------------------
+    # 4. Preprocessing
+    # -------------------------------------------------
+    df["home_away"] = (df["home_away"] == "home").astype("int8")
 
-    X_train = train[FEATURES]
-    y_train = train[TARGET]
-    X_test = test[FEATURES]
-    y_test = test[TARGET]
+    numeric_cols = df.select_dtypes(include="number").columns
+    df[numeric_cols] = df[numeric_cols].fillna(0)
 
-    model = PoissonRegressor(alpha=0.001, max_iter=1000)
-    model.fit(X_train, y_train)
+    return df
 
-    test = test.copy()
-    test["pred_goals"] = model.predict(X_test)
 
-    mae = mean_absolute_error(y_test, test["pred_goals"])
-    print(
-        f"Train seasons {train_seasons} → "
-        f"Test season {test_season} | MAE = {mae:.3f}"
-    )
+def run_backtest(df):
+    # -------------------------------------------------
+    # 5. Rolling season backtest
+    # -------------------------------------------------
+    # Seasons are contiguous once sorted, so each fold is an array slice
+    df = df.sort_values("season", kind="stable", ignore_index=True)
+    X_all = df[FEATURES].to_numpy(dtype="float32")
+    y_all = df[TARGET].to_numpy()
+    season_col = df["season"].to_numpy()
+    memory_report("backtest inputs", df)
 
-    results.append(
-        test.assign(
-            test_season=test_season,
-            train_seasons=",".join(map(str, train_seasons)),
-            mae=mae,
-        )
-    )
+    seasons = sorted(df["season"].unique().tolist())
+    results = []
 
-# -------------------------------------------------
-# 6. Results
-# -------------------------------------------------
-if not results:
-    raise RuntimeError("No backtest results generated")
+    for i in range(1, len(seasons)):
+        train_seasons = seasons[:i]
+        test_season = seasons[i]
 
-all_results = pd.concat(results, ignore_index=True)
+        lo = np.searchsorted(season_col, test_season, side="left")
+        hi = np.searchsorted(season_col, test_season, side="right")
+
+        if lo == 0 or hi == lo:
+            print(f"Skipping season {test_season} (no data)")
+            continue
+
+        X_train, y_train = X_all[:lo], y_all[:lo]
+        X_test, y_test = X_all[lo:hi], y_all[lo:hi]
+
+        model = PoissonRegressor(alpha=0.001, max_iter=1000)
+        with stage(f"fit {test_season}", rows_in=len(X_train)):
+            model.fit(X_train, y_train)
+
+        pred_goals = model.predict(X_test)
+
+        mae = mean_absolute_error(y_test, pred_goals)
+        print(
+            f"Train seasons {train_seasons} → "
+            f"Test season {test_season} | MAE = {mae:.3f}"
+        )
 
-print("\nBacktest summary:")
-print(all_results.groupby("test_season")["mae"].mean().round(3))
-print("\nDone.")
+        # Keep only what the summary needs, not a full copy of the fold
+        results.append(pd.DataFrame({
+            "game_id": df["game_id"].to_numpy()[lo:hi],
+            "team_id": df["team_id"].to_numpy()[lo:hi],
+            TARGET: y_test,
+            "pred_goals": pred_goals.astype("float32"),
+            "test_season": test_season,
+            "train_seasons": ",".join(map(str, train_seasons)),
+            "mae": mae,
+        }))
+
+    # -------------------------------------------------
+    # 6. Results
+    # -------------------------------------------------
+    if not results:
+        raise RuntimeError("No backtest results generated")
+
+    return pd.concat(results, ignore_index=True)
+
+
+def main():
+    with run("team_vs_opponent_predictions_r2"):
+        with stage("load training frame") as s:
+            df = s.out(load_data())
+        with stage("preprocess", rows_in=len(df)) as s:
+            df = s.out(preprocess(df))
+        with stage("backtest", rows_in=len(df)) as s:
+            all_results = s.out(run_backtest(df))
+
+        print("\nBacktest summary:")
+        print(all_results.groupby("test_season")["mae"].mean().round(3))
+        print("\nDone.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+from sqlalchemy import text
+
+from db import get_engine
+from events import VIEW_REFRESHED, notify
+
+VIEW_NAME = "public.team_vs_opponent_mv"
+
+# -------------------------------------------------
+# Team-game feature set, built entirely in SQL
+#
+# Mirrors team_vs_opponent.py (skater/goalie split,
+# games_long, opponent self-join, rolling last-5) so
+# readers can query it without the pandas round trip.
+# -------------------------------------------------
+
+CREATE_VIEW_SQL = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW_NAME} AS
+WITH final_games AS (
+    SELECT
+        g.id AS game_id,
+        g.nhl_game_id,
+        g.game_date AS date,
+        g.season,
+        g.home_team_id,
+        g.away_team_id,
+        ht.abbreviation AS home_abbrev,
+        at.abbreviation AS away_abbrev
+    FROM public.games g
+    JOIN public.teams ht ON g.home_team_id = ht.id
+    JOIN public.teams at ON g.away_team_id = at.id
+    WHERE g.status = 'final'
+),
+team_game_stats AS (
+    SELECT
+        ps.game_id,
+        ps.team_id,
+        SUM(ps.goals)  FILTER (WHERE p.position IS DISTINCT FROM 'G') AS goals,
+        SUM(ps.shots)  FILTER (WHERE p.position IS DISTINCT FROM 'G') AS shots,
+        SUM(ps.hits)   FILTER (WHERE p.position IS DISTINCT FROM 'G') AS hits,
+        SUM(ps.points) FILTER (WHERE p.position IS DISTINCT FROM 'G') AS points,
+        SUM(ps.goals)  FILTER (WHERE p.position = 'G') AS goals_against,
+        SUM(ps.shots)  FILTER (WHERE p.position = 'G') AS shots_against
+    FROM public.player_stats ps
+    JOIN final_games fg ON ps.game_id = fg.game_id
+    JOIN public.players p ON ps.player_id = p.id
+    GROUP BY ps.game_id, ps.team_id
+    HAVING COUNT(*) FILTER (WHERE p.position IS DISTINCT FROM 'G') > 0
+),
+defense_game_stats AS (
+    -- team_game_defense is keyed by the NHL game id
+    SELECT
+        fg.game_id,
+        d.team_id,
+        SUM(d.blocked_shots) AS def_blocked_shots,
+        SUM(d.plus_minus) AS def_plus_minus
+    FROM public.team_game_defense d
+    JOIN final_games fg ON d.game_id = fg.nhl_game_id
+    GROUP BY fg.game_id, d.team_id
+),
+games_long AS (
+    SELECT
+        game_id, date, season,
+        home_team_id AS team_id,
+        away_team_id AS opp_team_id,
+        home_abbrev AS team_abbrev,
+        away_abbrev AS opp_abbrev,
+        'home' AS home_away
+    FROM final_games
+    UNION ALL
+    SELECT
+        game_id, date, season,
+        away_team_id AS team_id,
+        home_team_id AS opp_team_id,
+        away_abbrev AS team_abbrev,
+        home_abbrev AS opp_abbrev,
+        'away' AS home_away
+    FROM final_games
+),
+team_games AS (
+    SELECT
+        gl.game_id,
+        gl.team_id,
+        gl.team_abbrev,
+        gl.home_away,
+        gl.opp_team_id,
+        gl.opp_abbrev,
+        gl.date,
+        gl.season,
+
+        s.goals,
+        s.goals_against,
+        s.shots,
+        s.hits,
+        s.points,
+
+        o.goals AS opp_goals,
+        o.shots AS opp_shots,
+        o.hits AS opp_hits,
+        o.points AS opp_points,
+
+        COALESCE(d.def_blocked_shots, 0) AS def_blocked_shots,
+        COALESCE(d.def_plus_minus, 0) AS def_plus_minus
+    FROM games_long gl
+    JOIN team_game_stats s
+      ON s.game_id = gl.game_id AND s.team_id = gl.team_id
+    LEFT JOIN team_game_stats o
+      ON o.game_id = gl.game_id AND o.team_id = gl.opp_team_id
+    LEFT JOIN defense_game_stats d
+      ON d.game_id = gl.game_id AND d.team_id = gl.team_id
+),
+rolling AS (
+    SELECT
+        tg.*,
+        AVG(goals) OVER w AS goals_last5,
+        AVG(goals_against) OVER w AS goals_against_last5,
+        AVG(shots) OVER w AS shots_last5,
+        AVG(hits) OVER w AS hits_last5,
+        AVG(points) OVER w AS points_last5,
+        AVG(def_blocked_shots) OVER w AS def_blocked_shots_last5,
+        AVG(def_plus_minus) OVER w AS def_plus_minus_last5
+    FROM team_games tg
+    WINDOW w AS (
+        PARTITION BY team_id
+        ORDER BY date, game_id
+        ROWS BETWEEN 4 PRECEDING AND CURRENT ROW
+    )
+)
+SELECT
+    r.game_id,
+    r.team_id,
+    r.team_abbrev,
+    r.home_away,
+    r.opp_team_id,
+    r.opp_abbrev,
+    r.date,
+    r.season,
+
+    COALESCE(r.goals, 0) AS goals,
+    COALESCE(r.goals_against, 0) AS goals_against,
+    COALESCE(r.shots, 0) AS shots,
+    COALESCE(r.hits, 0) AS hits,
+    COALESCE(r.points, 0) AS points,
+
+    COALESCE(r.opp_goals, 0) AS opp_goals,
+    COALESCE(r.opp_shots, 0) AS opp_shots,
+    COALESCE(r.opp_hits, 0) AS opp_hits,
+    COALESCE(r.opp_points, 0) AS opp_points,
+
+    r.def_blocked_shots,
+    r.def_plus_minus,
+
+    COALESCE(r.goals_last5, 0) AS goals_last5,
+    COALESCE(r.goals_against_last5, 0) AS goals_against_last5,
+    COALESCE(r.shots_last5, 0) AS shots_last5,
+    COALESCE(r.hits_last5, 0) AS hits_last5,
+    COALESCE(r.points_last5, 0) AS points_last5,
+    COALESCE(r.def_blocked_shots_last5, 0) AS def_blocked_shots_last5,
+    COALESCE(r.def_plus_minus_last5, 0) AS def_plus_minus_last5,
+
+    COALESCE(o.goals_last5, 0) AS opp_goals_last5,
+    COALESCE(o.goals_against_last5, 0) AS opp_goals_against_last5,
+    COALESCE(o.shots_last5, 0) AS opp_shots_last5,
+    COALESCE(o.hits_last5, 0) AS opp_hits_last5,
+    COALESCE(o.points_last5, 0) AS opp_points_last5,
+    COALESCE(o.def_blocked_shots_last5, 0) AS opp_def_blocked_shots_last5,
+    COALESCE(o.def_plus_minus_last5, 0) AS opp_def_plus_minus_last5
+FROM rolling r
+LEFT JOIN rolling o
+  ON o.game_id = r.game_id AND o.team_id = r.opp_team_id
+WITH DATA
+"""
+
+# REFRESH ... CONCURRENTLY requires a unique index covering every row
+CREATE_INDEXES_SQL = [
+    f"""
+    CREATE UNIQUE INDEX IF NOT EXISTS team_vs_opponent_mv_game_team_idx
+    ON {VIEW_NAME} (game_id, team_id)
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS team_vs_opponent_mv_team_date_idx
+    ON {VIEW_NAME} (team_id, date)
+    """,
+]
+
+
+def create_team_vs_opponent_view(bind=None):
+    """
+    Create the materialized view and its indexes if they don't exist.
+    """
+    bind = bind or get_engine()
+    with bind.begin() as conn:
+        conn.execute(text(CREATE_VIEW_SQL))
+        for stmt in CREATE_INDEXES_SQL:
+            conn.execute(text(stmt))
+    print(f"Ensured materialized view {VIEW_NAME}")
+
+
+def refresh_team_vs_opponent_view(bind=None, concurrently=True):
+    """
+    Recompute the view after an ingest.
+
+    CONCURRENTLY keeps the old contents readable while the new
+    ones are built, so prediction scripts and the API never block.
+    """
+    bind = bind or get_engine()
+    mode = "CONCURRENTLY " if concurrently else ""
+    with bind.begin() as conn:
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{VIEW_NAME}"))
+        # Delivered on commit; the web app drops its cached predictions
+        notify(conn, VIEW_REFRESHED, view=VIEW_NAME)
+    print(f"Refreshed materialized view {VIEW_NAME}")
+
+
+if __name__ == "__main__":
+    create_team_vs_opponent_view()
+    refresh_team_vs_opponent_view()
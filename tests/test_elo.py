@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import elo
+
+
+def sequential(games, **params):
+    """
+    Reference replay: one game at a time in (date, game_id) order.
+    """
+    p = {**elo.PARAMS, **params}
+    games = games.sort_values(["date", "game_id"], ignore_index=True)
+    ratings, seasons, pre = {}, {}, []
+    for g in games.itertuples():
+        for team in (g.home_team_id, g.away_team_id):
+            if team in seasons and seasons[team] != g.season:
+                ratings[team] = elo.regress(ratings[team], p["carry"], p["mean"])
+            seasons[team] = g.season
+        rh = ratings.get(g.home_team_id, elo.INITIAL)
+        ra = ratings.get(g.away_team_id, elo.INITIAL)
+        delta = float(elo.rating_delta(rh, ra, g.home_score, g.away_score, **p))
+        ratings[g.home_team_id], ratings[g.away_team_id] = rh + delta, ra - delta
+        pre.append((rh, ra))
+    return np.array(pre)
+
+
+def random_games(n=3000, teams=12, seed=0):
+    rng = np.random.default_rng(seed)
+    home = rng.integers(0, teams, n)
+    away = (home + rng.integers(1, teams, n)) % teams
+    # Few days for many games, so teams often play several times a day
+    day = np.sort(rng.integers(0, 400, n))
+    return pd.DataFrame({
+        "game_id": np.arange(n),
+        "season": 2020 + day // 200,
+        "date": pd.Timestamp("2020-10-01") + pd.to_timedelta(day, unit="D"),
+        "home_team_id": home,
+        "away_team_id": away,
+        "home_score": rng.poisson(3.1, n),
+        "away_score": rng.poisson(2.8, n),
+    })
+
+
+def test_replay_matches_sequential_with_same_day_repeats():
+    games = random_games()
+    history, _ = elo.replay(games)
+    n = len(games)
+    got = np.column_stack([history["rating_pre"][:n], history["rating_pre"][n:]])
+    np.testing.assert_allclose(got, sequential(games), atol=1e-9)
+
+
+def test_batches_split_chained_same_day_games():
+    # B is X's 2nd and Z's 1st game of the day, C is Z's 2nd and W's 1st:
+    # C must come after B
+    games = pd.DataFrame({
+        "game_id": [1, 2, 3],
+        "date": pd.to_datetime(["2024-01-01"] * 3),
+        "home_team_id": [10, 10, 30],
+        "away_team_id": [20, 30, 40],
+    })
+    batch = elo._batches(games)
+    assert batch[0] < batch[1] < batch[2]
+
+
+class DuckCursor:
+    """
+    DB-API cursor over DuckDB that accepts the psycopg2 %s placeholders.
+    """
+
+    def __init__(self, con):
+        self.cur = con.cursor()
+
+    def execute(self, sql, params=()):
+        self.cur.execute(sql.replace("%s", "?"), list(params))
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    @property
+    def description(self):
+        return self.cur.description
+
+
+def test_pregame_ratings_regress_season_openers():
+    duckdb = pytest.importorskip("duckdb")
+    con = duckdb.connect()
+    con.execute("CREATE SCHEMA public")
+    con.execute("""CREATE TABLE public.games (id INTEGER, season INTEGER, game_date TIMESTAMP,
+                   home_team_id INTEGER, away_team_id INTEGER)""")
+    con.execute("""CREATE TABLE public.team_rating_history (team_id INTEGER, game_id INTEGER,
+                   date TIMESTAMP, season INTEGER, rating_pre DOUBLE, rating_post DOUBLE)""")
+    con.execute("""INSERT INTO public.games VALUES
+        (1, 2023, '2024-04-10', 1, 2), (2, 2024, '2024-10-08', 1, 3),
+        (3, 2024, '2024-10-12', 2, 3), (4, 2024, '2024-10-15', 3, 1)""")
+    con.execute("""INSERT INTO public.team_rating_history VALUES
+        (1, 1, '2024-04-10', 2023, 1540, 1560), (2, 1, '2024-04-10', 2023, 1470, 1450),
+        (1, 2, '2024-10-08', 2024, 1531.5, 1540), (3, 2, '2024-10-08', 2024, 1500, 1491.5)""")
+    cur = DuckCursor(con)
+
+    # Rated game: the stored pre-game ratings
+    assert elo.pregame_ratings(cur, 2) == {1: 1531.5, 3: 1500.0}
+    # Team 2's opener carries its 2023 rating over the summer
+    assert elo.pregame_ratings(cur, 3) == {2: pytest.approx(elo.regress(1450.0)), 3: 1491.5}
+    # Same season: the rating out of the previous game
+    assert elo.pregame_ratings(cur, 4) == {3: 1491.5, 1: 1540.0}
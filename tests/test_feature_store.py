@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+import feature_store
+
+
+class FakeView:
+    """
+    Stands in for the materialized view: the DB reads and the per-season
+    checksums, counting which seasons were read.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.reads = []
+
+    def checksums(self, bind):
+        return {
+            str(season): str(pd.util.hash_pandas_object(part, index=False).sum())
+            for season, part in self.df.groupby("season")
+        }
+
+    def read(self, bind, columns=None, seasons=None):
+        self.reads.append(None if seasons is None else sorted(seasons))
+        df = self.df if seasons is None else self.df[self.df["season"].isin(seasons)]
+        return df[columns or list(df.columns)].reset_index(drop=True).copy()
+
+
+def view_rows():
+    rows = []
+    for season, start in ((20222023, "2022-10-10"), (20232024, "2023-10-10")):
+        for i, day in enumerate(pd.date_range(start, periods=4, freq="D")):
+            for team, opp in ((1, 2), (2, 1)):
+                rows.append({
+                    "game_id": season % 10000 * 10 + i, "team_id": team, "opp_team_id": opp,
+                    "date": day, "season": season, "goals": 3, "shots_last5": 30.0,
+                })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def view(tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_store, "STORE_DIR", str(tmp_path))
+    fake = FakeView(view_rows())
+    monkeypatch.setattr(feature_store, "_season_checksums", fake.checksums)
+    monkeypatch.setattr(feature_store, "_read_db", fake.read)
+    return fake
+
+
+def test_unchanged_view_is_up_to_date(view):
+    first = feature_store.snapshot_training_frame(bind=object())
+    assert first["row_count"] == 16
+    assert feature_store.snapshot_training_frame(bind=object()) == first
+    assert view.reads == [None]
+
+
+def test_late_change_to_an_old_game_rewrites_its_season(view):
+    feature_store.snapshot_training_frame(bind=object())
+
+    # Late stats for the first game of the older season, which is dated well
+    # before the newest snapshotted row
+    late = (view.df["game_id"] == 20230) & (view.df["team_id"] == 1)
+    view.df.loc[late, "goals"] = 5
+
+    frame = feature_store.load_training_frame(columns=["game_id", "team_id", "goals"], bind=object())
+    assert view.reads[-1] == [20222023]
+    assert frame.loc[(frame["game_id"] == 20230) & (frame["team_id"] == 1), "goals"].item() == 5
+    assert len(frame) == 16
+
+    manifest = feature_store.snapshot_training_frame(bind=object())
+    assert view.reads[-1] == [20222023]
+    snap = feature_store.load_snapshot(seasons=[20222023])
+    assert snap.loc[(snap["game_id"] == 20230) & (snap["team_id"] == 1), "goals"].item() == 5
+    assert manifest["row_count"] == 16
+
+
+def test_new_season_is_added(view):
+    feature_store.snapshot_training_frame(bind=object())
+    extra = view.df[view.df["season"] == 20232024].assign(
+        season=20242025, game_id=lambda d: d["game_id"] + 10000,
+        date=lambda d: d["date"] + pd.Timedelta(days=365),
+    )
+    view.df = pd.concat([view.df, extra], ignore_index=True)
+
+    manifest = feature_store.snapshot_training_frame(bind=object())
+    assert view.reads[-1] == [20242025]
+    assert manifest["seasons"] == {"20222023": 8, "20232024": 8, "20242025": 8}
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import lineup_model as lm
+
+N_TEAMS, SKATERS = 6, 5
+# Player ids: team t's skaters are t*10 + 1..5, its goalie t*10 + 9; the star
+# is an extra skater of team 0 who dresses in about half its games
+STAR = 7
+
+
+def toi(minutes):
+    return f"{int(minutes)}:{round(minutes % 1 * 60):02d}"
+
+
+def simulated_player_stats(n_days=250, star_effect=0.6, seed=2):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for day in range(n_days):
+        order = rng.permutation(N_TEAMS)
+        for i in range(0, N_TEAMS, 2):
+            game_id = day * 10 + i
+            home, away = order[i], order[i + 1]
+            lineups = {}
+            for team in (home, away):
+                players = [(team * 10 + k, "C", 20.0) for k in range(1, SKATERS + 1)]
+                if team == 0 and rng.random() < 0.5:
+                    players.append((STAR, "C", 20.0))
+                lineups[team] = players
+            goals = {}
+            for team, opp in ((home, away), (away, home)):
+                star_on = any(p[0] == STAR for p in lineups[team])
+                mu = np.exp(np.log(2.9) + 0.1 * (team == home) + star_effect * star_on * 20 / 60)
+                goals[team] = rng.poisson(mu)
+            for team, opp in ((home, away), (away, home)):
+                for j, (pid, pos, minutes) in enumerate(lineups[team]):
+                    rows.append((game_id, day, team, opp, team == home, pid, pos,
+                                 goals[team] if j == 0 else 0, toi(minutes)))
+                # Goalie rows carry goals against
+                rows.append((game_id, day, team, opp, team == home, team * 10 + 9, "G", goals[opp], toi(60)))
+    ps = pd.DataFrame(rows, columns=["game_id", "day", "team_id", "opp_team_id", "is_home",
+                                     "player_id", "position", "goals", "time_on_ice"])
+    ps["date"] = pd.Timestamp("2023-10-01") + pd.to_timedelta(ps.pop("day"), unit="D")
+    ps["season"] = 2023
+    return ps
+
+
+@pytest.fixture(scope="module")
+def ps():
+    return simulated_player_stats()
+
+
+def test_design_blocks(ps):
+    one = ps[ps["game_id"] == ps["game_id"].iloc[0]]
+    tg = lm.team_games(one)
+    assert tg["is_home"].tolist() == [True, False]
+    player_ids = np.unique(one["player_id"])
+    L = lm.lineup_matrix(one, tg, player_ids)
+    # Skaters at 20 minutes are a third of a game, the goalie a whole one
+    row = L[0].toarray().ravel()
+    home_players = one.loc[one["team_id"] == tg["team_id"].iloc[0]].set_index("player_id")
+    expected = np.where(np.isin(player_ids, home_players.index), 1 / 3, 0.0)
+    expected[player_ids == tg["team_id"].iloc[0] * 10 + 9] = 1.0
+    np.testing.assert_allclose(row, expected)
+
+    opp = lm.opponent_rows(tg)
+    assert opp.tolist() == [1, 0]
+    X = lm.design(L, opp, tg["is_home"])
+    p = len(player_ids)
+    assert X.shape == (2, 2 + 2 * p)
+    np.testing.assert_allclose(X[0, 2 + p:].toarray().ravel(), -L[1].toarray().ravel())
+
+    # Goals from skater rows only
+    team_ids = tg["team_id"].tolist()
+    goals = one[one["position"] != "G"].groupby("team_id")["goals"].sum()
+    assert lm.team_goals(one, tg).tolist() == [goals[t] for t in team_ids]
+
+
+def test_fit_finds_the_star(ps):
+    params = lm.fit(ps, xi=0.0, ridge=5.0)
+    assert params["games"] == ps["game_id"].nunique()
+    offense = dict(zip(params["player_ids"], params["offense"]))
+    assert offense[STAR] == pytest.approx(0.6, abs=0.25)
+    others = [v for pid, v in offense.items() if pid != STAR]
+    assert offense[STAR] > max(others) + 0.3
+    assert params["home"] == pytest.approx(0.1, abs=0.06)
+
+
+def test_fit_is_the_penalized_optimum_and_warm_starts(ps):
+    ridge = 5.0
+    params = lm.fit(ps, xi=0.0, ridge=ridge)
+    tg = lm.team_games(ps)
+    L = lm.lineup_matrix(ps, tg, params["player_ids"])
+    X = lm.design(L, lm.opponent_rows(tg), tg["is_home"])
+    y = lm.team_goals(ps, tg)
+    beta = np.concatenate([[params["base"], params["home"]], params["offense"], params["defense"]])
+    penalty = np.r_[0.0, 0.0, np.full(len(beta) - 2, ridge)]
+
+    def grad(b):
+        return X.T @ (y - np.exp(X @ b)) - penalty * b
+
+    # L-BFGS stops on relative progress, so compare with the starting point
+    start = np.r_[np.log(y.mean()), np.zeros(len(beta) - 1)]
+    assert np.abs(grad(beta)).max() < 1e-3 * np.abs(grad(start)).max()
+
+    warm = lm.fit(ps, xi=0.0, ridge=ridge, warm=params)
+    assert warm["iterations"] < params["iterations"]
+    np.testing.assert_allclose(warm["offense"], params["offense"], atol=1e-3)
+
+
+def test_lineup_vector_and_predict_game(ps):
+    params = lm.fit(ps, xi=0.0, ridge=5.0)
+    ids = params["player_ids"]
+
+    v = lm.lineup_vector(params, {11: 30.0, STAR: 20.0, 12345: 60.0})
+    row = v.toarray().ravel()
+    assert row[np.searchsorted(ids, 11)] == pytest.approx(0.5)
+    assert row[np.searchsorted(ids, STAR)] == pytest.approx(1 / 3)
+    # The unseen player is left out
+    assert row.sum() == pytest.approx(0.5 + 1 / 3)
+
+    # Scoring a game's lineups matches the training rows
+    game = ps[ps["game_id"] == ps["game_id"].iloc[-1]]
+    tg = lm.team_games(game)
+    L = lm.lineup_matrix(game, tg, ids)
+    mu = lm.expected_goals(params, L, L[lm.opponent_rows(tg)], tg["is_home"])
+    lineups = {
+        team: dict(zip(g["player_id"], lm.toi_to_minutes(g["time_on_ice"])))
+        for team, g in game.groupby("team_id")
+    }
+    home_mu, away_mu = lm.predict_game(params, lineups[tg["team_id"].iloc[0]], lineups[tg["team_id"].iloc[1]])
+    assert [home_mu, away_mu] == pytest.approx(mu.tolist(), rel=1e-6)
+
+
+def test_recent_lineups(ps):
+    lineups = lm.recent_lineups(ps, n_games=3)
+    assert set(lineups) == set(range(N_TEAMS))
+    team0 = ps[ps["team_id"] == 0]
+    last = team0[team0["game_id"] == team0["game_id"].max()]
+    assert set(lineups[0]) == set(last["player_id"])
+    assert lineups[0][9] == pytest.approx(60.0)
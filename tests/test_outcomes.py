@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import poisson
+
+from outcomes import score_matrix, simulate_slate
+from strength_model import _tau
+
+
+def test_rho_matches_dixon_coles_tau():
+    home_mu, away_mu, rho = np.array([3.1, 2.4]), np.array([2.7, 3.3]), -0.08
+    grid = score_matrix(home_mu, away_mu, rho=rho)
+
+    k = np.arange(grid.shape[1])
+    h, a = np.meshgrid(k, k, indexing="ij")
+    for i in range(len(home_mu)):
+        ref = poisson.pmf(h, home_mu[i]) * poisson.pmf(a, away_mu[i])
+        ref = ref * _tau(h, a, np.full(h.shape, home_mu[i]), np.full(h.shape, away_mu[i]), rho)
+        np.testing.assert_allclose(grid[i], ref / ref.sum(), rtol=1e-9, atol=1e-15)
+
+
+def test_rho_changes_outcomes_and_zero_is_a_no_op():
+    games = pd.DataFrame({"home_mu": [3.0], "away_mu": [2.8]})
+    base = simulate_slate(games)
+    np.testing.assert_allclose(simulate_slate(games, rho=0.0)["p_ot"], base["p_ot"])
+    # Negative rho moves mass onto 0-0 and 1-1, so more regulation ties
+    assert simulate_slate(games, rho=-0.1)["p_ot"][0] > base["p_ot"][0]
+    assert simulate_slate(games, rho=0.1)["p_ot"][0] < base["p_ot"][0]
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import play_by_play as pbp
+
+# Feed team ids -> local ids
+FEED_HOME, FEED_AWAY = 6, 10
+HOME, AWAY = 1, 2
+
+
+def play(kind, period, clock, situation, owner, x=None, y=None, period_type="REG", **details):
+    return {
+        "typeDescKey": kind,
+        "periodDescriptor": {"number": period, "periodType": period_type},
+        "timeInPeriod": clock,
+        "situationCode": situation,
+        "details": {"eventOwnerTeamId": owner, "xCoord": x, "yCoord": y, **details},
+    }
+
+
+def payload():
+    return {
+        "homeTeam": {"id": FEED_HOME},
+        "awayTeam": {"id": FEED_AWAY},
+        "plays": [
+            play("faceoff", 1, "00:00", "1551", FEED_HOME, 0, 0, winningPlayerId=100),
+            play("shot-on-goal", 1, "01:30", "1551", FEED_HOME, 80, 5,
+                 shootingPlayerId=101, goalieInNetId=200, shotType="wrist"),
+            # Owned by the blocking (away) team, located where it was blocked
+            play("blocked-shot", 1, "02:00", "1551", FEED_AWAY, -60, 10,
+                 shootingPlayerId=102, blockingPlayerId=300),
+            # Away short-handed: away goalie, 4 away skaters, 5 home skaters, home goalie
+            play("goal", 2, "05:10", "1451", FEED_AWAY, -85, -3, scoringPlayerId=103),
+            play("missed-shot", 2, "10:00", "1451", FEED_HOME, 50, 0, shootingPlayerId=101),
+            # Away goalie pulled for a sixth skater
+            play("shot-on-goal", 3, "19:00", "0651", FEED_HOME, -20, 0, shootingPlayerId=104),
+            play("goal", 5, "00:00", "1010", FEED_AWAY, 70, 0, period_type="SO", scoringPlayerId=105),
+            play("stoppage", 3, "19:30", "", None),
+        ],
+    }
+
+
+@pytest.fixture
+def events():
+    return pbp.parse_game(payload(), 7, HOME, AWAY)
+
+
+def test_parse_game_types_and_columns(events):
+    assert list(events.columns) == pbp.EVENT_COLUMNS
+    assert {c: str(t) for c, t in events.dtypes.items()} == pbp.EVENT_DTYPES
+    assert len(events) == 8
+    assert (events["game_id"] == 7).all()
+    assert events["type_code"].tolist() == [1, 5, 7, 8, 6, 5, 8, 11]
+
+
+def test_parse_game_maps_teams_players_and_clock(events):
+    assert events["team_id"].tolist()[:6] == [HOME, HOME, AWAY, AWAY, HOME, HOME]
+    assert pd.isna(events.loc[7, "team_id"])
+    # Scorer / shooter / faceoff winner, never the blocker
+    assert events["player_id"].tolist()[:4] == [100, 101, 102, 103]
+    assert events.loc[1, "goalie_id"] == 200
+    assert events.loc[1, "shot_type"] == pbp.SHOT_TYPES["wrist"]
+    assert events.loc[3, ["period_seconds", "game_seconds"]].tolist() == [310, 1510]
+    assert events.loc[6, "period_type"] == pbp.PERIOD_TYPES["SO"]
+
+
+def test_parse_game_decodes_situation_code(events):
+    cols = ["home_skaters", "away_skaters", "home_goalie", "away_goalie"]
+    assert events.loc[3, cols].tolist() == [5, 4, True, True]
+    assert events.loc[5, cols].tolist() == [5, 6, True, False]
+    # Missing code: even strength with both goalies
+    assert events.loc[7, cols].tolist() == [5, 5, True, True]
+
+
+def test_aggregate_team_game(events):
+    games = pd.DataFrame({"game_id": [7], "season": [2024], "home_team_id": [HOME], "away_team_id": [AWAY]})
+    out = pbp.aggregate(events, games)
+    assert list(out.columns) == pbp.TEAM_GAME_COLUMNS
+    out = out.set_index("team_id")
+
+    home, away = out.loc[HOME], out.loc[AWAY]
+    # The blocked attempt is the home team's; the shootout goal is left out
+    assert home[["attempts_for", "unblocked_for", "shots_for", "goals_for"]].tolist() == [4, 3, 2, 0]
+    assert away[["attempts_for", "unblocked_for", "shots_for", "goals_for"]].tolist() == [1, 1, 1, 1]
+    assert home[["attempts_against", "goals_against"]].tolist() == [1, 1]
+    assert away[["attempts_against", "unblocked_against"]].tolist() == [4, 3]
+
+    assert home[["attempts_5v5_for", "attempts_pp_for", "attempts_sh_for"]].tolist() == [2, 1, 1]
+    assert away[["attempts_5v5_for", "attempts_pp_for", "attempts_sh_for"]].tolist() == [0, 0, 1]
+
+    # Distances to the nearer net, blocked attempts excluded
+    dist = [np.hypot(9, 5), 39.0, 69.0]
+    assert home["high_danger_for"] == 1
+    assert home["mean_distance_for"] == pytest.approx(np.mean(dist), rel=1e-6)
+    assert away["mean_distance_for"] == pytest.approx(5.0)
+    assert away["mean_distance_against"] == home["mean_distance_for"]
+
+
+def test_aggregate_game_without_attempts():
+    empty = pbp.parse_game({"homeTeam": {"id": 1}, "awayTeam": {"id": 2}, "plays": []}, 8, HOME, AWAY)
+    games = pd.DataFrame({"game_id": [8], "season": [2024], "home_team_id": [HOME], "away_team_id": [AWAY]})
+    out = pbp.aggregate(empty, games)
+    assert len(out) == 2
+    assert (out["attempts_for"] == 0).all() and out["mean_distance_for"].isna().all()
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import schedule_context as sc
+
+BOS, TOR, MTL = 1, 2, 3
+
+
+def schedule():
+    # (game_id, season, start UTC, home, away, venue)
+    games = [
+        (1, 2024, "2024-10-10 23:00", BOS, TOR, "TD Garden"),
+        # 10pm Eastern on the 11th, i.e. the next evening for BOS
+        (2, 2024, "2024-10-12 02:00", TOR, BOS, "Scotiabank Arena"),
+        (3, 2024, "2024-10-13 23:00", BOS, MTL, "Somewhere New"),
+        (4, 2024, "2024-10-14 23:00", BOS, TOR, "TD Garden"),
+        (5, 2025, "2025-10-08 23:00", BOS, TOR, "TD Garden"),
+    ]
+    df = pd.DataFrame(games, columns=["game_id", "season", "date", "home_team_id", "away_team_id", "venue"])
+    df["date"] = pd.to_datetime(df["date"])
+    coords = df["venue"].map(sc.VENUES)
+    df["latitude"] = coords.map(lambda c: c[0], na_action="ignore")
+    df["longitude"] = coords.map(lambda c: c[1], na_action="ignore")
+    return df.drop(columns="venue")
+
+
+@pytest.fixture
+def ctx():
+    out = sc.build_context(schedule())
+    assert list(out.columns) == sc.CONTEXT_COLUMNS
+    return out.set_index(["team_id", "game_id"])
+
+
+def km(a, b):
+    return float(sc.haversine_km(*sc.VENUES[a], *sc.VENUES[b]))
+
+
+def test_late_utc_start_counts_as_the_previous_evening(ctx):
+    row = ctx.loc[(BOS, 2)]
+    assert row["days_since_last"] == 1
+    assert row["rest_days"] == 0
+    assert row["back_to_back"]
+
+
+def test_rest_and_trailing_windows(ctx):
+    assert ctx.loc[(BOS, 3), "days_since_last"] == 2
+    assert ctx.loc[(BOS, 3), "rest_days"] == 1
+    assert not ctx.loc[(BOS, 3), "back_to_back"]
+    # BOS plays evenings 10, 11, 13, 14
+    assert ctx.loc[(BOS, 3), ["games_last_4d", "games_last_7d"]].tolist() == [3, 3]
+    assert ctx.loc[(BOS, 4), ["games_last_4d", "games_last_7d"]].tolist() == [3, 4]
+    # TOR plays evenings 10, 11, 14
+    assert ctx.loc[(TOR, 4), ["games_last_4d", "games_last_7d"]].tolist() == [2, 3]
+
+
+def test_streaks_reset_on_switch_and_season(ctx):
+    streaks = ctx.loc[BOS, ["home_streak", "road_streak"]]
+    # The 2025 opener at home does not extend the 2024 home run
+    assert streaks.loc[[1, 2, 3, 4, 5]].values.tolist() == [[1, 0], [0, 1], [1, 0], [2, 0], [1, 0]]
+
+
+def test_season_opener_has_no_previous_game(ctx):
+    row = ctx.loc[(BOS, 5)]
+    assert pd.isna(row["days_since_last"]) and pd.isna(row["rest_days"])
+    assert not row["back_to_back"]
+    assert row["games_last_7d"] == 1
+    # Travel starts from the home arena, not the last 2024 venue
+    assert row["travel_km"] == pytest.approx(0.0, abs=1e-3)
+    assert ctx.loc[(TOR, 5), "travel_km"] == pytest.approx(km("Scotiabank Arena", "TD Garden"), rel=1e-5)
+
+
+def test_unknown_venue_is_the_home_arena(ctx):
+    # Game 3 is in an unlisted building: BOS travels home from Toronto
+    assert ctx.loc[(BOS, 3), "travel_km"] == pytest.approx(km("Scotiabank Arena", "TD Garden"), rel=1e-5)
+    assert ctx.loc[(BOS, 4), "travel_km"] == pytest.approx(0.0, abs=1e-3)
+    # MTL never hosts, so its opener has no starting point
+    assert np.isnan(ctx.loc[(MTL, 3), "travel_km"])
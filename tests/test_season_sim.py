@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+import season_sim
+import synth_data
+
+
+def synthetic_season(n_teams=32, seed=3):
+    rng = np.random.default_rng(seed)
+    league = synth_data.League(n_teams, 20, rng)
+    teams = synth_data.make_teams(n_teams, rng).rename(columns={"id": "team_id"})
+    games = synth_data.season_games(league, 2024, 82, 1)
+    return teams[["team_id", "abbreviation"]], games
+
+
+def test_assign_divisions_all_unknown():
+    teams = pd.DataFrame({"team_id": range(1, 33), "abbreviation": [f"Q{i:02d}" for i in range(32)]})
+    out = season_sim.assign_divisions(teams)
+    assert out["division"].value_counts().tolist() == [8, 8, 8, 8]
+    assert out["conference"].value_counts().tolist() == [16, 16]
+    # Each division sits in exactly one conference
+    assert (out.groupby("division")["conference"].nunique() == 1).all()
+
+
+def test_assign_divisions_mixed_known_and_unknown():
+    teams = pd.DataFrame({"team_id": [1, 2, 3, 4], "abbreviation": ["BOS", "XXA", "EDM", "XXB"]})
+    out = season_sim.assign_divisions(teams).set_index("abbreviation")
+    assert tuple(out.loc["BOS", ["conference", "division"]]) == ("Eastern", "Atlantic")
+    assert tuple(out.loc["EDM", ["conference", "division"]]) == ("Western", "Pacific")
+    assert tuple(out.loc["XXA", ["conference", "division"]]) == ("Conference 1", "Division 1")
+    assert tuple(out.loc["XXB", ["conference", "division"]]) == ("Conference 2", "Division 2")
+
+
+def test_simulate_synthetic_season():
+    teams, games = synthetic_season()
+    teams = season_sim.assign_divisions(teams)
+    # Second half of the season still to play
+    cutoff = games["game_date"].sort_values().iloc[len(games) // 2]
+    games.loc[games["game_date"] >= cutoff, "status"] = "scheduled"
+    remaining = games["status"] != "final"
+    mu = np.full(remaining.sum(), 3.0)
+
+    table = season_sim.simulate_season(teams, games, mu, mu, n_sims=500, workers=1, seed=0)
+    assert len(table) == 32
+    # 4 divisions x 3 spots + 2 conferences x 2 wild cards = 16 playoff teams
+    assert np.isclose(table["playoff_prob"].sum(), 16)
+    assert np.isclose(table["division_prob"].sum(), 4)
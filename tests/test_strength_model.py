@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import strength_model as sm
+
+
+def simulated_games(n_teams=8, n_days=300, per_day=4, home=0.15, seed=1):
+    rng = np.random.default_rng(seed)
+    attack = rng.normal(0, 0.2, n_teams)
+    defense = rng.normal(0, 0.2, n_teams)
+    n = n_days * per_day
+    h = rng.integers(0, n_teams, n)
+    a = (h + rng.integers(1, n_teams, n)) % n_teams
+    base = np.log(2.9)
+    games = pd.DataFrame({
+        "game_id": np.arange(n),
+        "date": pd.Timestamp("2023-10-01") + pd.to_timedelta(np.repeat(np.arange(n_days), per_day), unit="D"),
+        "home_team_id": h + 100,
+        "away_team_id": a + 100,
+        "home_score": rng.poisson(np.exp(base + home + attack[h] - defense[a])),
+        "away_score": rng.poisson(np.exp(base + attack[a] - defense[h])),
+    })
+    return games, attack, defense
+
+
+def test_fit_recovers_strengths():
+    games, attack, defense = simulated_games()
+    params = sm.fit(games, xi=0.0, ridge=1e-3)
+
+    assert params["team_ids"] == list(range(100, 108))
+    assert params["games"] == len(games)
+    assert params["home"] == pytest.approx(0.15, abs=0.05)
+    # Only differences between teams are identified
+    fitted_att = np.array(params["attack"]) - np.mean(params["attack"])
+    fitted_def = np.array(params["defense"]) - np.mean(params["defense"])
+    assert np.corrcoef(fitted_att, attack)[0, 1] > 0.9
+    assert np.corrcoef(fitted_def, defense)[0, 1] > 0.9
+    # Independent scores: no low-score dependence to find
+    assert abs(params["rho"]) < 0.1
+
+
+def test_fit_is_the_penalized_optimum_and_warm_starts():
+    games, _, _ = simulated_games(n_days=60)
+    as_of = games["date"].max() + pd.Timedelta(days=1)
+    cold = sm.fit(games, as_of=as_of)
+
+    teams = np.array(cold["team_ids"])
+    X, y = sm._arrays(games, teams)
+    w = np.repeat(sm.decay_weights(games["date"], as_of), 2)
+    beta = np.concatenate([[cold["base"], cold["home"]], cold["attack"], cold["defense"]])
+    penalty = np.r_[0.0, 0.0, np.full(2 * len(teams), sm.RIDGE)]
+    grad = X.T @ (w * (y - np.exp(X @ beta))) - penalty * beta
+    assert np.abs(grad).max() < 1e-6
+
+    warm = sm.fit(games, as_of=as_of, warm=cold)
+    assert warm["iterations"] <= 2
+    np.testing.assert_allclose(warm["attack"], cold["attack"], atol=1e-6)
+
+
+def test_fit_ignores_games_on_or_after_as_of():
+    games, _, _ = simulated_games(n_days=60)
+    cut = pd.Timestamp("2023-11-01")
+    params = sm.fit(games, as_of=cut)
+    assert params["games"] == int((games["date"] < cut).sum())
+    # Changing later scores does not move the fit
+    later = games.assign(home_score=np.where(games["date"] >= cut, 20, games["home_score"]))
+    assert sm.fit(later, as_of=cut)["attack"] == pytest.approx(params["attack"])
+
+
+def test_predict_unknown_team_is_average():
+    params = {"team_ids": [1, 2], "base": 1.0, "home": 0.1, "attack": [0.2, -0.2], "defense": [0.1, -0.1]}
+    home_mu, away_mu = sm.predict(params, [1, 99], [99, 2])
+    np.testing.assert_allclose(home_mu, np.exp([1.0 + 0.1 + 0.2, 1.0 + 0.1 + 0.1]))
+    np.testing.assert_allclose(away_mu, np.exp([1.0 - 0.1, 1.0 - 0.2]))
+
+
+def test_walk_forward_matches_cold_fits_per_day():
+    games, _, _ = simulated_games(n_days=40)
+    start = "2023-11-05"
+    scored = sm.walk_forward(games, start)
+
+    test_games = games[games["date"] >= pd.Timestamp(start)]
+    assert scored["game_id"].tolist() == test_games["game_id"].tolist()
+    assert scored[["home_score", "away_score"]].to_numpy().tolist() == \
+        test_games[["home_score", "away_score"]].to_numpy().tolist()
+
+    # Each day is scored by a fit on the games before it only
+    for day in (pd.Timestamp(start), pd.Timestamp("2023-11-09")):
+        params = sm.fit(games, as_of=day)
+        today = games[games["date"] == day]
+        home_mu, away_mu = sm.predict(params, today["home_team_id"], today["away_team_id"])
+        got = scored[scored["date"] == day]
+        np.testing.assert_allclose(got["home_mu"], home_mu, rtol=1e-5)
+        np.testing.assert_allclose(got["away_mu"], away_mu, rtol=1e-5)
+        assert got["rho"].iloc[0] == pytest.approx(params["rho"], abs=1e-4)
+
+    summary = sm.summarize(scored)
+    assert summary["games"] == len(scored)
+    assert 0 < summary["win_log_loss"] < 1